@@ -1,10 +1,124 @@
 import streamlit as st
-from invoice_generator import InvoiceGenerator
-from batch_processor import BatchInvoiceProcessor
+from invoice_generator import InvoiceGenerator, ENGINES
+from batch_processor import BatchInvoiceProcessor, invalid_clients, rendered_rows, summarize_batch
+from templates import template_names
+from render_cache import RenderCache
+from metrics import METRICS
+from jobs import JobManager
+from input_readers import detect_format, input_formats, read_input, validate_rows
+from output_sinks import open_output
+from invoice_archive import DEFAULT_ARCHIVE_DIR, InvoiceArchive
+from html_preview import preview_html
+from sequencer import DEFAULT_SEQUENCE_DB, InvoiceSequencer, format_number, invoice_series
+from tax_rules import NO_RATE, STANDARD_CATEGORY, TaxRules, format_cents, invoice_totals, parse_cents
+from canvas_renderer import line_amount
 from datetime import datetime, timedelta
+from io import BytesIO
+import atexit
 import base64
+import hashlib
+import os
+import tempfile
+import uuid
+import time
 import pandas as pd
 
+
+# Memory budget for rendered PDFs; set INVOICE_RENDER_CACHE_DIR to also keep them on disk
+RENDER_CACHE_BYTES = 128 * 1024 * 1024
+
+# Batches run at once across all sessions, and how often a running batch's progress refreshes
+BATCH_JOB_WORKERS = 2
+JOB_POLL_SECONDS = 0.5
+
+# Batch outputs are written here as they render, and read back only when downloaded
+BATCH_OUTPUT_DIR = os.environ.get('INVOICE_OUTPUT_DIR') or tempfile.gettempdir()
+
+# Invoice numbers for every session and batch come from this SQLite file
+SEQUENCE_DB = os.environ.get('INVOICE_SEQUENCE_DB') or DEFAULT_SEQUENCE_DB
+
+# Every generated PDF is kept and indexed here, for search and re-download
+ARCHIVE_DIR = os.environ.get('INVOICE_ARCHIVE_DIR') or DEFAULT_ARCHIVE_DIR
+
+# Rows shown per archive search
+ARCHIVE_SEARCH_LIMIT = 100
+
+
+@st.cache_resource
+def get_render_cache():
+    """Process-wide cache of rendered PDFs shared by every session"""
+    return RenderCache(max_bytes=RENDER_CACHE_BYTES, disk_dir=os.environ.get('INVOICE_RENDER_CACHE_DIR'))
+
+
+@st.cache_resource
+def get_job_manager():
+    """Background batch jobs shared by every session; they outlive reruns"""
+    return JobManager(max_workers=BATCH_JOB_WORKERS)
+
+
+@st.cache_resource
+def get_sequencer():
+    """Invoice number sequencer shared by every session; its unused numbers go back on exit"""
+    sequencer = InvoiceSequencer(SEQUENCE_DB)
+    atexit.register(sequencer.close)
+    return sequencer
+
+
+@st.cache_resource
+def get_archive():
+    """Invoice archive shared by every session"""
+    archive = InvoiceArchive(ARCHIVE_DIR)
+    atexit.register(archive.flush)
+    return archive
+
+
+@st.cache_resource(max_entries=4)
+def load_tax_rules(content_hash, _file_bytes):
+    """Compile an uploaded tax and FX rules file once per distinct content"""
+    return TaxRules.from_json(BytesIO(_file_bytes))
+
+
+@st.cache_resource(max_entries=4, show_spinner="Reading batch file...")
+def load_batch_csv(content_hash, input_format, _file_bytes, rules_hash=None, _tax_rules=None):
+    """Parse, validate and summarize an uploaded batch file once per distinct content and rules"""
+    df = read_input(BytesIO(_file_bytes), input_format)
+    is_valid, message = BatchInvoiceProcessor.validate_csv(df)
+    if not is_valid:
+        # Missing columns or text where numbers go would break the summary
+        return df, None, is_valid, message, []
+    df, row_errors = validate_rows(df, _tax_rules)
+    return df, summarize_batch(rendered_rows(df, row_errors)), is_valid, message, row_errors
+
+
+def build_single_invoice(invoice_data, invoice_date, generator_options, logo_bytes, sequencer, archive,
+                         pdf_key, last_pdf):
+    """Number, render and archive the single invoice when its download is clicked
+    
+    last_pdf is the session's record of the latest PDF; clicking again for
+    the same invoice (same pdf_key) returns it without taking a new number.
+    """
+    if last_pdf.get('key') == pdf_key:
+        return last_pdf['pdf']
+    invoice_data = dict(invoice_data)
+    if not invoice_data['invoice_number']:
+        invoice_data['invoice_number'] = sequencer.next_invoice_number(invoice_date)
+    
+    # Logo bytes go straight to the generator's logo cache
+    pdf_bytes = InvoiceGenerator(**generator_options).generate_invoice(invoice_data, logo_bytes).getvalue()
+    archive.add(invoice_data, pdf_bytes)
+    archive.flush()
+    last_pdf.update(key=pdf_key, invoice_number=invoice_data['invoice_number'], pdf=pdf_bytes)
+    return pdf_bytes
+
+
+def upload_content_hash(uploaded_file):
+    """SHA-256 of an upload, computed once per upload rather than on every rerun"""
+    hashes = st.session_state.setdefault('upload_hashes', {})
+    if uploaded_file.file_id not in hashes:
+        hashes[uploaded_file.file_id] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    return hashes[uploaded_file.file_id]
+
+
 st.set_page_config(page_title="Invoice Generator Pro", page_icon="📄", layout="wide")
 
 # Custom CSS
@@ -44,7 +158,9 @@ st.markdown("""
 st.markdown('<div class="invoice-header"><h1>📄 Professional Invoice Generator Pro</h1><p>Create beautiful invoices in seconds | Single & Batch Processing</p></div>', unsafe_allow_html=True)
 
 # Create tabs for Single vs Batch
-tab1, tab2, tab3 = st.tabs(["🎯 Single Invoice", "📦 Batch Processing (CSV)", "📚 Help & Templates"])
+tab1, tab2, tab3, tab4 = st.tabs(
+    ["🎯 Single Invoice", "📦 Batch Processing (CSV)", "🗄️ Invoice Archive", "📚 Help & Templates"]
+)
 
 # Sidebar for common settings
 with st.sidebar:
@@ -52,10 +168,23 @@ with st.sidebar:
     
     style_option = st.selectbox(
         "Choose Template",
-        ["modern_minimal", "corporate_blue", "creative_gradient"],
+        template_names(),
         format_func=lambda x: x.replace('_', ' ').title()
     )
     
+    engine_option = st.selectbox(
+        "Rendering Engine",
+        ENGINES,
+        index=ENGINES.index("canvas"),
+        format_func=lambda x: {"platypus": "Standard (platypus)", "canvas": "Fast (canvas)"}[x],
+        help="Fast draws the same page directly and switches to Standard for invoices longer than one page."
+    )
+    
+    compact_output = st.checkbox(
+        "Compact Output",
+        help="Smaller PDFs with binary streams. ZIP downloads store PDFs that would not shrink instead of recompressing them, which is much faster with a large logo."
+    )
+    
     st.header("🏢 Your Company")
     company_logo = st.file_uploader("Upload Logo (Optional)", type=['png', 'jpg', 'jpeg'])
     company_name = st.text_input("Company Name*", value="Your Company LLC")
@@ -66,6 +195,20 @@ with st.sidebar:
     # Default notes for batch processing
     default_notes = st.text_area("Default Notes (for batch)", 
                                  value="Thank you for your business!\nPayment accepted via bank transfer or PayPal.")
+    
+    st.header("🧾 Tax & Currency")
+    tax_rules_file = st.file_uploader(
+        "Tax & FX Rules (Optional)", type=['json'],
+        help='{"reporting_currency": "USD", "tax": {"DE": {"standard": 19, "reduced": 7}}, "fx": {"EUR": 1.08}}'
+    )
+    tax_rules, tax_rules_hash = None, None
+    if tax_rules_file is not None:
+        try:
+            tax_rules_hash = upload_content_hash(tax_rules_file)
+            tax_rules = load_tax_rules(tax_rules_hash, tax_rules_file.getvalue())
+        except (ValueError, KeyError, AttributeError) as e:
+            st.error(f"Invalid rules file: {e}")
+            tax_rules_hash = None
 
 # Tab 1: Single Invoice (Previous Implementation)
 with tab1:
@@ -75,7 +218,13 @@ with tab1:
     
     with col1:
         st.subheader("📋 Invoice Details")
-        invoice_number = st.text_input("Invoice Number*", value=f"INV-{datetime.now().strftime('%Y%m%d')}-001", key="single_inv_num")
+        # The suggestion is only a preview; the number is taken when the PDF is downloaded
+        series = invoice_series(st.session_state.get("single_inv_date", datetime.now()))
+        invoice_number = st.text_input(
+            "Invoice Number", placeholder=f"{format_number(series, get_sequencer().peek(series))} (next)",
+            help="Leave empty to take the next number in sequence when the PDF is downloaded.",
+            key="single_inv_num"
+        )
         invoice_date = st.date_input("Invoice Date", datetime.now(), key="single_inv_date")
         
         payment_terms = st.selectbox("Payment Terms", ["Due on Receipt", "Net 15", "Net 30", "Net 45", "Net 60"], key="single_payment")
@@ -100,9 +249,20 @@ with tab1:
     if 'line_items' not in st.session_state:
         st.session_state.line_items = [{"description": "", "quantity": 1.0, "rate": 0.00}]
 
-    # Display existing line items
+    # Display existing line items; with tax rules loaded, each item also gets a tax category
     for idx, item in enumerate(st.session_state.line_items):
-        col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
+        if tax_rules is not None:
+            col1, col2, col3, col4, col5 = st.columns([3, 1, 1, 1, 1])
+            with col5:
+                categories = tax_rules.categories()
+                category = item.get('tax_category')
+                item['tax_category'] = st.selectbox(
+                    "Tax Category", categories,
+                    index=categories.index(category if category in categories else STANDARD_CATEGORY),
+                    key=f"single_tax_category_{idx}"
+                )
+        else:
+            col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
         with col1:
             item['description'] = st.text_input(f"Description", value=item['description'], key=f"single_desc_{idx}")
         with col2:
@@ -110,7 +270,7 @@ with tab1:
         with col3:
             item['rate'] = st.number_input(f"Rate", value=item['rate'], min_value=0.0, step=0.01, key=f"single_rate_{idx}")
         with col4:
-            amount = item['quantity'] * item['rate']
+            amount = line_amount(item)
             st.text_input(f"Amount", value=f"{currency} {amount:.2f}", disabled=True, key=f"single_amount_{idx}")
 
     # Add/Remove line items
@@ -124,76 +284,93 @@ with tab1:
             st.session_state.line_items.pop()
             st.rerun()
 
-    # Calculate totals
-    subtotal = sum(item['quantity'] * item['rate'] for item in st.session_state.line_items)
-
     st.subheader("💰 Totals")
     col1, col2, col3 = st.columns(3)
     with col1:
-        tax_rate = st.number_input("Tax Rate (%)", min_value=0.0, max_value=100.0, value=0.0, step=0.1, key="single_tax_rate")
+        jurisdiction = None
+        if tax_rules is not None:
+            jurisdiction = st.selectbox(
+                "Tax Jurisdiction", [None] + tax_rules.jurisdictions(),
+                format_func=lambda x: "None (use tax rate)" if x is None else x, key="single_jurisdiction"
+            )
+        tax_rate = st.number_input("Tax Rate (%)", min_value=0.0, max_value=100.0, value=0.0, step=0.1,
+                                   disabled=jurisdiction is not None, key="single_tax_rate")
+    
+    # Totals in exact cents; a jurisdiction's rules set each item's rate
+    items = st.session_state.line_items
+    if jurisdiction is not None:
+        item_rates = tax_rules.item_rates(jurisdiction, [item.get('tax_category') for item in items], tax_rate)
+    else:
+        item_rates = [tax_rate] * len(items)
+    totals = invoice_totals(items, item_rates)
     with col2:
-        tax_amount = subtotal * (tax_rate / 100)
-        st.text_input("Tax Amount", value=f"{currency} {tax_amount:.2f}", disabled=True, key="single_tax_amount")
+        st.text_input("Tax Amount", value=f"{currency} {totals['tax_amount']}", disabled=True, key="single_tax_amount")
     with col3:
-        total = subtotal + tax_amount
-        st.text_input("Total Amount", value=f"{currency} {total:.2f}", disabled=True, key="single_total")
+        st.text_input("Total Amount", value=f"{currency} {totals['total']}", disabled=True, key="single_total")
+        if tax_rules is not None and tax_rules.reporting_currency and currency != tax_rules.reporting_currency:
+            reporting = tax_rules.to_reporting([parse_cents(totals['total'])], [currency])[0]
+            st.caption(f"≈ {tax_rules.reporting_currency} {format_cents(reporting)}" if reporting != NO_RATE
+                       else f"No FX rate from {currency} to {tax_rules.reporting_currency}")
 
     # Notes section
     notes = st.text_area("Notes / Payment Instructions", 
                         value="Thank you for your business!\n\nPayment methods accepted: Bank transfer, Credit card, PayPal",
                         key="single_notes")
 
-    # Generate Invoice Button
-    if st.button("🚀 Generate Invoice", type="primary", use_container_width=True, key="single_generate"):
-        if not company_name or not client_name:
-            st.error("Please fill in all required fields marked with *")
-        else:
-            # Prepare invoice data
-            invoice_data = {
-                'company_name': company_name,
-                'company_address': company_address,
-                'company_email': company_email,
-                'company_phone': company_phone,
-                'client_name': client_name,
-                'client_address': client_address,
-                'client_email': client_email,
-                'invoice_number': invoice_number,
-                'invoice_date': invoice_date.strftime('%B %d, %Y'),
-                'due_date': due_date.strftime('%B %d, %Y'),
-                'currency': currency,
-                'items': st.session_state.line_items,
-                'subtotal': f"{subtotal:.2f}",
-                'tax_rate': tax_rate,
-                'tax_amount': f"{tax_amount:.2f}",
-                'total': f"{total:.2f}",
-                'notes': notes
-            }
-            
-            # Generate PDF
-            generator = InvoiceGenerator(style_template=style_option)
-            
-            # Handle logo if uploaded
-            logo_path = None
-            if company_logo:
-                with open("temp_logo.png", "wb") as f:
-                    f.write(company_logo.getbuffer())
-                logo_path = "temp_logo.png"
-            
-            pdf_buffer = generator.generate_invoice(invoice_data, logo_path)
-            
-            # Create download button
-            pdf_bytes = pdf_buffer.getvalue()
-            
-            st.success("✅ Invoice generated successfully!")
-            
-            st.download_button(
-                label="📥 Download PDF",
-                data=pdf_bytes,
-                file_name=f"{invoice_number}.pdf",
-                mime="application/pdf",
-                use_container_width=True,
-                key="single_download"
-            )
+    # Same invoice data for the preview and the PDF; an empty number is taken when the PDF is built
+    invoice_data = {
+        'company_name': company_name,
+        'company_address': company_address,
+        'company_email': company_email,
+        'company_phone': company_phone,
+        'client_name': client_name,
+        'client_address': client_address,
+        'client_email': client_email,
+        'invoice_number': invoice_number,
+        'invoice_date': invoice_date.strftime('%B %d, %Y'),
+        'due_date': due_date.strftime('%B %d, %Y'),
+        'currency': currency,
+        'items': [dict(item) for item in st.session_state.line_items],
+        **totals,
+        'notes': notes
+    }
+    logo_bytes = company_logo.getvalue() if company_logo else None
+    
+    # Live preview: HTML from cached fragments, redrawn on every rerun without building the PDF
+    st.subheader("👁️ Preview")
+    preview_data = invoice_data
+    if not invoice_number:
+        preview_data = {**invoice_data, 'invoice_number': format_number(series, get_sequencer().peek(series))}
+    st.html(preview_html(preview_data, style_option, logo_bytes))
+    
+    # The PDF is built only when the download is clicked, and once per distinct invoice
+    pdf_key = hashlib.sha256(repr((
+        sorted(invoice_data.items()), style_option, engine_option, compact_output,
+        upload_content_hash(company_logo) if company_logo else None
+    )).encode()).hexdigest()
+    last_pdf = st.session_state.setdefault('single_pdf', {})
+    download_number = invoice_number
+    if last_pdf.get('key') == pdf_key:
+        download_number = last_pdf['invoice_number']
+        st.success(f"✅ Invoice {download_number} generated successfully!")
+    if not company_name or not client_name:
+        st.error("Please fill in all required fields marked with *")
+    generator_options = {
+        'style_template': style_option, 'render_cache': get_render_cache(), 'engine': engine_option,
+        'compact': compact_output,
+    }
+    st.download_button(
+        label="📥 Download PDF",
+        # Called off the script thread when clicked, so everything it needs is bound now
+        data=lambda args=(invoice_data, invoice_date, generator_options, logo_bytes, get_sequencer(),
+                          get_archive(), pdf_key, last_pdf): build_single_invoice(*args),
+        file_name=f"{download_number or f'invoice_{invoice_date:%Y%m%d}'}.pdf",
+        mime="application/pdf",
+        type="primary",
+        disabled=not company_name or not client_name,
+        use_container_width=True,
+        key="single_download"
+    )
 
 # Tab 2: Batch Processing
 with tab2:
@@ -210,7 +387,7 @@ with tab2:
     """, unsafe_allow_html=True)
     
     # CSV Upload
-    uploaded_csv = st.file_uploader("Upload CSV File", type=['csv'], key="batch_csv")
+    uploaded_csv = st.file_uploader(f"Upload a batch file ({', '.join(input_formats())})", type=input_formats(), key="batch_csv")
     
     # Download sample CSV
     with open('sample_invoice_batch.csv', 'r') as f:
@@ -228,20 +405,22 @@ with tab2:
         # Preview the CSV
         st.subheader("📊 CSV Preview")
         try:
-            df = pd.read_csv(uploaded_csv)
+            # Parsed once per upload; reruns reuse the cached frame and stats
+            df, summary, is_valid, validation_message, row_errors = load_batch_csv(
+                upload_content_hash(uploaded_csv), detect_format(uploaded_csv.name), uploaded_csv.getvalue(),
+                tax_rules_hash, tax_rules
+            )
             
-            # Show stats
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                unique_clients = df['client_name'].nunique() if 'client_name' in df.columns else 0
-                st.metric("Unique Clients", unique_clients)
-            with col2:
-                total_items = len(df)
-                st.metric("Total Line Items", total_items)
-            with col3:
-                if 'rate' in df.columns and 'quantity' in df.columns:
-                    total_value = (df['rate'] * df['quantity']).sum()
-                    st.metric("Total Value", f"${total_value:,.2f}")
+            # Show stats of the rows that will be rendered
+            if summary is not None:
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("Unique Clients", summary['unique_clients'])
+                with col2:
+                    st.metric("Total Line Items", summary['line_items'])
+                with col3:
+                    if summary['total_value'] is not None:
+                        st.metric("Total Value", f"${summary['total_value']:,.2f}")
             
             # Show preview
             st.dataframe(df.head(10))
@@ -250,60 +429,207 @@ with tab2:
             with st.expander("View Full Data"):
                 st.dataframe(df)
             
+            if not is_valid:
+                st.error(f"❌ {validation_message}")
+            
+            if row_errors:
+                skipped = len(invalid_clients(row_errors))
+                st.warning(f"⚠️ {len(row_errors)} rows have errors; invoices for those {skipped} clients will be skipped")
+                with st.expander("View Row Errors"):
+                    st.dataframe(pd.DataFrame(row_errors))
+            
+            # Parallel rendering
+            render_workers = st.number_input(
+                "Parallel Workers", min_value=1, max_value=os.cpu_count() or 1, value=1, step=1,
+                help="Number of processes used to render PDFs. More workers finish large batches faster.",
+                key="batch_workers"
+            )
+            
+            output_format = st.radio(
+                "Output Format",
+                ["zip", "pdf"],
+                format_func=lambda x: {"zip": "ZIP (one PDF per client)", "pdf": "Single PDF (one page range per client)"}[x],
+                horizontal=True,
+                help="The single PDF stores the logo and fonts once and bookmarks every invoice. It is rendered without parallel workers.",
+                key="batch_output_format"
+            )
+            
             # Process button
             if st.button("⚡ Generate All Invoices", type="primary", use_container_width=True, key="batch_generate"):
-                with st.spinner("Processing invoices... This may take a moment for large batches."):
-                    # Prepare company data
-                    company_data = {
-                        'company_name': company_name,
-                        'company_address': company_address,
-                        'company_email': company_email,
-                        'company_phone': company_phone,
-                        'default_notes': default_notes
-                    }
-                    
-                    # Handle logo
-                    logo_path = None
-                    if company_logo:
-                        with open("temp_logo_batch.png", "wb") as f:
-                            f.write(company_logo.getbuffer())
-                        logo_path = "temp_logo_batch.png"
-                    
-                    # Process batch
-                    processor = BatchInvoiceProcessor(style_template=style_option)
-                    
-                    # Reset file pointer
-                    uploaded_csv.seek(0)
-                    
-                    zip_buffer, message = processor.process_batch(
-                        uploaded_csv,
+                # Prepare company data
+                company_data = {
+                    'company_name': company_name,
+                    'company_address': company_address,
+                    'company_email': company_email,
+                    'company_phone': company_phone,
+                    'default_notes': default_notes
+                }
+                
+                # Handle logo
+                logo_bytes = company_logo.getvalue() if company_logo else None
+                
+                # Process batch in the background into a file; the panel below polls it
+                batch_stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                output_path = os.path.join(
+                    BATCH_OUTPUT_DIR, f"invoices_batch_{batch_stamp}_{uuid.uuid4().hex[:8]}.{output_format}"
+                )
+                processor = BatchInvoiceProcessor(
+                    style_template=style_option,
+                    workers=render_workers,
+                    render_cache=get_render_cache(),
+                    engine=engine_option,
+                    tax_rules=tax_rules,
+                    compact=compact_output,
+                    sequencer=get_sequencer(),
+                    archive=get_archive()
+                )
+                
+                st.session_state.batch_job = {
+                    'id': get_job_manager().submit(
+                        processor,
+                        df,
                         company_data,
-                        logo_path
-                    )
-                    
-                    if zip_buffer:
-                        st.success(f"✅ {message}")
-                        
-                        # Show summary
-                        st.markdown(processor.get_summary_report())
-                        
-                        # Download ZIP
-                        st.download_button(
-                            label="📥 Download All Invoices (ZIP)",
-                            data=zip_buffer.getvalue(),
-                            file_name=f"invoices_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
-                            mime="application/zip",
-                            key="download_batch_zip"
-                        )
-                    else:
-                        st.error(f"❌ {message}")
+                        logo_bytes,
+                        output_mode=output_format,
+                        output=output_path
+                    ),
+                    'output_format': output_format,
+                    'stamp': batch_stamp,
+                }
                         
         except Exception as e:
             st.error(f"Error reading CSV file: {str(e)}")
             st.info("Please ensure your CSV file matches the template format")
 
-# Tab 3: Help & Templates
+    # Background batch job: progress while it runs, downloads once it is done
+    batch_job = st.session_state.get('batch_job')
+    job = get_job_manager().get(batch_job['id']) if batch_job else None
+    if batch_job and job is None:
+        st.info("The last batch's output has expired; generate it again to download it.")
+        del st.session_state.batch_job
+    elif job is not None:
+        status = job.status()
+        st.subheader("⚙️ Batch Job")
+        
+        if not job.finished:
+            if status['total']:
+                st.progress(status['done'] / status['total'],
+                            text=f"{status['done']} of {status['total']} invoices")
+            else:
+                st.progress(0, text=f"{status['state'].title()}... {status['done']} invoices")
+            
+            if status['cancel_requested']:
+                st.warning("Cancelling...")
+            elif st.button("⏹️ Cancel", key="batch_cancel"):
+                get_job_manager().cancel(job.id)
+            
+            time.sleep(JOB_POLL_SECONDS)
+            st.rerun()
+        elif status['state'] == "completed":
+            processor = job.processor
+            st.success(f"✅ {status['message']}")
+            
+            # Show summary
+            st.markdown(processor.get_summary_report())
+            
+            # Process-wide stage metrics (INVOICE_METRICS=1)
+            if METRICS.enabled:
+                with st.expander("📈 Metrics Snapshot"):
+                    st.code(METRICS.to_prometheus(), language="text")
+                    st.download_button(
+                        label="Download Metrics (JSON)",
+                        data=METRICS.to_json(),
+                        file_name="invoice_metrics.json",
+                        mime="application/json",
+                        key="download_metrics"
+                    )
+            
+            batch_stamp = batch_job['stamp']
+            if batch_job['output_format'] == "pdf":
+                with st.expander("📑 Page Index"):
+                    st.dataframe(pd.DataFrame(processor.page_index))
+                
+                # Download merged PDF
+                st.download_button(
+                    label="📥 Download All Invoices (PDF)",
+                    # Read from disk only when clicked, not on every rerun
+                    data=lambda path=job.output: open_output(path),
+                    file_name=f"invoices_batch_{batch_stamp}.pdf",
+                    mime="application/pdf",
+                    key="download_batch_pdf"
+                )
+            else:
+                # Download ZIP
+                st.download_button(
+                    label="📥 Download All Invoices (ZIP)",
+                    data=lambda path=job.output: open_output(path),
+                    file_name=f"invoices_batch_{batch_stamp}.zip",
+                    mime="application/zip",
+                    key="download_batch_zip"
+                )
+        elif status['state'] == "cancelled":
+            st.warning(f"⏹️ {status['message']}")
+        else:
+            st.error(f"❌ {status['message']}")
+
+# Tab 3: Invoice Archive
 with tab3:
+    st.subheader("🔎 Find an Invoice")
+    st.caption("Every generated invoice is kept here; download it again without re-rendering.")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        search_number = st.text_input("Invoice Number", placeholder="INV-20240115-001", key="archive_number")
+    with col2:
+        search_client = st.text_input("Client Name Starts With", key="archive_client")
+    with col3:
+        search_currency = st.selectbox("Currency", ["Any", "USD", "EUR", "GBP", "CAD", "AUD"], key="archive_currency")
+    col1, col2 = st.columns(2)
+    with col1:
+        search_from = st.date_input("From", value=None, key="archive_from")
+    with col2:
+        search_to = st.date_input("To", value=None, key="archive_to")
+    
+    archive = get_archive()
+    filters = {
+        'invoice_number': search_number.strip(),
+        'client': search_client.strip(),
+        'currency': search_currency if search_currency != "Any" else None,
+        'date_from': search_from,
+        'date_to': search_to,
+    }
+    matches = archive.count(**filters)
+    results = archive.search(limit=ARCHIVE_SEARCH_LIMIT, **filters)
+    
+    if not results:
+        st.info("No archived invoices match.")
+    else:
+        shown = f"the latest {len(results)} of " if matches > len(results) else ""
+        st.caption(f"Showing {shown}{matches} matching invoices")
+        st.dataframe(
+            pd.DataFrame([{
+                'Invoice Number': row['invoice_number'],
+                'Client': row['client_name'],
+                'Date': row['invoice_date'],
+                'Total': f"{row['currency']} {format_cents(row['total_cents'])}",
+                'Archived': row['archived_at'],
+            } for row in results]),
+            hide_index=True, use_container_width=True
+        )
+        
+        labels = {f"{row['invoice_number']} - {row['client_name']}": row for row in results}
+        selected = labels[st.selectbox("Invoice to download", list(labels), key="archive_selected")]
+        st.download_button(
+            label=f"📥 Download {selected['invoice_number']}",
+            # Read from the archive only when clicked
+            data=lambda digest=selected['pdf_sha256']: archive.read_pdf(digest),
+            file_name=f"{selected['invoice_number']}.pdf",
+            mime="application/pdf",
+            key="archive_download"
+        )
+
+# Tab 4: Help & Templates
+with tab4:
     st.header("📚 Documentation & Help")
     
     col1, col2 = st.columns(2)
@@ -322,6 +648,8 @@ with tab3:
         - `client_address` - Full address
         - `client_phone` - Contact number
         - `tax_rate` - Tax percentage (default: 0)
+        - `jurisdiction` - Tax jurisdiction from the tax rules; overrides tax_rate for that line
+        - `tax_category` - Item category in the tax rules (default: standard)
         - `currency` - USD, EUR, GBP, etc. (default: USD)
         - `payment_terms` - Net 30, Net 15, etc. (default: Net 30)
         - `notes` - Custom notes per client
@@ -335,15 +663,30 @@ with tab3:
         - Use consistent client names for proper grouping
         - Include tax_rate if applicable
         - Dates will be auto-generated
-        - Invoice numbers are sequential
+        - Invoice numbers are sequential per day, across every batch and single invoice
         
         **Supported Formats:**
         - CSV (Comma Separated Values)
         - UTF-8 encoding recommended
-        - Max 500 rows per batch
+        - No fixed row limit per batch
         - Multiple items per client supported
         """)
     
+    st.subheader("🔢 Invoice Number Audit")
+    number_gaps = get_sequencer().audit()
+    if number_gaps:
+        st.caption("Numbers that were reserved but never issued on an invoice")
+        st.dataframe(pd.DataFrame(number_gaps), hide_index=True, use_container_width=True)
+    else:
+        st.caption("No gaps: every reserved invoice number has been issued.")
+    reissued = get_archive().audit()
+    if reissued:
+        st.caption("Numbers archived with more than one PDF")
+        st.dataframe(
+            pd.DataFrame([{**problem, 'clients': ', '.join(problem['clients'])} for problem in reissued]),
+            hide_index=True, use_container_width=True
+        )
+    
     st.subheader("🎨 Available Templates")
     
     col1, col2, col3 = st.columns(3)
@@ -1,147 +1,759 @@
+import numpy as np
 import pandas as pd
+import itertools
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
 import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
-from datetime import datetime, timedelta
+from datetime import datetime
 from invoice_generator import InvoiceGenerator
-import streamlit as st
+from csv_stream import CLIENT_KEY, iter_sorted_groups, iter_spilled_groups
+from input_readers import read_input, validate_frame, validate_rows
+from checkpoint import BatchCheckpoint
+from output_sinks import SINKS, OutputSink, make_sink
+from render_cache import render_key
+from sequencer import NumberBlocks, format_number, invoice_series
+from tax_rules import NO_RATE, format_cents, parse_cents, rate_units, tax_totals, to_cents, totals_fields
+from metrics import METRICS, Metrics
+from templates import TEMPLATES, register_template
+
+# Optional per-client columns and their defaults, read from each client's first row
+CLIENT_ATTRIBUTES = {
+    'client_address': '',
+    'client_phone': '',
+    'payment_terms': 'Net 30',
+    'currency': 'USD',
+}
+
+# process_batch output: one merged PDF, or per-client PDFs in an output sink
+# (ZIP or tar archive, or a directory; output_sinks.register_sink adds more)
+OUTPUT_MODES = ("zip", "pdf", "tar", "directory")
+
+# Invalid rows listed in get_summary_report; the rest are in processor.errors
+SUMMARY_MAX_ERRORS = 50
+# Shown for an invalid row that has no client_name
+MISSING_CLIENT_NAME = "(no client name)"
+# Archived invoices listed in get_summary_report; the rest are found with the archive's search
+SUMMARY_MAX_INVOICES = 200
+
+# Compact ZIP output deflates a member only if samples of it shrink to at
+# most this fraction; PDFs with binary streams are mostly Flate data already
+COMPACT_DEFLATE_RATIO = 0.9
+COMPACT_SAMPLE_BYTES = 1024
+COMPACT_SAMPLES = 4
+
+# BatchInvoiceProcessor.state values
+JOB_STATES = ("idle", "running", "completed", "failed", "cancelled")
+
+# Per-process state for parallel rendering, set up once by _init_worker
+_worker_generator = None
+_worker_logo_path = None
+
+WARMUP_INVOICE = {
+    'company_name': 'Warmup', 'client_name': 'Warmup', 'invoice_number': 'WARMUP',
+    'invoice_date': '', 'due_date': '', 'currency': 'USD',
+    'items': [{'description': 'Warmup', 'quantity': 1, 'rate': 1}],
+    'subtotal': '1.00', 'tax_rate': 0, 'tax_amount': '0.00', 'total': '1.00',
+}
+
+
+def _init_worker(style_template, logo_path, render_cache=None, metrics_enabled=False, engine="platypus",
+                 compact=False, template_spec=None):
+    """Build and warm up the InvoiceGenerator owned by a pool worker
+
+    template_spec: the parent's definition of style_template. Workers start
+    in a fresh interpreter, without templates registered at runtime.
+    """
+    global _worker_generator, _worker_logo_path
+    if template_spec is not None:
+        register_template(style_template, template_spec)
+    _worker_generator = InvoiceGenerator(
+        style_template, render_cache=render_cache, metrics=Metrics(enabled=metrics_enabled), engine=engine,
+        compact=compact
+    )
+    _worker_logo_path = logo_path
+    # Render one throwaway invoice so font and image loading happen here,
+    # not on the first real invoice
+    _worker_generator.generate_invoice(WARMUP_INVOICE, logo_path)
+    _worker_generator.metrics.reset()
+
+
+def _render_in_worker(invoice_data):
+    """Render one invoice; returns the PDF bytes and the worker's stage timings for it"""
+    pdf_bytes = _worker_generator.generate_invoice(invoice_data, _worker_logo_path).getvalue()
+    metrics = _worker_generator.metrics
+    return pdf_bytes, metrics.drain() if metrics.enabled else None
+
+
+def _ordered_map(executor, fn, payloads, window):
+    """Yield (payload, result) in input order, keeping at most `window` tasks in flight"""
+    pending = deque()
+    try:
+        for payload in payloads:
+            pending.append((payload, executor.submit(fn, payload)))
+            if len(pending) >= window:
+                payload, future = pending.popleft()
+                yield payload, future.result()
+        while pending:
+            payload, future = pending.popleft()
+            yield payload, future.result()
+    finally:
+        # Stopped early (cancelled or failed): drop the tasks not started yet
+        for _, future in pending:
+            future.cancel()
+
+
+def _sample_compression(data):
+    """Deflated size of evenly spaced samples of data over their size, and the seconds that took"""
+    if len(data) <= COMPACT_SAMPLE_BYTES * COMPACT_SAMPLES:
+        sample = data
+    else:
+        step = (len(data) - COMPACT_SAMPLE_BYTES) // (COMPACT_SAMPLES - 1)
+        sample = b''.join(data[i * step:i * step + COMPACT_SAMPLE_BYTES] for i in range(COMPACT_SAMPLES))
+    start = time.perf_counter()
+    compressed = zlib.compress(sample, zlib.Z_DEFAULT_COMPRESSION)
+    return len(compressed) / max(len(sample), 1), time.perf_counter() - start, len(sample)
+
+
+def _ascii85_overhead(pdf_bytes):
+    """Bytes ASCII85 would add to a compact PDF's streams: a fifth more, plus the ~> terminator"""
+    return sum((int(length) + 3) // 4 + 2 for length in re.findall(rb'/Length (\d+)', pdf_bytes))
+
+
+class BatchCancelled(Exception):
+    """Raised inside process_batch once cancel() has been called"""
+
+
+def summarize_batch(df):
+    """Unique clients, line count and total value shown in the batch preview"""
+    summary = {
+        'unique_clients': df['client_name'].nunique() if 'client_name' in df.columns else 0,
+        'line_items': len(df),
+        'total_value': None
+    }
+    if 'rate' in df.columns and 'quantity' in df.columns:
+        summary['total_value'] = float((df['rate'] * df['quantity']).sum())
+    return summary
+
+
+def invalid_clients(errors):
+    """(client_name, client_email) keys of the clients with a row in validate_rows errors"""
+    return {
+        (str(error['client']), str(error['client_email'])) for error in errors
+        if not pd.isna(error['client']) and not pd.isna(error['client_email'])
+    }
+
+
+def drop_clients(df, clients):
+    """Rows of df whose (client_name, client_email) key is not in clients"""
+    if not clients or df.empty:
+        return df
+    keys = pd.MultiIndex.from_arrays([df[column].astype(str) for column in CLIENT_KEY])
+    return df[~keys.isin(list(clients))]
+
+
+def rendered_rows(df, errors):
+    """Rows of a validate_rows frame that a batch renders: those with a client key, of clients without errors"""
+    return drop_clients(df.dropna(subset=CLIENT_KEY), invalid_clients(errors))
+
 
 class BatchInvoiceProcessor:
-    def __init__(self, style_template="modern_minimal"):
-        self.generator = InvoiceGenerator(style_template)
+    def __init__(self, style_template="modern_minimal", workers=1, render_cache=None, metrics=None,
+                 engine="platypus", tax_rules=None, compact=False, sequencer=None,
+                 archive=None):
+        """workers: number of render processes; 1 renders serially, None uses every core
+        
+        render_cache: optional RenderCache so unchanged clients are not re-rendered.
+        Worker processes share only its on-disk tier.
+        
+        metrics: Metrics for the stage timings of this processor's latest
+        batch, reset when each batch starts. By default each processor
+        records its own, enabled like the process-wide METRICS, and adds
+        each batch's to METRICS when the batch finishes.
+        
+        engine: InvoiceGenerator rendering engine, "platypus" or "canvas".
+        
+        tax_rules: optional TaxRules. Lines with a jurisdiction column are
+        taxed at its rate for their tax_category; other lines at their
+        client's tax_rate. With a reporting currency, each invoice's total
+        is also converted to it.
+        
+        compact: render PDFs with binary streams (see InvoiceGenerator), and
+        in ZIP output deflate only the members that samples show will
+        shrink, storing the rest as is. The bytes and compression time this
+        saves are in self.output_stats and the summary report.
+        
+        sequencer: optional sequencer.InvoiceSequencer the invoice numbers
+        come from, so they never collide with other batches' or single
+        invoices'. Each batch reserves its numbers as one block when the
+        client count is known, else a block at a time. Numbers of invoices
+        that end up in no output or archive are released as unused. Without a
+        sequencer, every batch numbers its invoices from 001.
+        
+        archive: optional invoice_archive.InvoiceArchive that every PDF
+        written to a sink is stored and indexed in, tagged with the batch's
+        self.batch_id; get_summary_report then lists and totals the batch
+        from the index. Merged PDF output is not archived. Archived invoices
+        stay archived if the batch fails or is cancelled, so their numbers
+        count as issued and are never handed back.
+        
+        A processor runs one batch at a time. While process_batch runs in
+        one thread, job_state() can be polled and cancel() called from others.
+        """
+        self.style_template = style_template
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.render_cache = render_cache
+        self.engine = engine
+        self.tax_rules = tax_rules
+        self.compact = compact
+        self.sequencer = sequencer
+        self.archive = archive
+        self.batch_id = None
+        self.output_stats = None
+        self.metrics = metrics if metrics is not None else Metrics(enabled=METRICS.enabled)
+        self.generator = InvoiceGenerator(
+            style_template, render_cache=render_cache, metrics=self.metrics, engine=engine, compact=compact
+        )
         self.errors = []
         self.successful_invoices = []
+        self.page_index = []
+        self._invalid_clients = set()
+        self.state = "idle"
+        self.total = None
+        self.message = None
+        self._progress = None
+        self._cancel_event = threading.Event()
+    
+    def cancel(self):
+        """Ask a running process_batch to stop after the invoice in progress"""
+        self._cancel_event.set()
+    
+    def job_state(self):
+        """Snapshot of the current batch: state, invoices done, total (None until known) and message"""
+        return {
+            'state': self.state,
+            'done': len(self.successful_invoices),
+            'total': self.total,
+            'message': self.message,
+            'cancel_requested': self._cancel_event.is_set(),
+        }
     
-    def validate_csv(self, df):
-        """Validate CSV has required columns"""
-        required_columns = [
-            'client_name', 'client_email', 'item_description', 
-            'quantity', 'rate'
-        ]
+    @staticmethod
+    def validate_csv(df):
+        """Validate a batch frame, from any input format, against the input schema"""
+        return validate_frame(df)
+    
+    def process_batch(self, csv_file, company_data, logo_path=None, chunksize=None, presorted=False, spill_dir=None,
+                      output_mode="zip", output=None, progress=None, input_format=None, checkpoint_dir=None):
+        """Process CSV file and generate multiple invoices
         
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        csv_file may also be an already parsed DataFrame, which is used as is.
+        Parquet, Arrow and XLSX files are read too; input_format ("csv",
+        "parquet", "arrow", "xlsx") defaults to the file name's extension.
         
-        if missing_columns:
-            return False, f"Missing required columns: {', '.join(missing_columns)}"
+        logo_path may be a file path or the logo's bytes; it is decoded once
+        and shared by every invoice in the batch.
         
-        # Check for empty values in critical fields
-        if df['client_name'].isnull().any():
-            return False, "Client name cannot be empty"
+        With chunksize set, the CSV is streamed in chunks of that many rows and
+        client groups are rendered as soon as they are complete. presorted=True
+        means each client's rows are already contiguous; otherwise the chunks
+        are grouped through a spill-to-disk sort in spill_dir.
         
-        if df['item_description'].isnull().any():
-            return False, "Item description cannot be empty"
-            
-        return True, "Valid"
-    
-    def process_batch(self, csv_file, company_data, logo_path=None):
-        """Process CSV file and generate multiple invoices"""
+        output_mode: "zip" for one PDF per client in a ZIP archive, "tar" for
+        a tar archive of them, "directory" for a directory of them, or "pdf"
+        for a single PDF in which every invoice starts on a new page, with a
+        bookmark per invoice and its page range in self.page_index. The merged
+        PDF is laid out in this process, so workers and the render cache do
+        not apply to it.
+        
+        output: where to write the result instead of an in-memory buffer: a
+        path (required for "directory"), a binary file object, or an
+        output_sinks.OutputSink, which is used whatever the output_mode. PDFs
+        go to it as they are rendered. The path or file object is returned in
+        place of the buffer.
+        
+        progress: optional callable(done, total) called after every finished
+        invoice. total is the number of clients, or None while streaming.
+        
+        Every row is validated before rendering starts. Clients with an invalid
+        row are skipped, and each problem is recorded in self.errors with its
+        row number and reason.
+        
+        If cancel() is called meanwhile, the batch stops with (None, message)
+        and state "cancelled"; anything already written to output is partial.
+        
+        checkpoint_dir: directory in which every finished invoice and a
+        manifest of them are kept (not for "pdf" output). Running the batch again
+        with the same directory, after a failure or cancel, reuses the
+        invoices whose input is unchanged and renders only the rest; the
+        archive is the same as from an uninterrupted run.
+        """
+        if output_mode != "pdf" and output_mode not in SINKS and not isinstance(output, OutputSink):
+            raise ValueError(f"Unknown output mode '{output_mode}', expected one of: pdf, {', '.join(SINKS)}")
+        if checkpoint_dir and output_mode == "pdf":
+            raise ValueError("Checkpoints are not supported for merged PDF output")
+        
+        self._progress = progress
+        self.total = None
+        self.message = None
+        self.errors = []
+        self.successful_invoices = []
+        self.page_index = []
+        self._invalid_clients = set()
+        self.output_stats = None
+        self.batch_id = None
+        self.state = "running"
+        if self.metrics is not METRICS:
+            # Only this batch's timings are merged into METRICS when it finishes
+            self.metrics.reset()
+        checkpoint = BatchCheckpoint(checkpoint_dir) if checkpoint_dir else None
+        numbers = None
         try:
-            # Read CSV
-            df = pd.read_csv(csv_file)
-            
-            # Validate
-            is_valid, message = self.validate_csv(df)
-            if not is_valid:
-                return None, message
+            # One date for the whole batch keeps numbering stable across midnight,
+            # and across resumed runs
+            invoice_date = datetime.now()
+            if checkpoint is not None:
+                invoice_date = checkpoint.invoice_date(invoice_date)
+            if self.sequencer is not None:
+                numbers = self._number_blocks(invoice_date, checkpoint)
             
-            # Group by client to create one invoice per client
-            grouped = df.groupby(['client_name', 'client_email'])
+            if chunksize and not isinstance(csv_file, pd.DataFrame):
+                frames = self._stream_frames(csv_file, chunksize, presorted, spill_dir, input_format)
+                # Frames are grouped by client, so every row of a client has been
+                # validated by the time its frame comes out
+                records = itertools.chain.from_iterable(
+                    self._build_client_records(self._drop_invalid_clients(frame), company_data, invoice_date, sort=False)
+                    for frame in frames
+                )
+            else:
+                # Read CSV
+                if isinstance(csv_file, pd.DataFrame):
+                    df = csv_file
+                else:
+                    with self.metrics.stage('csv_parse'):
+                        df = read_input(csv_file, input_format)
+                
+                # Validate
+                with self.metrics.stage('validate'):
+                    is_valid, message = self.validate_csv(df)
+                    if is_valid:
+                        df = self._drop_invalid_clients(self._validate_rows(df))
+                if not is_valid:
+                    self.state, self.message = "failed", message
+                    return None, message
+                
+                # Aggregate every client up front; one invoice per client
+                records = self._build_client_records(df, company_data, invoice_date)
+                self.total = len(records)
             
-            # Create ZIP file in memory
-            zip_buffer = BytesIO()
+            payloads = self._iter_invoice_data(records, company_data, invoice_date, numbers)
             
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                invoice_count = 0
-                
-                for (client_name, client_email), group in grouped:
-                    invoice_count += 1
-                    
-                    # Generate invoice number
-                    invoice_number = f"INV-{datetime.now().strftime('%Y%m%d')}-{invoice_count:03d}"
-                    
-                    # Prepare line items
-                    items = []
-                    for _, row in group.iterrows():
-                        items.append({
-                            'description': row['item_description'],
-                            'quantity': float(row['quantity']),
-                            'rate': float(row['rate'])
-                        })
-                    
-                    # Calculate totals
-                    subtotal = sum(item['quantity'] * item['rate'] for item in items)
-                    tax_rate = float(group.iloc[0].get('tax_rate', 0) if 'tax_rate' in group.columns else 0)
-                    tax_amount = subtotal * (tax_rate / 100)
-                    total = subtotal + tax_amount
-                    
-                    # Get optional fields with defaults
-                    client_address = group.iloc[0].get('client_address', '') if 'client_address' in group.columns else ''
-                    client_phone = group.iloc[0].get('client_phone', '') if 'client_phone' in group.columns else ''
-                    payment_terms = group.iloc[0].get('payment_terms', 'Net 30') if 'payment_terms' in group.columns else 'Net 30'
-                    currency = group.iloc[0].get('currency', 'USD') if 'currency' in group.columns else 'USD'
-                    notes = group.iloc[0].get('notes', company_data.get('default_notes', '')) if 'notes' in group.columns else company_data.get('default_notes', '')
-                    
-                    # Calculate due date based on payment terms
-                    invoice_date = datetime.now()
-                    if payment_terms == "Due on Receipt":
-                        due_date = invoice_date
-                    else:
-                        try:
-                            days = int(payment_terms.split()[1])
-                            due_date = invoice_date + timedelta(days=days)
-                        except:
-                            due_date = invoice_date + timedelta(days=30)
-                    
-                    # Create invoice data
-                    invoice_data = {
-                        'company_name': company_data['company_name'],
-                        'company_address': company_data['company_address'],
-                        'company_email': company_data['company_email'],
-                        'company_phone': company_data['company_phone'],
-                        'client_name': client_name,
-                        'client_address': client_address,
-                        'client_email': client_email,
-                        'client_phone': client_phone,
-                        'invoice_number': invoice_number,
-                        'invoice_date': invoice_date.strftime('%B %d, %Y'),
-                        'due_date': due_date.strftime('%B %d, %Y'),
-                        'currency': currency,
-                        'items': items,
-                        'subtotal': f"{subtotal:.2f}",
-                        'tax_rate': tax_rate,
-                        'tax_amount': f"{tax_amount:.2f}",
-                        'total': f"{total:.2f}",
-                        'notes': notes
-                    }
-                    
-                    # Generate PDF
-                    pdf_buffer = self.generator.generate_invoice(invoice_data, logo_path)
-                    
-                    # Add to ZIP
-                    pdf_filename = f"{invoice_number}_{client_name.replace(' ', '_')}.pdf"
-                    zip_file.writestr(pdf_filename, pdf_buffer.getvalue())
-                    
-                    self.successful_invoices.append({
-                        'invoice_number': invoice_number,
-                        'client': client_name,
-                        'total': f"{currency} {total:.2f}"
-                    })
+            if output_mode == "pdf" and not isinstance(output, OutputSink):
+                result = output if output is not None else BytesIO()
+                self.page_index = self.generator.generate_merged(self._track(payloads), result, logo_path)
+                pages = self.page_index[-1]['last_page'] if self.page_index else 0
+                message = f"Successfully generated {len(self.page_index)} invoices in one PDF ({pages} pages)"
+                if output is None:
+                    result.seek(0)
+            else:
+                if self.archive is not None:
+                    self.batch_id = f"{invoice_date.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+                sink = output if isinstance(output, OutputSink) else make_sink(output_mode, output)
+                try:
+                    invoice_count = self._write_members(sink, payloads, logo_path, invoice_date, checkpoint)
+                except BaseException:
+                    sink.abort()
+                    raise
+                result = sink.close()
+                message = f"Successfully generated {invoice_count} invoices"
+            if self.errors:
+                message += f"; skipped {len(self._invalid_clients)} clients with {len(self.errors)} invalid rows"
             
-            zip_buffer.seek(0)
-            return zip_buffer, f"Successfully generated {invoice_count} invoices"
+            self.state, self.message = "completed", message
+            return result, message
+        
+        except BatchCancelled:
+            self.state = "cancelled"
+            self.message = f"Cancelled after {len(self.successful_invoices)} invoices"
+            return None, self.message
             
         except Exception as e:
-            return None, f"Error processing CSV: {str(e)}"
+            self.state, self.message = "failed", f"Error processing CSV: {str(e)}"
+            if checkpoint is not None:
+                self.message += f" ({len(checkpoint)} finished invoices are kept in {checkpoint_dir} for a resumed run)"
+            return None, self.message
+        
+        finally:
+            self._cancel_event.clear()
+            if numbers is not None:
+                # Invoices count as issued once they are in the output or the
+                # archive, or kept for a resumed run, which reuses the checkpoint's blocks.
+                # A merged PDF is never archived, so a failed one issues nothing.
+                kept = (self.state == "completed" or checkpoint is not None or output_mode == "directory"
+                        or (self.archive is not None and output_mode != "pdf"))
+                issued = len(self.successful_invoices) if kept else 0
+                numbers.release(issued, give_back=checkpoint is None)
+            if checkpoint is not None:
+                checkpoint.close()
+            if self.archive is not None:
+                self.archive.flush()
+            if self.metrics is not METRICS:
+                METRICS.merge(self.metrics.snapshot())
+    
+    def _write_members(self, sink, payloads, logo_path, invoice_date, checkpoint=None):
+        """Render every invoice into the sink, one PDF at a time; returns the invoice count"""
+        invoice_count = 0
+        if checkpoint is not None:
+            rendered = self._render_resumed(payloads, logo_path, checkpoint)
+        else:
+            rendered = self._render_all(payloads, logo_path)
+        
+        stats = None
+        if self.compact:
+            stats = self.output_stats = {
+                'pdf_bytes': 0, 'archive_bytes': 0, 'ascii85_bytes_saved': 0,
+                'stored': 0, 'deflated': 0, 'compress_seconds': 0.0, 'compress_seconds_saved': 0.0,
+            }
+        
+        # Results come back in payload order, so numbering and the
+        # output layout are the same in serial and parallel runs
+        for invoice_data, pdf_bytes in rendered:
+            invoice_count += 1
+            
+            pdf_filename = f"{invoice_data['invoice_number']}_{invoice_data['client_name'].replace(' ', '_')}.pdf"
+            compress_type = zipfile.ZIP_DEFLATED
+            if stats is not None and sink.compressible:
+                ratio, sample_seconds, sample_bytes = _sample_compression(pdf_bytes)
+                if ratio > COMPACT_DEFLATE_RATIO:
+                    compress_type = zipfile.ZIP_STORED
+                    # Deflating the whole member would have taken about this long
+                    stats['compress_seconds_saved'] += sample_seconds * len(pdf_bytes) / sample_bytes
+                stats['compress_seconds'] += sample_seconds
+            with self.metrics.stage('zip_write'):
+                start = time.perf_counter()
+                written = sink.add(pdf_filename, pdf_bytes, invoice_date, compress_type)
+            if stats is not None:
+                if sink.compressible and compress_type == zipfile.ZIP_DEFLATED:
+                    stats['deflated'] += 1
+                    stats['compress_seconds'] += time.perf_counter() - start
+                else:
+                    stats['stored'] += 1
+                stats['pdf_bytes'] += len(pdf_bytes)
+                stats['archive_bytes'] += written
+                stats['ascii85_bytes_saved'] += _ascii85_overhead(pdf_bytes)
+            if self.archive is not None:
+                with self.metrics.stage('archive_write'):
+                    self.archive.add(invoice_data, pdf_bytes, self.batch_id)
+            self._record_invoice(invoice_data)
+        return invoice_count
+    
+    def _render_resumed(self, payloads, logo_path, checkpoint):
+        """Like _render_all, but invoices a previous run finished come from the checkpoint
+        
+        New renders are added to the checkpoint as they finish.
+        """
+        logo_digest = self.generator.logo_cache.digest(logo_path) if logo_path else None
+        # (invoice_data, input_hash, finished PDF path or None) in payload order
+        queue = deque()
+        
+        def to_render():
+            for invoice_data in payloads:
+                input_hash = render_key(invoice_data, self.generator.template, logo_digest, self.engine, self.compact)
+                path = checkpoint.lookup(invoice_data, input_hash)
+                queue.append((invoice_data, input_hash, path))
+                if path is None:
+                    yield invoice_data
+        
+        def finished():
+            # Invoices at the head of the queue that need no rendering
+            while queue and queue[0][2] is not None:
+                invoice_data, _, path = queue.popleft()
+                self.metrics.count('checkpoint_reused')
+                with open(path, 'rb') as f:
+                    yield invoice_data, f.read()
+        
+        for invoice_data, pdf_bytes in self._render_all(to_render(), logo_path):
+            yield from finished()
+            _, input_hash, _ = queue.popleft()
+            checkpoint.record(invoice_data, input_hash, f"{invoice_data['invoice_number']}.pdf", pdf_bytes)
+            yield invoice_data, pdf_bytes
+        yield from finished()
+    
+    def _track(self, payloads):
+        """Pass payloads to the merged document, recording each one once it has been laid out"""
+        for invoice_data in payloads:
+            yield invoice_data
+            self._record_invoice(invoice_data)
+    
+    def _record_invoice(self, invoice_data):
+        self.metrics.count('invoices')
+        invoice = {
+            'invoice_number': invoice_data['invoice_number'],
+            'client': invoice_data['client_name'],
+            'total': f"{invoice_data['currency']} {invoice_data['total']}"
+        }
+        if invoice_data.get('reporting_total') is not None:
+            invoice['reporting_total'] = f"{invoice_data['reporting_currency']} {invoice_data['reporting_total']}"
+            invoice['reporting_cents'] = parse_cents(invoice_data['reporting_total'])
+        self.successful_invoices.append(invoice)
+        if self._progress is not None:
+            self._progress(len(self.successful_invoices), self.total)
+    
+    def _validate_rows(self, df):
+        """Record df's invalid rows in self.errors and their clients as skipped; returns the checked frame"""
+        df, errors = validate_rows(df, self.tax_rules)
+        self.errors.extend(errors)
+        self._invalid_clients.update(invalid_clients(errors))
+        return df
+    
+    def _drop_invalid_clients(self, df):
+        """Rows of df whose client has no invalid row"""
+        return drop_clients(df, self._invalid_clients)
+    
+    def _stream_frames(self, csv_file, chunksize, presorted, spill_dir, input_format=None):
+        """Yield frames of complete client groups from a chunked input read"""
+        def validated_chunks():
+            reader = iter(read_input(csv_file, input_format, chunksize))
+            while True:
+                with self.metrics.stage('csv_parse'):
+                    chunk = next(reader, None)
+                if chunk is None:
+                    return
+                with self.metrics.stage('validate'):
+                    is_valid, message = self.validate_csv(chunk)
+                    if is_valid:
+                        chunk = self._validate_rows(chunk)
+                if not is_valid:
+                    raise ValueError(message)
+                yield chunk
+        
+        if presorted:
+            return iter_sorted_groups(validated_chunks())
+        return iter_spilled_groups(validated_chunks(), spill_dir)
+    
+    def _render_all(self, payloads, logo_path):
+        """Render invoice payloads, yielding (invoice_data, pdf_bytes) in input order"""
+        if self.workers <= 1:
+            for invoice_data in payloads:
+                yield invoice_data, self.generator.generate_invoice(invoice_data, logo_path).getvalue()
+            return
+        
+        # Forked workers would inherit locks held by the app's other threads (e.g. a
+        # JobManager batch), so they start from a fresh interpreter instead
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_worker,
+            initargs=(self.style_template, logo_path, self.render_cache, self.metrics.enabled, self.engine,
+                      self.compact, TEMPLATES.get(self.style_template))
+        ) as executor:
+            for invoice_data, (pdf_bytes, worker_metrics) in _ordered_map(
+                executor, _render_in_worker, payloads, self.workers * 4
+            ):
+                if worker_metrics:
+                    self.metrics.merge(worker_metrics)
+                yield invoice_data, pdf_bytes
+    
+    def _build_client_records(self, df, company_data, invoice_date, sort=True):
+        """Aggregate line items, totals and client attributes for every client in one columnar pass
+        
+        Returns one record per client, in groupby order, holding everything
+        the invoice needs except its number.
+        """
+        df = df.dropna(subset=CLIENT_KEY).reset_index(drop=True)
+        if df.empty:
+            return []
+        
+        with self.metrics.stage('group'):
+            codes, order, starts, ends = self._group_rows(df, sort)
+        with self.metrics.stage('aggregate'):
+            return self._aggregate_records(df, codes, order, starts, ends, company_data, invoice_date)
+    
+    def _group_rows(self, df, sort):
+        """Group number of every row, row positions ordered by group, and each group's slice bounds"""
+        codes = df.groupby(CLIENT_KEY, sort=sort).ngroup().to_numpy()
+        order = np.argsort(codes, kind='stable')
+        sizes = np.bincount(codes)
+        ends = np.cumsum(sizes)
+        starts = ends - sizes
+        return codes, order, starts, ends
+    
+    def _aggregate_records(self, df, codes, order, starts, ends, company_data, invoice_date):
+        """Build one invoice record per group from the grouped row layout"""
+        first_rows = order[starts]
+        
+        # Line amounts in cents, each line's tax rate, and per-client totals
+        quantity = df['quantity'].astype(float).to_numpy()
+        rate = df['rate'].astype(float).to_numpy()
+        line_cents = to_cents(quantity * rate)
+        if 'tax_rate' in df.columns:
+            client_rates = rate_units(df['tax_rate'].astype(float).fillna(0).to_numpy()[first_rows])
+        else:
+            client_rates = np.zeros(len(first_rows), dtype='int64')
+        line_rates = client_rates[codes]
+        if self.tax_rules is not None and 'jurisdiction' in df.columns:
+            categories = df['tax_category'] if 'tax_category' in df.columns else None
+            rule_rates = self.tax_rules.line_rates(df['jurisdiction'], categories)
+            line_rates = np.where(rule_rates != NO_RATE, rule_rates, line_rates)
+        subtotal, tax, taxes = tax_totals(codes, line_cents, line_rates, len(first_rows))
+        
+        # First-row client attributes
+        first = df.iloc[first_rows].reset_index(drop=True)
+        attributes = {
+            column: first[column].fillna(default) if column in first.columns else pd.Series(default, index=first.index)
+            for column, default in CLIENT_ATTRIBUTES.items()
+        }
+        default_notes = company_data.get('default_notes', '')
+        notes = first['notes'].fillna(default_notes) if 'notes' in first.columns else pd.Series(default_notes, index=first.index)
+        
+        # Due dates from payment terms: "Due on Receipt" is today, "<word> <days>" adds days, anything else is 30 days
+        terms = attributes['payment_terms'].astype(str)
+        term_days = terms.str.split().str[1]
+        days = pd.to_numeric(term_days.where(term_days.str.fullmatch(r'[+-]?\d+', na=False)), errors='coerce').fillna(30)
+        days = days.where(terms != "Due on Receipt", 0)
+        due_dates = (pd.Timestamp(invoice_date) + pd.to_timedelta(days, unit='D')).dt.strftime('%B %d, %Y')
+        
+        # Line items, sliced per client from columns laid out in group order
+        descriptions = df['item_description'].to_numpy()[order].tolist()
+        quantities = quantity[order].tolist()
+        rates = rate[order].tolist()
+        
+        columns = {
+            'client_name': first['client_name'].tolist(),
+            'client_email': first['client_email'].tolist(),
+            **{column: values.tolist() for column, values in attributes.items() if column != 'payment_terms'},
+            'notes': notes.tolist(),
+            'due_date': due_dates.tolist(),
+        }
+        reporting_currency = self.tax_rules.reporting_currency if self.tax_rules is not None else None
+        if reporting_currency:
+            reporting = self.tax_rules.to_reporting(subtotal + tax, attributes['currency'])
+            columns['reporting_currency'] = [reporting_currency] * len(reporting)
+            columns['reporting_total'] = [format_cents(cents) if cents != NO_RATE else None for cents in reporting.tolist()]
+        
+        records = []
+        for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+            record = {column: values[i] for column, values in columns.items()}
+            record.update({
+                'items': [
+                    {'description': d, 'quantity': q, 'rate': r}
+                    for d, q, r in zip(descriptions[start:end], quantities[start:end], rates[start:end])
+                ],
+                **totals_fields(subtotal[i], tax[i], taxes[i]),
+            })
+            records.append(record)
+        return records
+    
+    def _number_blocks(self, invoice_date, checkpoint=None):
+        """NumberBlocks for this batch; a checkpointed batch reuses the blocks its earlier runs reserved"""
+        series = invoice_series(invoice_date)
+        if checkpoint is None:
+            return NumberBlocks(self.sequencer, series)
+        return NumberBlocks(
+            self.sequencer, series, checkpoint.number_blocks(series),
+            on_reserve=lambda first, last: checkpoint.record_number_block(series, first, last)
+        )
+    
+    def _iter_invoice_data(self, records, company_data, invoice_date, numbers=None):
+        """Number prebuilt client records in order and add the company details
+        
+        numbers: NumberBlocks to take the invoice numbers from; by default
+        they count from 1 in the batch date's series.
+        """
+        invoice_count = 0
+        series = invoice_series(invoice_date)
+        
+        for record in records:
+            if self._cancel_event.is_set():
+                raise BatchCancelled()
+            invoice_count += 1
+            
+            # Generate invoice number
+            if numbers is not None:
+                remaining = self.total - invoice_count + 1 if self.total is not None else None
+                invoice_number = numbers.take(remaining)
+            else:
+                invoice_number = format_number(series, invoice_count)
+            
+            # Create invoice data
+            invoice_data = {
+                'company_name': company_data['company_name'],
+                'company_address': company_data['company_address'],
+                'company_email': company_data['company_email'],
+                'company_phone': company_data['company_phone'],
+                'invoice_number': invoice_number,
+                'invoice_date': invoice_date.strftime('%B %d, %Y'),
+                **record
+            }
+            
+            yield invoice_data
     
     def get_summary_report(self):
         """Generate summary of batch processing"""
-        if not self.successful_invoices:
+        if not self.successful_invoices and not self.errors:
             return "No invoices generated"
         
         report = "📊 **Batch Processing Summary**\n\n"
         report += f"✅ Total Invoices Generated: {len(self.successful_invoices)}\n\n"
         
-        total_value = 0
-        for inv in self.successful_invoices:
-            report += f"• {inv['invoice_number']}: {inv['client']} - {inv['total']}\n"
+        if self.archive is not None and self.batch_id:
+            report += self._archive_summary()
+        else:
+            for inv in self.successful_invoices:
+                report += f"• {inv['invoice_number']}: {inv['client']} - {inv['total']}"
+                if 'reporting_total' in inv and inv['reporting_total'] != inv['total']:
+                    report += f" ({inv['reporting_total']})"
+                report += "\n"
+        
+        reporting_currency = self.tax_rules.reporting_currency if self.tax_rules is not None else None
+        if reporting_currency:
+            total_cents = sum(inv.get('reporting_cents', 0) for inv in self.successful_invoices)
+            report += f"\n💱 **Total in {reporting_currency}:** {format_cents(total_cents)}\n"
+        
+        if self.errors:
+            report += f"\n⚠️ **Skipped Clients** ({len(self._invalid_clients)} clients, {len(self.errors)} invalid rows)\n\n"
+            for error in self.errors[:SUMMARY_MAX_ERRORS]:
+                client = MISSING_CLIENT_NAME if pd.isna(error['client']) else error['client']
+                report += f"• Row {error['row']} ({client}): {error['reason']}\n"
+            if len(self.errors) > SUMMARY_MAX_ERRORS:
+                report += f"• ... and {len(self.errors) - SUMMARY_MAX_ERRORS} more\n"
         
-        return report
\ No newline at end of file
+        if self.output_stats:
+            stats = self.output_stats
+            members = stats['stored'] + stats['deflated']
+            report += "\n🗜️ **Compact Output**\n\n"
+            report += f"• PDFs: {stats['pdf_bytes'] / 1024:,.1f} KB, {stats['ascii85_bytes_saved'] / 1024:,.1f} KB less than with ASCII85 streams\n"
+            report += f"• Archive: {stats['archive_bytes'] / 1024:,.1f} KB; {stats['stored']} of {members} PDFs stored without recompressing\n"
+            report += f"• Compression: {stats['compress_seconds']:.2f}s, about {stats['compress_seconds_saved']:.2f}s saved by storing\n"
+        
+        stages = self.metrics.snapshot()['stages'] if self.metrics.enabled else {}
+        if stages:
+            report += "\n⏱️ **Stage Timings**\n\n"
+            for name, stage in stages.items():
+                mean_ms = stage['sum'] / stage['count'] * 1000
+                report += f"• {name}: {stage['sum']:.2f}s total, {stage['count']} × {mean_ms:.1f} ms avg, max {stage['max'] * 1000:.1f} ms\n"
+        
+        return report
+    
+    def _archive_summary(self):
+        """The batch's invoices and totals per currency, from the archive index"""
+        report = ""
+        archived = self.archive.count(batch_id=self.batch_id)
+        for row in self.archive.search(batch_id=self.batch_id, limit=SUMMARY_MAX_INVOICES, newest_first=False):
+            report += f"• {row['invoice_number']}: {row['client_name']} - {row['currency']} {format_cents(row['total_cents'])}\n"
+        if archived > SUMMARY_MAX_INVOICES:
+            report += f"• ... and {archived - SUMMARY_MAX_INVOICES} more in the archive (batch {self.batch_id})\n"
+        totals = self.archive.totals(batch_id=self.batch_id)
+        if totals:
+            report += "\n💰 **Totals**\n\n"
+            for currency, count, total_cents in totals:
+                report += f"• {currency}: {format_cents(total_cents)} over {count} invoices\n"
+        return report
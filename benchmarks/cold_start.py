@@ -0,0 +1,88 @@
+"""Measure cold-start time of the command-line entry point.
+
+Usage:
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --runs 10 --max-help-seconds 0.3
+
+Each case runs in a fresh interpreter. Reports the median wall time of
+`cli.py --help` (argument parsing only), of importing batch_processor, and of
+a full `cli.py batch` run on the sample CSV. With --max-help-seconds, exits
+with status 1 if `cli.py --help` is slower than that, or if building the
+argument parser imports any of HEAVY_MODULES.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, 'cli.py')
+SAMPLE_CSV = os.path.join(ROOT, 'sample_invoice_batch.csv')
+# Only the commands that render may import these
+HEAVY_MODULES = ('pandas', 'numpy', 'reportlab')
+# Prints the HEAVY_MODULES that building and running cli.py's parser on --help imports
+PARSER_IMPORTS = """
+import contextlib, io, sys
+import cli
+with contextlib.redirect_stdout(io.StringIO()):
+    try:
+        cli.build_parser().parse_args(['--help'])
+    except SystemExit:
+        pass
+print(' '.join(name for name in sys.argv[1:] if name in sys.modules))
+"""
+
+
+def median_seconds(command, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def parser_imports():
+    """HEAVY_MODULES loaded by `cli.py --help`, measured in a fresh interpreter"""
+    result = subprocess.run([sys.executable, '-c', PARSER_IMPORTS, *HEAVY_MODULES], cwd=ROOT, check=True,
+                            capture_output=True, text=True)
+    return result.stdout.split()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help="runs per case")
+    parser.add_argument('--max-help-seconds', type=float, help="fail if `cli.py --help` takes longer")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        cases = {
+            'python -c pass': [sys.executable, '-c', 'pass'],
+            'cli.py --help': [sys.executable, CLI, '--help'],
+            'import batch_processor': [sys.executable, '-c', 'import batch_processor'],
+            'cli.py batch sample': [sys.executable, CLI, 'batch', SAMPLE_CSV, '--out', out_dir],
+        }
+        results = {name: median_seconds(command, args.runs) for name, command in cases.items()}
+
+    for name, seconds in results.items():
+        print(f"{name}: {seconds * 1000:.0f} ms")
+    heavy = parser_imports()
+    print(f"cli.py --help imports: {', '.join(heavy) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+
+    if args.max_help_seconds is None:
+        return 0
+    failed = False
+    if results['cli.py --help'] > args.max_help_seconds:
+        print(f"cli.py --help took {results['cli.py --help']:.3f}s, over {args.max_help_seconds}s")
+        failed = True
+    if heavy:
+        print(f"cli.py --help should not import {', '.join(heavy)}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
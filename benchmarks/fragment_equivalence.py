@@ -0,0 +1,84 @@
+"""Check that cached header fragments do not change the rendered PDFs.
+
+Usage:
+    python benchmarks/fragment_equivalence.py
+    python benchmarks/fragment_equivalence.py --long-lines 500 --rounds 3
+
+Renders every style template, with and without a logo, for a short and a
+long (multi-page) invoice, once with InvoiceGenerator(cache_fragments=True)
+and once with cache_fragments=False, under reportlab's rl_config.invariant.
+Each generator renders the whole sequence --rounds times and for two
+companies, so later invoices reuse fragments laid out by earlier ones.
+Exits with status 1 if any pair of PDFs differs by a single byte.
+"""
+import argparse
+import hashlib
+import itertools
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reportlab import rl_config
+
+from synthetic import make_invoice_data, make_logo_bytes
+
+SHORT_LINES = 5
+DEFAULT_LONG_LINES = 200
+
+
+def invoice_cases(long_lines):
+    """(name, invoice_data, logo bytes or None) for each invoice a generator renders in a round"""
+    logo = make_logo_bytes(width=300, height=150)
+    other_company = {'company_name': 'Second Company Ltd', 'company_address': '2 Other Road'}
+    for (size, lines), with_logo, company in itertools.product(
+        (('short', SHORT_LINES), ('long', long_lines)), (False, True), ('first', 'second')
+    ):
+        invoice_data = make_invoice_data(lines)
+        if company == 'second':
+            invoice_data.update(other_company)
+        name = f"{size}, {'logo' if with_logo else 'no logo'}, {company} company"
+        yield name, invoice_data, logo if with_logo else None
+
+
+def render_all(template, cache_fragments, cases, rounds):
+    from invoice_generator import InvoiceGenerator
+
+    generator = InvoiceGenerator(template, cache_fragments=cache_fragments)
+    return [
+        (f"round {r + 1}: {name}", generator.generate_invoice(invoice_data, logo).getvalue())
+        for r in range(rounds) for name, invoice_data, logo in cases
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--long-lines', type=int, default=DEFAULT_LONG_LINES, help="line items in the long invoice")
+    parser.add_argument('--rounds', type=int, default=2, help="times each generator renders every case")
+    args = parser.parse_args(argv)
+
+    # Fixed timestamps and document IDs, so equal layouts give equal bytes
+    rl_config.invariant = 1
+    from templates import template_names
+
+    cases = list(invoice_cases(args.long_lines))
+    mismatches = 0
+    for template in template_names():
+        cached = render_all(template, True, cases, args.rounds)
+        uncached = render_all(template, False, cases, args.rounds)
+        for (name, with_cache), (_, without_cache) in zip(cached, uncached):
+            if with_cache != without_cache:
+                mismatches += 1
+                print(f"{template}, {name}: PDFs differ ({hashlib.sha256(with_cache).hexdigest()[:12]} cached, "
+                      f"{hashlib.sha256(without_cache).hexdigest()[:12]} uncached)")
+        print(f"{template}: {len(cached)} PDFs compared")
+
+    if mismatches:
+        print(f"{mismatches} PDFs differ with cache_fragments")
+        return 1
+    print("All PDFs byte-identical with and without cache_fragments")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
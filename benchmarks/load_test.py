@@ -0,0 +1,96 @@
+"""Load-test the HTTP rendering service and report latency percentiles.
+
+Usage:
+    python benchmarks/load_test.py --workers 4 --concurrency 8 --requests 400
+    python benchmarks/load_test.py --url http://127.0.0.1:8080 --concurrency 16
+
+Without --url, a server is started in this process on a free port with
+--workers render processes. Every client thread keeps one connection open
+and posts invoices back to back. Reports p50/p90/p99 latency of successful
+requests, throughput, and how many requests were turned away with 503.
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from run_benchmarks import percentiles
+from synthetic import make_invoice_data
+
+
+def client(host, port, path, body, count, latencies, statuses):
+    connection = http.client.HTTPConnection(host, port, timeout=60)
+    headers = {'Content-Type': 'application/json'}
+    for _ in range(count):
+        start = time.perf_counter()
+        connection.request('POST', path, body, headers)
+        response = connection.getresponse()
+        response.read()
+        elapsed = time.perf_counter() - start
+        statuses.append(response.status)
+        if response.status == 200:
+            latencies.append(elapsed)
+    connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="running server to test (default: start one locally)")
+    parser.add_argument('--workers', type=int, default=2, help="render processes of the local server")
+    parser.add_argument('--queue-size', type=int, default=16, help="queue size of the local server")
+    parser.add_argument('--concurrency', type=int, default=4, help="client threads")
+    parser.add_argument('--requests', type=int, default=200, help="total requests")
+    parser.add_argument('--lines', type=int, default=10, help="line items per invoice")
+    parser.add_argument('--template', default='modern_minimal')
+    parser.add_argument('--engine', default='platypus')
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        from server import InvoiceServer
+        server = InvoiceServer(('127.0.0.1', 0), args.workers, args.queue_size)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+
+    body = json.dumps(make_invoice_data(args.lines))
+    path = f"/invoice?template={args.template}&engine={args.engine}"
+    latencies, statuses = [], []
+    per_client = max(1, args.requests // args.concurrency)
+    threads = [
+        threading.Thread(target=client, args=(host, port, path, body, per_client, latencies, statuses))
+        for _ in range(args.concurrency)
+    ]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+    rejected = statuses.count(503)
+    failed = len(statuses) - len(latencies) - rejected
+    print(f"{len(statuses)} requests, {args.concurrency} connections: "
+          f"{len(latencies) / elapsed:.1f} invoices/s, {rejected} rejected (503), {failed} failed")
+    if latencies:
+        summary = percentiles(latencies)
+        print(f"latency p50 {summary['p50']:.1f} ms, p90 {summary['p90']:.1f} ms, "
+              f"p99 {summary['p99']:.1f} ms, mean {summary['mean']:.1f} ms")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
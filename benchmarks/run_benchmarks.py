@@ -0,0 +1,254 @@
+"""Benchmark generate_invoice and process_batch across workload sizes.
+
+Single multi-page invoices are timed as long_invoice cases, to check that
+layout time grows linearly with the number of line items.
+
+Usage:
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --quick --compare results.json
+
+Results are written as JSON. With --compare, cases whose throughput dropped
+by more than --threshold against the baseline file are listed and the
+script exits with status 1.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import COMPANY_DATA, make_batch_frame, make_invoice_data, make_logo_bytes
+
+TEMPLATES = ["modern_minimal", "corporate_blue", "creative_gradient"]
+DEFAULT_ROWS = [10, 100, 1000, 10000, 100000]
+QUICK_ROWS = [10, 100, 1000]
+DEFAULT_LONG_LINES = [1000, 5000, 10000, 20000]
+QUICK_LONG_LINES = [500, 2000]
+
+
+def percentiles(samples):
+    """Latency summary in milliseconds"""
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+
+    return {
+        'p50': pick(0.50),
+        'p90': pick(0.90),
+        'p99': pick(0.99),
+        'mean': statistics.fmean(ordered) * 1000,
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def bench_generate_invoice(template, logo, lines, description_length, iterations, engine='platypus'):
+    from invoice_generator import InvoiceGenerator
+
+    generator = InvoiceGenerator(template, engine=engine)
+    invoice_data = make_invoice_data(lines, description_length)
+    logo_bytes = make_logo_bytes() if logo else None
+    generator.generate_invoice(invoice_data, logo_bytes)  # warm up
+
+    samples = []
+    output_bytes = 0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        output_bytes = len(generator.generate_invoice(invoice_data, logo_bytes).getvalue())
+        samples.append(time.perf_counter() - start)
+
+    return {
+        'name': 'generate_invoice',
+        'params': {'template': template, 'logo': logo, 'lines': lines,
+                   'description_length': description_length, 'engine': engine},
+        'iterations': iterations,
+        'latency_ms': percentiles(samples),
+        'invoices_per_sec': iterations / sum(samples),
+        'output_bytes': output_bytes,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def bench_long_invoice(template, lines):
+    """One multi-page invoice; ms_per_line should stay flat as lines grow"""
+    from invoice_generator import InvoiceGenerator
+
+    generator = InvoiceGenerator(template)
+    generator.generate_invoice(make_invoice_data(1))  # warm up
+    invoice_data = make_invoice_data(lines)
+
+    start = time.perf_counter()
+    output_bytes = len(generator.generate_invoice(invoice_data).getvalue())
+    elapsed = time.perf_counter() - start
+
+    return {
+        'name': 'long_invoice',
+        'params': {'template': template, 'lines': lines},
+        'seconds': elapsed,
+        'ms_per_line': elapsed * 1000 / lines,
+        'invoices_per_sec': 1 / elapsed,
+        'output_bytes': output_bytes,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def bench_process_batch(template, logo, rows, lines_per_client, description_length, workers, engine='platypus'):
+    """One process_batch run; executed in a fresh process so peak RSS is per case"""
+    from batch_processor import BatchInvoiceProcessor
+
+    clients = max(1, rows // lines_per_client)
+    df = make_batch_frame(clients, lines_per_client, description_length)
+    logo_bytes = make_logo_bytes() if logo else None
+
+    processor = BatchInvoiceProcessor(template, workers=workers, engine=engine)
+    samples = []
+    render = processor.generator.generate_invoice
+
+    def timed_render(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return render(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+
+    # Per-invoice latency is only observable in the parent when rendering serially
+    processor.generator.generate_invoice = timed_render
+
+    start = time.perf_counter()
+    zip_buffer, message = processor.process_batch(df, COMPANY_DATA, logo_bytes)
+    elapsed = time.perf_counter() - start
+    if zip_buffer is None:
+        raise RuntimeError(message)
+
+    invoices = len(processor.successful_invoices)
+    return {
+        'name': 'process_batch',
+        'params': {'template': template, 'logo': logo, 'rows': clients * lines_per_client,
+                   'lines_per_client': lines_per_client,
+                   'description_length': description_length, 'workers': workers, 'engine': engine},
+        'invoices': invoices,
+        'seconds': elapsed,
+        'latency_ms': percentiles(samples) if samples else None,
+        'invoices_per_sec': invoices / elapsed,
+        'output_bytes': len(zip_buffer.getvalue()),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def case_key(result):
+    return result['name'] + json.dumps(result['params'], sort_keys=True)
+
+
+def compare(results, baseline_path, threshold):
+    """Return (key, baseline, current) for cases whose throughput dropped by more than threshold"""
+    with open(baseline_path) as f:
+        baseline = {case_key(r): r for r in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(case_key(result))
+        if previous is None:
+            continue
+        if result['invoices_per_sec'] < previous['invoices_per_sec'] * (1 - threshold):
+            regressions.append((case_key(result), previous['invoices_per_sec'], result['invoices_per_sec']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default=None, help="comma separated batch sizes (default: 10..100000)")
+    parser.add_argument('--lines-per-client', default="1,10", help="comma separated lines per client")
+    parser.add_argument('--description-lengths', default="30,200", help="comma separated description lengths")
+    parser.add_argument('--invoice-lines', default="1,10,50", help="line counts for generate_invoice cases")
+    parser.add_argument('--long-invoice-lines', default=None,
+                        help="line counts for single multi-page invoices (default: 1000..20000)")
+    parser.add_argument('--iterations', type=int, default=50, help="generate_invoice runs per case")
+    parser.add_argument('--workers', type=int, default=1, help="process_batch render workers")
+    parser.add_argument('--engines', default="platypus,canvas", help="comma separated rendering engines")
+    parser.add_argument('--quick', action='store_true', help="small sizes only, for a fast check")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help="baseline JSON to compare throughput against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="allowed throughput drop (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    rows = [int(r) for r in args.rows.split(',')] if args.rows else (QUICK_ROWS if args.quick else DEFAULT_ROWS)
+    lines_per_client = [int(n) for n in args.lines_per_client.split(',')]
+    description_lengths = [int(n) for n in args.description_lengths.split(',')]
+    invoice_lines = [int(n) for n in args.invoice_lines.split(',')]
+    if args.long_invoice_lines:
+        long_lines = [int(n) for n in args.long_invoice_lines.split(',')]
+    else:
+        long_lines = QUICK_LONG_LINES if args.quick else DEFAULT_LONG_LINES
+    iterations = min(args.iterations, 10) if args.quick else args.iterations
+    engines = args.engines.split(',')
+
+    results = []
+    invoice_cases = itertools.product(engines, TEMPLATES, (False, True), invoice_lines, description_lengths)
+    for engine, template, logo, lines, description_length in invoice_cases:
+        result = bench_generate_invoice(template, logo, lines, description_length, iterations, engine)
+        results.append(result)
+        print(f"generate_invoice {json.dumps(result['params'])}: "
+              f"p50 {result['latency_ms']['p50']:.1f} ms, {result['invoices_per_sec']:.1f}/s")
+
+    for template, lines in itertools.product(TEMPLATES, long_lines):
+        result = bench_long_invoice(template, lines)
+        results.append(result)
+        print(f"long_invoice {json.dumps(result['params'])}: "
+              f"{result['seconds']:.2f} s, {result['ms_per_line']:.3f} ms/line")
+
+    # Every batch case runs in its own spawned process for a clean peak RSS
+    spawn = multiprocessing.get_context('spawn')
+    batch_cases = itertools.product(engines, TEMPLATES, (False, True), rows, lines_per_client, description_lengths)
+    for engine, template, logo, size, per_client, description_length in batch_cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            result = executor.submit(
+                bench_process_batch, template, logo, size, per_client,
+                description_length, args.workers, engine
+            ).result()
+        results.append(result)
+        print(f"process_batch {json.dumps(result['params'])}: "
+              f"{result['invoices_per_sec']:.1f}/s, {result['peak_rss_mb']:.0f} MB peak")
+
+    import pandas
+    import reportlab
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'reportlab': reportlab.Version,
+            'pandas': pandas.__version__,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for key, before, after in regressions:
+            print(f"REGRESSION {key}: {before:.1f}/s -> {after:.1f}/s")
+        if regressions:
+            return 1
+        print("No throughput regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""Synthetic invoice workloads for the benchmark suite"""
+import random
+from io import BytesIO
+
+import pandas as pd
+from PIL import Image as PILImage
+
+WORDS = (
+    "design development consulting hosting support license maintenance audit "
+    "migration training analytics integration review strategy research content "
+    "monthly annual premium standard custom setup onsite remote hours retainer"
+).split()
+
+COMPANY_DATA = {
+    'company_name': 'Benchmark Supplies LLC',
+    'company_address': '1 Benchmark Way\nTest City, TS 00000',
+    'company_email': 'billing@benchmark.test',
+    'company_phone': '+1 (555) 000-0000',
+    'default_notes': 'Thank you for your business!',
+}
+
+
+def make_description(rng, length):
+    """Random words joined into a description of roughly `length` characters"""
+    words = []
+    while sum(len(w) + 1 for w in words) < length:
+        words.append(rng.choice(WORDS))
+    return " ".join(words)[:length].strip() or "Item"
+
+
+def make_batch_frame(clients, lines_per_client, description_length=30, seed=0, shuffle=True):
+    """Batch CSV frame with `clients` clients of `lines_per_client` rows each"""
+    rng = random.Random(seed)
+    terms = ["Net 30", "Net 15", "Due on Receipt", "Net 45"]
+    rows = []
+    for c in range(clients):
+        for _ in range(lines_per_client):
+            rows.append({
+                'client_name': f"Client {c:06d}",
+                'client_email': f"billing{c}@client.test",
+                'client_address': f"{c} Market Street, Springfield",
+                'client_phone': f"+1-555-{c % 10000:04d}",
+                'item_description': make_description(rng, description_length),
+                'quantity': rng.randint(1, 20),
+                'rate': round(rng.uniform(5, 500), 2),
+                'tax_rate': (0, 8.5, 10)[c % 3],
+                'currency': 'USD',
+                'payment_terms': terms[c % len(terms)],
+                'notes': 'Payment via bank transfer',
+            })
+    if shuffle:
+        rng.shuffle(rows)
+    return pd.DataFrame(rows)
+
+
+def make_invoice_data(lines, description_length=30, seed=0):
+    """Single invoice_data dict with `lines` line items"""
+    rng = random.Random(seed)
+    items = [
+        {'description': make_description(rng, description_length),
+         'quantity': float(rng.randint(1, 20)),
+         'rate': round(rng.uniform(5, 500), 2)}
+        for _ in range(lines)
+    ]
+    subtotal = sum(item['quantity'] * item['rate'] for item in items)
+    tax_amount = subtotal * 0.1
+    return {
+        **{k: v for k, v in COMPANY_DATA.items() if k != 'default_notes'},
+        'client_name': 'Benchmark Client Inc',
+        'client_address': '456 Client Ave\nCity, State 67890',
+        'client_email': 'client@client.test',
+        'invoice_number': 'INV-BENCH-001',
+        'invoice_date': 'January 01, 2026',
+        'due_date': 'January 31, 2026',
+        'currency': 'USD',
+        'items': items,
+        'subtotal': f"{subtotal:.2f}",
+        'tax_rate': 10.0,
+        'tax_amount': f"{tax_amount:.2f}",
+        'total': f"{subtotal + tax_amount:.2f}",
+        'notes': 'Thank you for your business!',
+    }
+
+
+def make_logo_bytes(width=1200, height=600):
+    """PNG logo with some detail so it does not compress to nothing"""
+    image = PILImage.new('RGB', (width, height), (0, 51, 102))
+    pixels = image.load()
+    for x in range(0, width, 3):
+        for y in range(0, height, 7):
+            pixels[x, y] = ((x * 7) % 256, (y * 3) % 256, 180)
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
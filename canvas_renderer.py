@@ -0,0 +1,424 @@
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfbase.pdfdoc import PDFImageXObject
+from reportlab.pdfgen import canvas
+from reportlab.pdfgen.canvas import _digester
+from reportlab.platypus import Flowable
+from io import BytesIO
+import copy
+import math
+import threading
+import weakref
+
+# Geometry of the platypus layout in InvoiceGenerator.build_story: a letter page
+# with 72pt side/top margins, an 18pt bottom margin and 6pt frame padding.
+# Every table is 468pt wide, centred in the 456pt frame.
+PAGE_WIDTH, PAGE_HEIGHT = letter
+FRAME_TOP = PAGE_HEIGHT - 72 - 6
+FRAME_BOTTOM = 18 + 6
+FRAME_X = 72 + 6
+FRAME_WIDTH = PAGE_WIDTH - 144 - 12
+TABLE_X = FRAME_X + (FRAME_WIDTH - 6.5 * inch) / 2
+
+CELL_PADDING = 6
+NORMAL_FONT = 'Helvetica'
+BOLD_FONT = 'Helvetica-Bold'
+NORMAL_SIZE = 10
+NORMAL_LEADING = 12
+TITLE_LEADING = 22
+HEADER_COLUMNS = (4 * inch, 2.5 * inch)
+INFO_COLUMNS = (2.2 * inch, 2.2 * inch, 2.1 * inch)
+ITEM_COLUMNS = (3.5 * inch, 0.75 * inch, 1.25 * inch, 1 * inch)
+
+# Characters that Paragraph would treat as markup
+MARKUP_CHARS = ('<', '>', '&')
+
+# Encoded image XObjects per logo ImageReader, shared by every renderer.
+# Entries go away when the LogoCache drops the reader.
+_LOGO_XOBJECTS = weakref.WeakKeyDictionary()
+_LOGO_XOBJECTS_LOCK = threading.Lock()
+
+
+def _logo_xobjects(reader):
+    """Return (name, image, soft_mask) for a logo, compressing its pixels only once.
+
+    Same objects and name as canvas.drawImage(reader, ..., mask='auto')
+    would create, but drawImage re-encodes the image for every document.
+    Kept once per rl_config.useA85 setting, since compact output stores the
+    pixels without ASCII85.
+    """
+    with _LOGO_XOBJECTS_LOCK:
+        encodings = _LOGO_XOBJECTS.setdefault(reader, {})
+        cached = encodings.get(rl_config.useA85)
+        if cached is None:
+            rgb = reader.getRGBData()
+            alpha = reader._dataA
+            name = _digester(rgb + (alpha.getRGBData() if alpha else b'auto'))
+            image = PDFImageXObject(name, reader, mask='auto')
+            soft_mask = image.__dict__.pop('_smask', None)
+            # ASCII85 output is text; documents would encode it again on every save
+            for obj in (image, soft_mask):
+                if obj is not None and isinstance(obj.streamContent, str):
+                    obj.streamContent = obj.streamContent.encode('latin-1')
+            cached = encodings[rl_config.useA85] = (name, image, soft_mask)
+        return cached
+
+
+def _draw_logo(c, reader, x, y, width, height):
+    """canvas.drawImage for a logo, reusing its encoded XObject"""
+    name, image, soft_mask = _logo_xobjects(reader)
+    doc = c._doc
+    reg_name = doc.getXObjectName(name)
+    if reg_name not in doc.idToObject:
+        # Documents tag the objects they register, so each one gets a copy
+        image = copy.copy(image)
+        c._setXObjects(image)
+        doc.Reference(image, reg_name)
+        doc.addForm(name, image)
+        if soft_mask is not None:
+            soft_mask = copy.copy(soft_mask)
+            c._setXObjects(soft_mask)
+            image.smask = doc.Reference(soft_mask, doc.getXObjectName(soft_mask.name))
+
+    c._currentPageHasImages = 1
+    c.saveState()
+    c.translate(x, y)
+    c.scale(width, height)
+    c._code.append(f"/{reg_name} Do")
+    c.restoreState()
+    c._formsinuse.append(name)
+
+
+def _set_font(c, font, size):
+    # canvas.setFont writes a text block even when nothing changes
+    if c._fontname != font or c._fontsize != size:
+        c.setFont(font, size)
+
+
+def line_amount(item):
+    """An item's quantity × rate rounded half up to cents, as batch totals round it"""
+    # The inner round drops float noise, as tax_rules.to_cents does
+    return math.floor(round(float(item['quantity']) * float(item['rate']) * 100, 6) + 0.5) / 100
+
+
+def tax_lines(invoice_data):
+    """(rate, amount) of each tax row in the totals: one per rate in 'taxes', else the single tax_rate"""
+    if invoice_data.get('taxes'):
+        return [(tax['rate'], tax['amount']) for tax in invoice_data['taxes']]
+    if invoice_data.get('tax_rate'):
+        return [(invoice_data['tax_rate'], invoice_data['tax_amount'])]
+    return []
+
+
+class LayoutUnsupported(Exception):
+    """The invoice needs something only platypus does, e.g. a second page"""
+
+
+def _words(value):
+    text = f"{value}"
+    if any(c in text for c in MARKUP_CHARS):
+        raise LayoutUnsupported("markup characters")
+    return text.split()
+
+
+def _wrap(words, font, size, width):
+    """Greedy line breaking, as Paragraph does for single-font text"""
+    if not words:
+        return ['']
+    space = stringWidth(' ', font, size)
+    lines, current, current_width = [], [], -space
+    for word in words:
+        word_width = stringWidth(word, font, size)
+        if word_width > width:
+            # Paragraph would split the word itself
+            raise LayoutUnsupported("word wider than its cell")
+        new_width = current_width + space + word_width
+        if new_width <= width or not current:
+            current.append(word)
+            current_width = new_width
+        else:
+            lines.append(' '.join(current))
+            current, current_width = [word], word_width
+    lines.append(' '.join(current))
+    return lines
+
+
+def _paragraph_lines(segments, width):
+    """Lines of a Normal paragraph built from <br/>-separated segments.
+
+    Each segment is (bold_label, value). A trailing blank segment adds no
+    line, other blank segments add an empty one. Returns (label, text) pairs.
+    """
+    words = [(label, _words(value)) for label, value in segments]
+    if words and not words[-1][0] and not words[-1][1]:
+        words.pop()
+
+    lines = []
+    for label, value_words in words:
+        if label:
+            text = ' '.join(value_words)
+            line_width = stringWidth(label, BOLD_FONT, NORMAL_SIZE) + stringWidth(' ' + text, NORMAL_FONT, NORMAL_SIZE)
+            if line_width > width:
+                raise LayoutUnsupported("mixed-font line needs wrapping")
+            lines.append((label, text))
+        else:
+            lines.extend((None, line) for line in _wrap(value_words, NORMAL_FONT, NORMAL_SIZE, width))
+    return lines
+
+
+class CanvasLayoutPage(Flowable):
+    """A whole invoice page from CanvasInvoiceRenderer.layout, for platypus documents.
+
+    The page's operations use absolute coordinates, so it must be the first
+    content on a fresh page of a letter document with the generator's margins.
+    """
+
+    def __init__(self, ops):
+        super().__init__()
+        self.ops = ops
+
+    def wrap(self, availWidth, availHeight):
+        # Claim the rest of the frame so nothing else lands on this page
+        return availWidth, availHeight
+
+    def drawOn(self, canv, x, y, _sW=0):
+        CanvasInvoiceRenderer.draw(canv, self.ops)
+
+
+class CanvasInvoiceRenderer:
+    """Draws the invoice layout straight onto a pdfgen canvas.
+
+    Produces the same page as InvoiceGenerator.build_story for single-page
+    invoices, without platypus measuring and wrapping every flowable.
+    render() returns None when an invoice falls outside what the fixed layout
+    covers, and the caller should fall back to platypus.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self.style = template.style
+
+    def render(self, invoice_data, logo_reader=None):
+        try:
+            ops = self.layout(invoice_data, logo_reader)
+        except LayoutUnsupported:
+            return None
+
+        buffer = BytesIO()
+        c = canvas.Canvas(buffer, pagesize=letter, invariant=1)
+        self.draw(c, ops)
+        c.showPage()
+        c.save()
+        return buffer.getvalue()
+
+    def flowable(self, invoice_data, logo_reader=None):
+        """The invoice as a CanvasLayoutPage, or None if it needs platypus"""
+        try:
+            return CanvasLayoutPage(self.layout(invoice_data, logo_reader))
+        except LayoutUnsupported:
+            return None
+
+    @staticmethod
+    def draw(c, ops):
+        c.saveState()
+        c.setLineCap(1)
+        c.setLineJoin(1)
+        for op in ops:
+            op(c)
+        c.restoreState()
+
+    def layout(self, invoice_data, logo_reader=None):
+        """Return the drawing operations for one page, top to bottom"""
+        ops = []
+        y = FRAME_TOP
+        y = self._header(ops, invoice_data, logo_reader, y) - 20
+        y = self._info(ops, invoice_data, y) - 30
+        y = self._items(ops, invoice_data, y)
+        if y - 30 < FRAME_BOTTOM:
+            raise LayoutUnsupported("page overflow")
+        y -= 30
+        if invoice_data.get('notes'):
+            lines = _paragraph_lines([("Notes:", ""), (None, invoice_data['notes'])], FRAME_WIDTH)
+            y = self._draw_lines(ops, lines, FRAME_X, y, colors.black)
+            if y < FRAME_BOTTOM:
+                raise LayoutUnsupported("page overflow")
+        return ops
+
+    def _header(self, ops, invoice_data, logo_reader, top):
+        style = self.style
+        font, size = style['font'], style['header_size']
+        title_width = HEADER_COLUMNS[0] - 2 * CELL_PADDING
+        label_width = HEADER_COLUMNS[1] - 2 * CELL_PADDING
+
+        if logo_reader is not None:
+            left_height = 1 * inch
+        else:
+            title_lines = _wrap(_words(invoice_data['company_name']), font, size, title_width)
+            left_height = len(title_lines) * TITLE_LEADING
+
+        label_size = size + 8
+        label = stringWidth("INVOICE", font, label_size)
+        if label > label_width:
+            raise LayoutUnsupported("header label too wide")
+        row_height = max(left_height, NORMAL_LEADING) + 6
+
+        cell_x = TABLE_X + CELL_PADDING
+        if logo_reader is not None:
+            ops.append(lambda c: _draw_logo(c, logo_reader, cell_x, top - 3 - left_height, 2 * inch, 1 * inch))
+        else:
+            baseline = top - 3 - size
+
+            def draw_title(c):
+                c.setFillColor(style['primary_color'])
+                _set_font(c, font, size)
+                for i, line in enumerate(title_lines):
+                    c.drawString(cell_x, baseline - i * TITLE_LEADING, line)
+            ops.append(draw_title)
+
+        label_x = TABLE_X + HEADER_COLUMNS[0] + CELL_PADDING + label_width - label
+        label_y = top - 3 - label_size
+
+        def draw_label(c):
+            c.setFillColor(style['primary_color'])
+            _set_font(c, font, label_size)
+            c.drawString(label_x, label_y, "INVOICE")
+        ops.append(draw_label)
+        return top - row_height
+
+    def _info(self, ops, invoice_data, top):
+        currency = invoice_data['currency']
+        cells = [
+            [(None, invoice_data['company_name']),
+             (None, invoice_data.get('company_address', '')),
+             (None, invoice_data.get('company_email', '')),
+             (None, invoice_data.get('company_phone', ''))],
+            [("Bill To:", ""),
+             (None, invoice_data['client_name']),
+             (None, invoice_data.get('client_address', '')),
+             (None, invoice_data.get('client_email', ''))],
+            [("Invoice #:", invoice_data['invoice_number']),
+             ("Date:", invoice_data['invoice_date']),
+             ("Due Date:", invoice_data['due_date']),
+             ("Amount Due:", f"{currency} {invoice_data['total']}")],
+        ]
+
+        x = TABLE_X
+        cell_lines = []
+        for segments, width in zip(cells, INFO_COLUMNS):
+            cell_lines.append((x + CELL_PADDING, _paragraph_lines(segments, width - 2 * CELL_PADDING)))
+            x += width
+        row_height = max(len(lines) for _, lines in cell_lines) * NORMAL_LEADING + 6 + 12
+
+        for cell_x, lines in cell_lines:
+            self._draw_lines(ops, lines, cell_x, top - 6, colors.black)
+
+        bottom = top - row_height
+        accent = self.style['accent_color']
+
+        def draw_rule(c):
+            c.setStrokeColor(accent)
+            c.setLineWidth(1)
+            c.line(TABLE_X, bottom, TABLE_X + sum(INFO_COLUMNS), bottom)
+        ops.append(draw_rule)
+        return bottom
+
+    def _items(self, ops, invoice_data, top):
+        style = self.style
+        currency = invoice_data['currency']
+        rows = [['Description', 'Qty', 'Rate', 'Amount']]
+        for item in invoice_data['items']:
+            amount = line_amount(item)
+            rows.append([
+                f"{item['description']}",
+                str(item['quantity']),
+                f"{currency} {item['rate']}",
+                f"{currency} {amount:.2f}"
+            ])
+        rows.append(['', '', 'Subtotal:', f"{currency} {invoice_data['subtotal']}"])
+        for tax_rate, tax_amount in tax_lines(invoice_data):
+            rows.append(['', '', f"Tax ({tax_rate}%):", f"{currency} {tax_amount}"])
+        rows.append(['', '', 'Total:', f"{currency} {invoice_data['total']}"])
+        if any('\n' in cell for row in rows for cell in row):
+            raise LayoutUnsupported("multi-line table cell")
+
+        # Header row is 27pt (12pt bottom padding), every other row 18pt
+        heights = [27] + [18] * (len(rows) - 1)
+        bottom = top - sum(heights)
+        if bottom < FRAME_BOTTOM:
+            raise LayoutUnsupported("page overflow")
+
+        column_x = [TABLE_X]
+        for width in ITEM_COLUMNS:
+            column_x.append(column_x[-1] + width)
+        row_top = [top]
+        for height in heights:
+            row_top.append(row_top[-1] - height)
+
+        # Grid over the header and item rows, as in ItemsTable
+        grid_last = len(invoice_data['items'])
+        last = len(rows) - 1
+
+        def draw(c):
+            c.setFillColor(style['primary_color'])
+            c.rect(TABLE_X, row_top[1], column_x[-1] - TABLE_X, heights[0], stroke=0, fill=1)
+
+            for r, row in enumerate(rows):
+                if r == 0:
+                    fonts = [(style['font'], 11)] * 4
+                    bottom_padding = 12
+                    c.setFillColor(colors.whitesmoke)
+                else:
+                    fonts = [(NORMAL_FONT, 9)] * 4
+                    bottom_padding = 3
+                    if r == last:
+                        fonts[2] = fonts[3] = (BOLD_FONT, 11)
+                    if r == 1:
+                        c.setFillColor(colors.black)
+                for col, text in enumerate(row):
+                    if not text:
+                        continue
+                    font, size = fonts[col]
+                    # Bottom-aligned single line: padding plus one 12pt leading
+                    baseline = row_top[r + 1] + bottom_padding + 12 - size
+                    _set_font(c, font, size)
+                    if col == 0:
+                        c.drawString(column_x[0] + CELL_PADDING, baseline, text)
+                    else:
+                        c.drawRightString(column_x[col + 1] - CELL_PADDING, baseline, text)
+
+            c.setStrokeColor(colors.grey)
+            c.setLineWidth(0.5)
+            grid_top, grid_bottom = row_top[0], row_top[grid_last + 1]
+            for y in row_top[:grid_last + 2]:
+                c.line(column_x[0], y, column_x[-1], y)
+            for x in column_x:
+                c.line(x, grid_top, x, grid_bottom)
+
+            c.setStrokeColor(style['primary_color'])
+            c.setLineWidth(2)
+            c.line(column_x[2], row_top[last], column_x[-1], row_top[last])
+        ops.append(draw)
+        return bottom
+
+    def _draw_lines(self, ops, lines, x, top, color):
+        """Draw Normal-style paragraph lines below top; returns the paragraph bottom"""
+        baseline = top - NORMAL_SIZE
+
+        def draw(c):
+            c.setFillColor(color)
+            for i, (label, text) in enumerate(lines):
+                y = baseline - i * NORMAL_LEADING
+                if label:
+                    _set_font(c, BOLD_FONT, NORMAL_SIZE)
+                    c.drawString(x, y, label)
+                    if text:
+                        _set_font(c, NORMAL_FONT, NORMAL_SIZE)
+                        c.drawString(x + stringWidth(label, BOLD_FONT, NORMAL_SIZE), y, ' ' + text)
+                elif text:
+                    _set_font(c, NORMAL_FONT, NORMAL_SIZE)
+                    c.drawString(x, y, text)
+        ops.append(draw)
+        return top - len(lines) * NORMAL_LEADING
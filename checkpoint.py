@@ -0,0 +1,101 @@
+import json
+import os
+from datetime import datetime
+
+from output_sinks import write_atomic
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+class BatchCheckpoint:
+    """Resumable record of a batch run, kept in a directory.
+
+    manifest.jsonl starts with a header line holding the batch date, so a
+    resumed run numbers and dates its invoices like the first one. It then
+    gets one line per finished invoice, with the invoice number, client key,
+    the hash of everything that went into the PDF, and the PDF's file name
+    in the same directory. Each PDF is written before its manifest line, so
+    a run killed part way leaves at most one unfinished line, which is
+    dropped on resume. Blocks of invoice numbers reserved from a sequencer
+    get a line each too, so a resumed run numbers its invoices the same.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.batch = None
+        self._entries = {}
+        self._number_blocks = []
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        complete = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                complete += len(line)
+                entry = json.loads(line)
+                if 'batch' in entry:
+                    self.batch = entry['batch']
+                elif 'number_block' in entry:
+                    self._number_blocks.append(entry['number_block'])
+                else:
+                    # A re-rendered invoice's later line replaces the earlier one
+                    self._entries[entry['invoice_number']] = entry
+        # Drop an unfinished last line so new lines start on a line of their own
+        if complete < os.path.getsize(self.path):
+            os.truncate(self.path, complete)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def invoice_date(self, default):
+        """The batch date stored by the first run, or default, which is stored for later runs"""
+        if self.batch is None:
+            self.batch = {'invoice_date': default.isoformat()}
+            self._write_line({'batch': self.batch})
+        return datetime.fromisoformat(self.batch['invoice_date'])
+
+    def number_blocks(self, series):
+        """(first, last) of each block of invoice numbers earlier runs reserved in series, in order"""
+        return [(block['first'], block['last']) for block in self._number_blocks if block['series'] == series]
+    
+    def record_number_block(self, series, first, last):
+        block = {'series': series, 'first': first, 'last': last}
+        self._number_blocks.append(block)
+        self._write_line({'number_block': block})
+    
+    def lookup(self, invoice_data, input_hash):
+        """Path of this invoice's PDF if a previous run finished it from the same input, else None"""
+        entry = self._entries.get(invoice_data['invoice_number'])
+        if entry is None or entry['input_hash'] != input_hash:
+            return None
+        if entry['client'] != [invoice_data['client_name'], invoice_data['client_email']]:
+            return None
+        path = os.path.join(self.directory, entry['output'])
+        return path if os.path.exists(path) else None
+
+    def record(self, invoice_data, input_hash, filename, pdf_bytes):
+        """Store a finished invoice's PDF, then its manifest line"""
+        write_atomic(os.path.join(self.directory, filename), pdf_bytes)
+
+        entry = {
+            'invoice_number': invoice_data['invoice_number'],
+            'client': [invoice_data['client_name'], invoice_data['client_email']],
+            'input_hash': input_hash,
+            'output': filename,
+        }
+        self._entries[entry['invoice_number']] = entry
+        self._write_line(entry)
+
+    def _write_line(self, entry):
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,248 @@
+"""Generate invoices from the command line, without the web app.
+
+Usage:
+    python cli.py batch input.csv --template corporate_blue --out invoices/
+    python cli.py batch input.csv --format pdf --workers 4 --logo logo.png --company company.json
+    python cli.py batch input.csv --format directory --out invoices/
+    python cli.py batch input.csv --checkpoint nightly.ckpt --out invoices/
+    python cli.py batch input.csv --tax-rules rules.json
+    python cli.py batch input.csv --compact --logo logo.png
+    python cli.py batch input.csv --sequence-db invoice_sequence.db
+    python cli.py batch input.csv --archive invoice_archive
+    python cli.py invoice invoice.json --out invoice.pdf
+    python cli.py templates
+    python cli.py audit --sequence-db invoice_sequence.db
+    python cli.py archive --client acme --from 2024-01-01
+    python cli.py archive --number INV-20240115-007 --out invoice.pdf
+
+--company is a JSON file with company_name, company_address, company_email,
+company_phone and default_notes; invoice.json holds one invoice's data as
+passed to InvoiceGenerator.generate_invoice. --tax-rules is a JSON file of tax
+rates per jurisdiction and category and FX rates, as read by
+tax_rules.TaxRules.from_json. --sequence-db numbers the invoices from the
+SQLite sequence the app uses, so they never repeat across runs; `audit`
+lists the numbers it reserved but never issued. --archive stores and indexes
+every PDF in an archive directory, which `archive` searches and copies PDFs
+out of without rendering them again. Exits with status 1 if the
+batch or invoice fails.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+# pandas and reportlab take most of a second to import, so they are only
+# loaded by the commands that render; --help and argument errors stay fast
+
+COMPANY_FIELDS = ('company_name', 'company_address', 'company_email', 'company_phone', 'default_notes')
+# Same as invoice_generator.ENGINES, repeated to keep argument parsing import-free
+ENGINES = ("platypus", "canvas")
+# Same as input_readers.READERS, repeated for the same reason
+INPUT_FORMATS = ("csv", "parquet", "arrow", "feather", "xlsx")
+
+
+def load_json(path):
+    if path == '-':
+        return json.load(sys.stdin)
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_logo(path):
+    if not path:
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def run_batch(args):
+    from batch_processor import BatchInvoiceProcessor
+    from metrics import METRICS
+    from invoice_archive import InvoiceArchive
+    from sequencer import InvoiceSequencer
+    from tax_rules import TaxRules
+
+    if args.metrics:
+        METRICS.enabled = True
+
+    company = load_json(args.company) if args.company else {}
+    company_data = {field: company.get(field, '') for field in COMPANY_FIELDS}
+
+    processor = BatchInvoiceProcessor(
+        style_template=args.template, workers=args.workers, engine=args.engine,
+        tax_rules=TaxRules.from_json(args.tax_rules) if args.tax_rules else None, compact=args.compact,
+        sequencer=InvoiceSequencer(args.sequence_db) if args.sequence_db else None,
+        archive=InvoiceArchive(args.archive) if args.archive else None
+    )
+
+    os.makedirs(args.out, exist_ok=True)
+    # PDFs are written to the file (or directory) as they render
+    path = os.path.join(args.out, f"invoices_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    if args.format != 'directory':
+        path += f".{args.format}"
+    result, message = processor.process_batch(
+        args.input, company_data, read_logo(args.logo), chunksize=args.chunksize,
+        presorted=args.presorted, output_mode=args.format, output=path, input_format=args.input_format,
+        checkpoint_dir=args.checkpoint
+    )
+    if result is None:
+        if args.format != 'directory' and os.path.exists(path):
+            os.remove(path)
+        print(message, file=sys.stderr)
+        return 1
+
+    if args.metrics:
+        with open(args.metrics, 'w') as f:
+            f.write(METRICS.to_json())
+    print(message)
+    if processor.output_stats:
+        stats = processor.output_stats
+        print(f"Compact output: {stats['archive_bytes']} archive bytes from {stats['pdf_bytes']} PDF bytes, "
+              f"{stats['stored']} PDFs stored, about {stats['compress_seconds_saved']:.2f}s of compression saved")
+    print(path)
+    return 0
+
+
+def run_invoice(args):
+    from invoice_generator import InvoiceGenerator
+
+    invoice_data = load_json(args.input)
+    generator = InvoiceGenerator(args.template, engine=args.engine, compact=args.compact)
+    try:
+        pdf_bytes = generator.generate_invoice(invoice_data, read_logo(args.logo)).getvalue()
+    except KeyError as e:
+        print(f"Invoice data is missing {e}", file=sys.stderr)
+        return 1
+    with open(args.out, 'wb') as f:
+        f.write(pdf_bytes)
+    if args.archive:
+        from invoice_archive import InvoiceArchive
+
+        archive = InvoiceArchive(args.archive)
+        archive.add(invoice_data, pdf_bytes)
+        archive.close()
+    print(args.out)
+    return 0
+
+
+def run_audit(args):
+    from sequencer import InvoiceSequencer
+    
+    gaps = InvoiceSequencer(args.sequence_db).audit(args.series)
+    for gap in gaps:
+        print(f"{gap['series']} {gap['first']}-{gap['last']}: {gap['reason']}")
+    if not gaps:
+        print("No gaps")
+    if args.archive:
+        from invoice_archive import InvoiceArchive
+
+        reissued = InvoiceArchive(args.archive).audit()
+        for problem in reissued:
+            print(f"{problem['invoice_number']}: {problem['reason']} ({', '.join(problem['clients'])})")
+        if not reissued:
+            print("No number archived with more than one PDF")
+    return 0
+
+
+def run_archive(args):
+    from invoice_archive import InvoiceArchive
+    from tax_rules import format_cents
+
+    archive = InvoiceArchive(args.archive)
+    rows = archive.search(
+        limit=args.limit, invoice_number=args.number, client=args.client, currency=args.currency,
+        date_from=args.date_from, date_to=args.date_to
+    )
+    if args.out:
+        if not args.number or not rows:
+            print("--out needs the --number of an archived invoice", file=sys.stderr)
+            return 1
+        with open(args.out, 'wb') as f:
+            f.write(archive.read_pdf(archive.get(args.number)['pdf_sha256']))
+        print(args.out)
+        return 0
+    for row in rows:
+        print(f"{row['invoice_number']}  {row['invoice_date']}  {row['client_name']}  "
+              f"{row['currency']} {format_cents(row['total_cents'])}")
+    if not rows:
+        print("No archived invoices match")
+    return 0
+
+
+def run_templates(args):
+    from templates import template_names
+
+    for name in template_names():
+        print(name)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='invoice-gen', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_style_options(command):
+        command.add_argument('--template', default='modern_minimal', help="style template (see `templates`)")
+        command.add_argument('--engine', choices=ENGINES, default='platypus', help="rendering engine")
+        command.add_argument('--logo', help="logo image file")
+        command.add_argument('--compact', action='store_true',
+                             help="smaller PDFs with binary streams; in ZIPs, store PDFs that would not shrink")
+
+    batch = commands.add_parser('batch', help="one invoice per client from a CSV or other batch file")
+    batch.add_argument('input', help="CSV, XLSX, Parquet or Arrow file")
+    batch.add_argument('--input-format', choices=INPUT_FORMATS,
+                       help="input file format (default: from the file extension)")
+    batch.add_argument('--out', default='.', help="directory for the output file (default: current)")
+    batch.add_argument('--format', choices=('zip', 'pdf', 'tar', 'directory'), default='zip',
+                       help="zip, tar or directory: one PDF per client; pdf: one merged PDF")
+    batch.add_argument('--company', help="JSON file with the company details")
+    batch.add_argument('--workers', type=int, default=1, help="render processes (default: 1)")
+    batch.add_argument('--chunksize', type=int, help="stream the CSV in chunks of this many rows")
+    batch.add_argument('--presorted', action='store_true', help="each client's rows are contiguous")
+    batch.add_argument('--checkpoint', help="directory that keeps finished invoices; rerun with it to resume (not with pdf)")
+    batch.add_argument('--tax-rules', help="JSON file with tax rates per jurisdiction and FX rates")
+    batch.add_argument('--sequence-db', help="SQLite file to take invoice numbers from (default: each batch from 001)")
+    batch.add_argument('--archive', help="archive directory to store and index every PDF in (not with pdf)")
+    batch.add_argument('--metrics', help="write stage timings as JSON to this file")
+    add_style_options(batch)
+    batch.set_defaults(run=run_batch)
+
+    invoice = commands.add_parser('invoice', help="a single invoice from JSON")
+    invoice.add_argument('input', help="JSON file with the invoice data, or - for stdin")
+    invoice.add_argument('--out', default='invoice.pdf', help="PDF file to write")
+    invoice.add_argument('--archive', help="archive directory to also store and index the PDF in")
+    add_style_options(invoice)
+    invoice.set_defaults(run=run_invoice)
+
+    audit = commands.add_parser('audit', help="list invoice numbers that were reserved but never issued")
+    audit.add_argument('--sequence-db', default='invoice_sequence.db', help="SQLite sequence file")
+    audit.add_argument('--series', help="only this series, e.g. INV-20240115")
+    audit.add_argument('--archive', help="also list numbers this archive directory holds more than one PDF for")
+    audit.set_defaults(run=run_audit)
+
+    archive = commands.add_parser('archive', help="search archived invoices, or copy one's PDF out")
+    archive.add_argument('--archive', default='invoice_archive', help="archive directory")
+    archive.add_argument('--number', help="invoice number")
+    archive.add_argument('--client', help="client name prefix, any case")
+    archive.add_argument('--currency', help="currency code")
+    archive.add_argument('--from', dest='date_from', help="earliest invoice date, YYYY-MM-DD")
+    archive.add_argument('--to', dest='date_to', help="latest invoice date, YYYY-MM-DD")
+    archive.add_argument('--limit', type=int, default=100, help="most invoices to list (default: 100)")
+    archive.add_argument('--out', help="write the PDF of invoice --number to this file")
+    archive.set_defaults(run=run_archive)
+
+    templates = commands.add_parser('templates', help="list style templates")
+    templates.set_defaults(run=run_templates)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import os
+import pickle
+import tempfile
+import pandas as pd
+
+CLIENT_KEY = ['client_name', 'client_email']
+DEFAULT_CHUNK_ROWS = 50000
+
+
+def _prepare_chunk(chunk):
+    """Drop rows without a client key (groupby skips them too) and normalise keys to str"""
+    chunk = chunk.dropna(subset=CLIENT_KEY)
+    if chunk.empty:
+        return chunk
+    chunk = chunk.copy()
+    chunk[CLIENT_KEY] = chunk[CLIENT_KEY].astype(str)
+    return chunk
+
+
+def _key_before(frame, name, email):
+    """Boolean mask of rows whose (client_name, client_email) sorts before the given key"""
+    names = frame['client_name']
+    return (names < name) | ((names == name) & (frame['client_email'] < email))
+
+
+def iter_sorted_groups(chunks):
+    """Yield frames of complete client groups from chunks already ordered by client.
+
+    Each client's rows must be contiguous in the input. Rows of the client at
+    the end of a chunk are carried into the next one until the client changes.
+    """
+    carry = None
+    finished = set()
+
+    for chunk in chunks:
+        chunk = _prepare_chunk(chunk)
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        if chunk.empty:
+            continue
+
+        # Everything before the trailing run of the last client is complete
+        last_name, last_email = chunk['client_name'].iat[-1], chunk['client_email'].iat[-1]
+        other = ((chunk['client_name'] != last_name) | (chunk['client_email'] != last_email)).to_numpy()
+        split = other.nonzero()[0][-1] + 1 if other.any() else 0
+        ready, carry = chunk.iloc[:split], chunk.iloc[split:]
+
+        if not ready.empty:
+            keys = set(zip(ready['client_name'], ready['client_email']))
+            if keys & finished:
+                raise ValueError("CSV rows are not grouped by client; process it with presorted=False")
+            finished.update(keys)
+            yield ready
+
+    if carry is not None and not carry.empty:
+        if (carry['client_name'].iat[0], carry['client_email'].iat[0]) in finished:
+            raise ValueError("CSV rows are not grouped by client; process it with presorted=False")
+        yield carry
+
+
+def _write_run(chunk, path, page_rows):
+    """Write one sorted run as a sequence of pickled pages"""
+    with open(path, 'wb') as f:
+        for start in range(0, len(chunk), page_rows):
+            pickle.dump(chunk.iloc[start:start + page_rows], f, pickle.HIGHEST_PROTOCOL)
+
+
+def _iter_pages(path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def iter_spilled_groups(chunks, spill_dir=None, page_rows=2000):
+    """Yield frames of complete client groups from unsorted chunks via an external sort.
+
+    Every chunk is sorted by client and spilled to disk as a run of small pages.
+    The runs are then merged page by page, so only one page per run is held in
+    memory. Groups come out in the same order as DataFrame.groupby, and rows
+    keep their original order within each client.
+    """
+    with tempfile.TemporaryDirectory(prefix='invoice_spill_', dir=spill_dir) as tmp_dir:
+        runs = []
+        for chunk in chunks:
+            chunk = _prepare_chunk(chunk)
+            if chunk.empty:
+                continue
+            path = os.path.join(tmp_dir, f'run_{len(runs):05d}.pkl')
+            _write_run(chunk.sort_values(CLIENT_KEY, kind='stable'), path, page_rows)
+            runs.append(_iter_pages(path))
+        if not runs:
+            return
+
+        buffers = [next(run) for run in runs]
+        has_more = [True] * len(runs)
+
+        while True:
+            # Top up empty buffers so every unfinished run has a visible last key
+            for i, run in enumerate(runs):
+                if has_more[i] and buffers[i].empty:
+                    page = next(run, None)
+                    if page is None:
+                        has_more[i] = False
+                    else:
+                        buffers[i] = page
+
+            # A run that still has pages may hold more rows for the last key in its
+            # buffer, so only keys before the smallest such key are complete
+            cutoff = min(
+                ((buf['client_name'].iat[-1], buf['client_email'].iat[-1])
+                 for buf, more in zip(buffers, has_more) if more),
+                default=None
+            )
+
+            ready = []
+            for i, buf in enumerate(buffers):
+                mask = _key_before(buf, *cutoff) if cutoff is not None else slice(None)
+                ready.append(buf[mask])
+                buffers[i] = buf.iloc[:0] if cutoff is None else buf[~mask]
+
+            ready = pd.concat(ready, ignore_index=True)
+            if not ready.empty:
+                yield ready.sort_values(CLIENT_KEY, kind='stable')
+            if cutoff is None:
+                return
+
+            # Pull the next page into every run that was holding back the cutoff
+            for i, run in enumerate(runs):
+                buf = buffers[i]
+                if has_more[i] and (buf['client_name'].iat[-1], buf['client_email'].iat[-1]) == cutoff:
+                    page = next(run, None)
+                    if page is None:
+                        has_more[i] = False
+                    else:
+                        buffers[i] = pd.concat([buf, page], ignore_index=True)
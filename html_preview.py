@@ -0,0 +1,184 @@
+"""HTML preview of an invoice, laid out like InvoiceGenerator.build_story.
+
+The preview uses the same tables, column widths, spacing, template colors
+and fonts as the PDF, sized in points, so the app can redraw it on every
+rerun without a ReportLab build. Each part is built by a cached function
+of the fields it shows. When a line item changes, only that row's HTML is
+built again; the company block, header and other rows come from the cache.
+
+Differences from the PDF: the invoice is one continuous page (no
+brought/carried forward rows), and field text is shown as typed rather
+than read as ReportLab paragraph markup.
+"""
+import base64
+from functools import lru_cache
+from html import escape
+
+from reportlab.lib import colors
+
+from canvas_renderer import line_amount, tax_lines
+from invoice_generator import HEADER_COL_WIDTHS, INFO_COL_WIDTHS, ITEM_COL_WIDTHS, LOGO_HEIGHT, LOGO_WIDTH
+from templates import DEFAULT_TEMPLATE, TEMPLATE_KEYS, get_template
+
+# Letter page width and the document's side margins, in points
+PAGE_WIDTH = 612
+PAGE_MARGIN = 72
+
+# ReportLab's standard fonts as CSS font-family, weight and style
+FONT_FAMILIES = {
+    'Helvetica': "Helvetica, Arial, sans-serif",
+    'Times': "'Times New Roman', Times, serif",
+    'Courier': "'Courier New', Courier, monospace",
+}
+
+# Leading bytes of the logo formats the app accepts
+LOGO_MIME_TYPES = (
+    (b'\x89PNG', 'image/png'),
+    (b'\xff\xd8', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+)
+
+# Distinct line items whose row HTML is kept
+ITEM_ROW_CACHE_ENTRIES = 1024
+
+
+def css_font(font):
+    """CSS declarations for a ReportLab standard font name, e.g. 'Helvetica-Bold'"""
+    family, _, variant = font.partition('-')
+    weight = 'bold' if 'Bold' in variant else 'normal'
+    style = 'italic' if 'Oblique' in variant or 'Italic' in variant else 'normal'
+    return (f"font-family: {FONT_FAMILIES.get(family, FONT_FAMILIES['Helvetica'])}; "
+            f"font-weight: {weight}; font-style: {style};")
+
+
+def css_color(color):
+    return '#' + color.hexval()[2:]
+
+
+def _css_value(value):
+    return css_color(value) if isinstance(value, colors.Color) else value
+
+
+def _text(value):
+    return escape(f"{value}")
+
+
+@lru_cache(maxsize=16)
+def _template_css(spec):
+    style = dict(zip(TEMPLATE_KEYS, spec))
+    primary, accent = style['primary_color'], style['accent_color']
+    body = css_font('Helvetica')
+    return f"""<style>
+.invoice-preview {{ width: {PAGE_WIDTH}pt; box-sizing: border-box; padding: {PAGE_MARGIN}pt;
+    background: #fff; color: #000; box-shadow: 0 1px 6px rgba(0, 0, 0, 0.25); margin: 0 auto;
+    {body} font-size: 10pt; line-height: 12pt; }}
+.invoice-preview table {{ border-collapse: collapse; table-layout: fixed; margin: 0 auto; }}
+.invoice-preview td, .invoice-preview th {{ padding: 3pt 6pt; }}
+.invoice-preview .header td {{ vertical-align: top; }}
+.invoice-preview .title {{ {css_font(style['font'])} font-size: {style['header_size']}pt; line-height: 22pt;
+    color: {primary}; }}
+.invoice-preview .label {{ {css_font(style['font'])} font-size: {style['header_size'] + 8}pt; line-height: 1.2;
+    color: {primary}; text-align: right; }}
+.invoice-preview .info {{ margin-top: 20pt; }}
+.invoice-preview .info td {{ vertical-align: top; padding: 6pt 6pt 12pt; border-bottom: 1pt solid {accent}; }}
+.invoice-preview .items {{ margin-top: 30pt; }}
+.invoice-preview .items th {{ {css_font(style['font'])} font-size: 11pt; line-height: 12pt; color: {css_color(colors.whitesmoke)};
+    background: {primary}; padding-bottom: 12pt; vertical-align: bottom; }}
+.invoice-preview .items td {{ font-size: 9pt; vertical-align: bottom; white-space: pre-line; }}
+.invoice-preview .items th, .invoice-preview .items .item td {{ border: 0.5pt solid {css_color(colors.grey)}; }}
+.invoice-preview .items .num {{ text-align: right; }}
+.invoice-preview .items th:first-child {{ text-align: left; }}
+.invoice-preview .items .total td.num {{ {css_font('Helvetica-Bold')} font-size: 11pt; border-top: 2pt solid {primary}; }}
+.invoice-preview .notes {{ margin-top: 30pt; white-space: normal; }}
+</style>"""
+
+
+def template_css(template_name=DEFAULT_TEMPLATE):
+    """The preview's stylesheet for a style template, built once per template definition"""
+    style = get_template(template_name).style
+    return _template_css(tuple(_css_value(style[key]) for key in TEMPLATE_KEYS))
+
+
+@lru_cache(maxsize=4)
+def logo_data_uri(logo_bytes):
+    """A logo file's bytes as a data: URI for an <img>"""
+    mime = next((mime for magic, mime in LOGO_MIME_TYPES if logo_bytes.startswith(magic)), 'image/png')
+    return f"data:{mime};base64,{base64.b64encode(logo_bytes).decode('ascii')}"
+
+
+@lru_cache(maxsize=16)
+def _header_html(company_name, logo_uri):
+    if logo_uri is not None:
+        left = f'<img src="{logo_uri}" style="width: {LOGO_WIDTH:g}pt; height: {LOGO_HEIGHT:g}pt; display: block;">'
+    else:
+        left = f'<div class="title">{_text(company_name)}</div>'
+    return (f'<table class="header" style="width: {sum(HEADER_COL_WIDTHS):g}pt">'
+            f'<col style="width: {HEADER_COL_WIDTHS[0]:g}pt"><col style="width: {HEADER_COL_WIDTHS[1]:g}pt">'
+            f'<tr><td>{left}</td><td><div class="label">INVOICE</div></td></tr></table>')
+
+
+@lru_cache(maxsize=64)
+def _lines_html(*segments):
+    """Paragraph of (bold label, value) lines; as in the PDF, a trailing empty line adds nothing"""
+    lines = []
+    for label, value in segments:
+        text = _text(value)
+        lines.append(f"<b>{_text(label)}</b> {text}" if label else text)
+    if lines and not lines[-1]:
+        lines.pop()
+    return "<br>".join(lines)
+
+
+@lru_cache(maxsize=ITEM_ROW_CACHE_ENTRIES)
+def _item_row_html(description, quantity, rate, currency):
+    amount = line_amount({'quantity': quantity, 'rate': rate})
+    return (f'<tr class="item"><td>{_text(description)}</td><td class="num">{_text(quantity)}</td>'
+            f'<td class="num">{_text(currency)} {_text(rate)}</td><td class="num">{_text(currency)} {amount:.2f}</td></tr>')
+
+
+def _totals_row_html(label, value, css_class="subtotal"):
+    return (f'<tr class="{css_class}"><td></td><td></td>'
+            f'<td class="num">{_text(label)}</td><td class="num">{_text(value)}</td></tr>')
+
+
+def preview_html(invoice_data, template_name=DEFAULT_TEMPLATE, logo=None):
+    """The invoice generate_invoice would render from invoice_data, as an HTML fragment
+
+    logo: the logo file's bytes, or None for the company name as the title.
+    """
+    currency = invoice_data['currency']
+    logo_uri = logo_data_uri(logo) if logo else None
+
+    company = _lines_html(
+        (None, invoice_data['company_name']), (None, invoice_data.get('company_address', '')),
+        (None, invoice_data.get('company_email', '')), (None, invoice_data.get('company_phone', '')),
+    )
+    client = _lines_html(
+        ("Bill To:", ""), (None, invoice_data['client_name']),
+        (None, invoice_data.get('client_address', '')), (None, invoice_data.get('client_email', '')),
+    )
+    meta = _lines_html(
+        ("Invoice #:", invoice_data['invoice_number']), ("Date:", invoice_data['invoice_date']),
+        ("Due Date:", invoice_data['due_date']), ("Amount Due:", f"{currency} {invoice_data['total']}"),
+    )
+    info = (f'<table class="info" style="width: {sum(INFO_COL_WIDTHS):g}pt">'
+            + ''.join(f'<col style="width: {width:g}pt">' for width in INFO_COL_WIDTHS)
+            + f'<tr><td>{company}</td><td>{client}</td><td>{meta}</td></tr></table>')
+
+    rows = [_item_row_html(item['description'], item['quantity'], item['rate'], currency)
+            for item in invoice_data['items']]
+    rows.append(_totals_row_html("Subtotal:", f"{currency} {invoice_data['subtotal']}"))
+    for tax_rate, tax_amount in tax_lines(invoice_data):
+        rows.append(_totals_row_html(f"Tax ({tax_rate}%):", f"{currency} {tax_amount}"))
+    rows.append(_totals_row_html("Total:", f"{currency} {invoice_data['total']}", "total"))
+    items = (f'<table class="items" style="width: {sum(ITEM_COL_WIDTHS):g}pt">'
+             + ''.join(f'<col style="width: {width:g}pt">' for width in ITEM_COL_WIDTHS)
+             + '<tr><th>Description</th><th class="num">Qty</th><th class="num">Rate</th><th class="num">Amount</th></tr>'
+             + ''.join(rows) + '</table>')
+
+    notes = ''
+    if invoice_data.get('notes'):
+        notes = f'<div class="notes"><b>Notes:</b><br>{_text(invoice_data["notes"])}</div>'
+
+    return (template_css(template_name) + '<div class="invoice-preview">'
+            + _header_html(invoice_data['company_name'], logo_uri) + info + items + notes + '</div>')
@@ -0,0 +1,326 @@
+import os
+from importlib.util import find_spec
+import numpy as np
+import pandas as pd
+
+# Every column process_batch reads, with the dtype it is read as. Other
+# columns in the input are never loaded.
+TEXT_COLUMNS = (
+    'client_name', 'client_email', 'client_address', 'client_phone',
+    'item_description', 'currency', 'payment_terms', 'notes', 'jurisdiction', 'tax_category',
+)
+NUMERIC_COLUMNS = ('quantity', 'rate', 'tax_rate')
+SCHEMA = {
+    **{column: 'object' for column in TEXT_COLUMNS},
+    **{column: 'float64' for column in NUMERIC_COLUMNS},
+}
+REQUIRED_COLUMNS = ('client_name', 'client_email', 'item_description', 'quantity', 'rate')
+
+# Rows per read when no chunksize is given
+PARQUET_BATCH_ROWS = 65536
+XLSX_BATCH_ROWS = 50000
+
+
+# Text dtypes for reading numeric columns as written, so bad values can be
+# reported per row instead of failing the whole read
+RAW_SCHEMA = {column: 'object' for column in SCHEMA}
+
+# Active ISO 4217 currency codes
+CURRENCIES = frozenset("""
+    AED AFN ALL AMD ANG AOA ARS AUD AWG AZN BAM BBD BDT BGN BHD BIF BMD BND BOB BRL BSD BTN BWP BYN
+    BZD CAD CDF CHF CLP CNY COP CRC CUP CVE CZK DJF DKK DOP DZD EGP ERN ETB EUR FJD FKP GBP GEL GHS
+    GIP GMD GNF GTQ GYD HKD HNL HTG HUF IDR ILS INR IQD IRR ISK JMD JOD JPY KES KGS KHR KMF KPW KRW
+    KWD KYD KZT LAK LBP LKR LRD LSL LYD MAD MDL MGA MKD MMK MNT MOP MRU MUR MVR MWK MXN MYR MZN NAD
+    NGN NIO NOK NPR NZD OMR PAB PEN PGK PHP PKR PLN PYG QAR RON RSD RUB RWF SAR SBD SCR SDG SEK SGD
+    SHP SLE SOS SRD SSP STN SVC SYP SZL THB TJS TMT TND TOP TRY TTD TWD TZS UAH UGX USD UYU UZS VES
+    VND VUV WST XAF XCD XOF XPF YER ZAR ZMW ZWL
+""".split())
+
+# payment_terms accepted besides "<word> <days>", e.g. "Net 30"
+DUE_ON_RECEIPT = "Due on Receipt"
+
+
+def validate_frame(df):
+    """Check that a batch frame has the required columns; returns (is_valid, message)
+
+    Problems in individual rows are found by validate_rows.
+    """
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+
+    if missing_columns:
+        return False, f"Missing required columns: {', '.join(missing_columns)}"
+
+    return True, "Valid"
+
+
+def validate_rows(df, tax_rules=None):
+    """Check every row in one vectorized pass
+
+    Returns (df, errors). df has the numeric columns as float64, with NaN
+    where a value is missing or invalid. errors has one dict per problem,
+    ordered by row: row (the spreadsheet row number, counting the header as
+    row 1), client, client_email, column and reason.
+
+    With tax_rules (a tax_rules.TaxRules), rows it has no tax or FX rate
+    for are errors too.
+    """
+    df = df.copy()
+    # (mask of bad rows, column, reason, the values to quote in the reason or None)
+    problems = []
+
+    for column in ('client_name', 'client_email', 'item_description'):
+        problems.append((df[column].isna().to_numpy(), column, f"missing {column}", None))
+
+    for column in NUMERIC_COLUMNS:
+        if column not in df.columns:
+            continue
+        raw = df[column]
+        numbers = raw if pd.api.types.is_float_dtype(raw) else pd.to_numeric(raw, errors='coerce').astype('float64')
+        invalid = (raw.notna() & ~np.isfinite(numbers)).to_numpy()
+        problems.append((invalid, column, f"non-numeric {column}", raw))
+        if column in REQUIRED_COLUMNS:
+            problems.append((raw.isna().to_numpy(), column, f"missing {column}", None))
+        problems.append(((numbers < 0).to_numpy(), column, f"negative {column}", raw))
+        df[column] = numbers.where(~invalid)
+
+    if 'currency' in df.columns:
+        currency = df['currency']
+        unknown = (currency.notna() & ~currency.isin(CURRENCIES)).to_numpy()
+        problems.append((unknown, 'currency', "unknown currency", currency))
+
+    if 'payment_terms' in df.columns:
+        # Same rule as the due date calculation: "Due on Receipt", or days as the second word.
+        # A batch has few distinct terms, so each is parsed once.
+        terms = df['payment_terms']
+        distinct = pd.Series(terms.dropna().unique()).astype(str)
+        days = distinct.str.split().str[1]
+        parsed = (distinct == DUE_ON_RECEIPT) | days.str.fullmatch(r'[+-]?\d+', na=False)
+        unparseable = (terms.notna() & ~terms.astype(str).isin(set(distinct[parsed]))).to_numpy()
+        problems.append((unparseable, 'payment_terms', "unparseable payment terms", terms))
+
+    if tax_rules is not None:
+        problems.extend(tax_rules.problems(df))
+
+    return df, _row_errors(df, problems)
+
+
+def _row_errors(df, problems):
+    """Error dicts, ordered by row, for (mask of bad rows, column, reason, values or None) problems
+
+    values, when given, are the frame's values quoted after the reason.
+    """
+    # Row numbers as in the input file, when the frame still has its read index
+    if pd.api.types.is_integer_dtype(df.index):
+        row_numbers = df.index.to_numpy() + 2
+    else:
+        row_numbers = np.arange(len(df)) + 2
+
+    errors = []
+    for mask, column, reason, values in problems:
+        if not mask.any():
+            continue
+        rows = row_numbers[mask]
+        names = df['client_name'].to_numpy()[mask]
+        emails = df['client_email'].to_numpy()[mask]
+        quoted = values.to_numpy()[mask] if values is not None else None
+        for i, row in enumerate(rows):
+            errors.append({
+                'row': int(row),
+                'client': names[i],
+                'client_email': emails[i],
+                'column': column,
+                'reason': f"{reason} '{quoted[i]}'" if quoted is not None else reason,
+            })
+    errors.sort(key=lambda error: error['row'])
+    return errors
+
+
+def apply_schema(df):
+    """Keep the SCHEMA columns and give them its dtypes
+
+    Text values that were read as numbers or dates (e.g. a phone number in a
+    spreadsheet) become strings; missing values stay NaN. Numeric columns
+    with values that are not numbers are left as they are for validate_rows
+    to report.
+    """
+    df = df[[column for column in df.columns if column in SCHEMA]].copy()
+    for column in df.columns:
+        values = df[column]
+        if SCHEMA[column] == 'float64':
+            try:
+                df[column] = values.astype('float64')
+            except (TypeError, ValueError):
+                df[column] = values.astype(object)
+        elif pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+            df[column] = values.where(values.isna(), values.astype(str)).astype(object)
+    return df
+
+
+def read_csv(source, chunksize=None):
+    """CSV with the SCHEMA dtypes instead of inferred ones, loading only SCHEMA columns
+
+    If a numeric column holds text, the file is read again with every column
+    as text so validate_rows can report the bad rows. Chunked reads always
+    read text, since a chunk that fails cannot be read again.
+    """
+    def read(dtype):
+        return pd.read_csv(source, usecols=lambda column: column in SCHEMA, dtype=dtype, chunksize=chunksize)
+
+    if chunksize:
+        return read(RAW_SCHEMA)
+    start = source.tell() if hasattr(source, 'seek') else None
+    try:
+        return read(SCHEMA)
+    except ValueError:
+        if start is None and not isinstance(source, (str, os.PathLike)):
+            raise
+        if start is not None:
+            source.seek(start)
+        return read(RAW_SCHEMA)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Reading Parquet or Arrow input requires pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def _schema_columns(schema):
+    """Names of the SCHEMA columns in an Arrow schema, and the schema narrowed to them"""
+    pyarrow = _pyarrow()
+    columns = [name for name in schema.names if name in SCHEMA]
+    return columns, pyarrow.schema([schema.field(name) for name in columns])
+
+
+def _arrow_frames(batches, schema, chunksize):
+    """DataFrames from Arrow record batches; one frame, or an iterator of frames if chunksize is set"""
+    pyarrow = _pyarrow()
+    if chunksize:
+        return _numbered(apply_schema(batch.to_pandas()) for batch in batches)
+    return apply_schema(pyarrow.Table.from_batches(list(batches), schema).to_pandas())
+
+
+def _numbered(frames):
+    """Give consecutive frames one running row index, as chunked read_csv does"""
+    start = 0
+    for frame in frames:
+        frame.index = pd.RangeIndex(start, start + len(frame))
+        start += len(frame)
+        yield frame
+
+
+def read_parquet(source, chunksize=None):
+    """Parquet, reading only the SCHEMA columns present in the file"""
+    pyarrow = _pyarrow()
+    parquet_file = pyarrow.parquet.ParquetFile(source)
+    columns, schema = _schema_columns(parquet_file.schema_arrow)
+    batches = parquet_file.iter_batches(batch_size=chunksize or PARQUET_BATCH_ROWS, columns=columns)
+    return _arrow_frames(batches, schema, chunksize)
+
+
+def read_arrow(source, chunksize=None):
+    """Arrow IPC file (Feather v2), keeping only the SCHEMA columns"""
+    pyarrow = _pyarrow()
+    reader = pyarrow.ipc.open_file(source)
+    columns, schema = _schema_columns(reader.schema)
+    batches = (reader.get_batch(i).select(columns) for i in range(reader.num_record_batches))
+    if chunksize:
+        # The file keeps the writer's batch sizes; slice them to at most chunksize rows
+        batches = (
+            batch.slice(offset, chunksize) for batch in batches for offset in range(0, batch.num_rows, chunksize)
+        )
+    return _arrow_frames(batches, schema, chunksize)
+
+
+def read_xlsx(source, chunksize=None):
+    """First sheet of an XLSX workbook, streamed row by row in openpyxl's read-only mode"""
+    frames = _iter_xlsx(source, chunksize or XLSX_BATCH_ROWS)
+    if chunksize:
+        return frames
+    return pd.concat(list(frames))
+
+
+def _iter_xlsx(source, batch_rows):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+        keep = [(i, name) for i, name in enumerate(header) if name in SCHEMA]
+        names = [name for _, name in keep]
+
+        # Index rows by their position after the header, like read_csv,
+        # so row numbers in validation errors match the sheet
+        batch, batch_index = [], []
+        yielded = False
+        for position, row in enumerate(rows):
+            if all(value is None for value in row):
+                continue
+            batch.append([row[i] if i < len(row) else None for i, _ in keep])
+            batch_index.append(position)
+            if len(batch) >= batch_rows:
+                yield apply_schema(pd.DataFrame(batch, columns=names, index=batch_index))
+                yielded = True
+                batch, batch_index = [], []
+        if batch or not yielded:
+            yield apply_schema(pd.DataFrame(batch, columns=names, index=batch_index or None))
+    finally:
+        workbook.close()
+
+
+# Input format -> reader(source, chunksize=None). A reader returns a DataFrame
+# with the SCHEMA dtypes, or an iterator of them when chunksize is set.
+READERS = {
+    'csv': read_csv,
+    'parquet': read_parquet,
+    'arrow': read_arrow,
+    'feather': read_arrow,
+    'xlsx': read_xlsx,
+}
+
+
+# Optional packages a reader needs; formats whose package is missing are not offered
+READER_DEPENDENCIES = {
+    'parquet': 'pyarrow',
+    'arrow': 'pyarrow',
+    'feather': 'pyarrow',
+    'xlsx': 'openpyxl',
+}
+
+
+def register_reader(input_format, reader, requires=None):
+    """Add or replace the reader for an input format (a file extension without the dot)
+
+    requires: name of an optional package the reader imports, if any.
+    """
+    READERS[input_format] = reader
+    if requires:
+        READER_DEPENDENCIES[input_format] = requires
+    else:
+        READER_DEPENDENCIES.pop(input_format, None)
+
+
+def input_formats():
+    """Formats that can be read here: registered, with their optional package installed"""
+    return [name for name in READERS
+            if name not in READER_DEPENDENCIES or find_spec(READER_DEPENDENCIES[name]) is not None]
+
+
+def detect_format(source):
+    """Input format from a path's or upload's file extension; CSV if there is none"""
+    name = source if isinstance(source, (str, os.PathLike)) else getattr(source, 'name', '')
+    extension = os.path.splitext(str(name))[1].lower().lstrip('.')
+    return extension if extension in READERS else 'csv'
+
+
+def read_input(source, input_format=None, chunksize=None):
+    """Read a batch input with the reader for its format (detected from the name by default)"""
+    input_format = input_format or detect_format(source)
+    if input_format not in READERS:
+        raise ValueError(f"Unknown input format '{input_format}', expected one of: {', '.join(READERS)}")
+    return READERS[input_format](source, chunksize=chunksize)
@@ -0,0 +1,260 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from output_sinks import write_atomic
+from tax_rules import parse_cents
+
+# Where the app keeps its archive when INVOICE_ARCHIVE_DIR is not set
+DEFAULT_ARCHIVE_DIR = 'invoice_archive'
+INDEX_NAME = 'index.db'
+PDF_DIR = 'pdfs'
+# Index rows written per transaction while a batch adds invoices
+COMMIT_EVERY = 500
+# Rows search() returns unless asked for more
+DEFAULT_SEARCH_LIMIT = 100
+# invoice_date as invoice_data carries it, e.g. "January 15, 2024"
+INVOICE_DATE_FORMAT = '%B %d, %Y'
+
+SCHEMA = (
+    # One row per archived rendering; archiving the same PDF under the same number
+    # again (e.g. from a resumed batch) only moves it to the new batch
+    """CREATE TABLE IF NOT EXISTS invoices (
+        invoice_number TEXT NOT NULL,
+        client_name TEXT NOT NULL,
+        client_key TEXT NOT NULL,
+        client_email TEXT,
+        invoice_date TEXT NOT NULL,
+        currency TEXT NOT NULL,
+        total_cents INTEGER NOT NULL,
+        pdf_sha256 TEXT NOT NULL,
+        pdf_size INTEGER NOT NULL,
+        batch_id TEXT,
+        archived_at TEXT NOT NULL,
+        UNIQUE (invoice_number, pdf_sha256)
+    )""",
+    "CREATE INDEX IF NOT EXISTS invoices_client ON invoices (client_key, invoice_date)",
+    "CREATE INDEX IF NOT EXISTS invoices_date ON invoices (invoice_date)",
+    "CREATE INDEX IF NOT EXISTS invoices_total ON invoices (currency, total_cents)",
+    "CREATE INDEX IF NOT EXISTS invoices_batch ON invoices (batch_id)",
+    # Numbers found with more than one PDF as rows are committed, so audit() need not scan the index
+    """CREATE TABLE IF NOT EXISTS reissued (
+        invoice_number TEXT PRIMARY KEY,
+        detected_at TEXT NOT NULL
+    )""",
+)
+
+COLUMNS = ('invoice_number', 'client_name', 'client_email', 'invoice_date', 'currency', 'total_cents',
+           'pdf_sha256', 'pdf_size', 'batch_id', 'archived_at')
+
+
+def client_key(name):
+    """Client name as the index compares it: case-insensitive, surrounding spaces dropped"""
+    return str(name).strip().casefold()
+
+
+def iso_date(value):
+    """An invoice_data invoice_date as YYYY-MM-DD, so dates sort and compare; left as is if unparseable"""
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    try:
+        return datetime.strptime(str(value), INVOICE_DATE_FORMAT).strftime('%Y-%m-%d')
+    except ValueError:
+        return str(value)
+
+
+class InvoiceArchive:
+    """Every generated PDF, stored once by content hash, with a SQLite index to find it again.
+
+    PDFs are kept under directory/pdfs/<2 hex>/<sha256>.pdf, so identical
+    renders share one file. The index has a row per archived invoice with
+    its number, client, date, currency, total and PDF hash, indexed for
+    lookups by number, client name prefix, date range, currency and total
+    range and batch. A PDF's file is written before its row is committed,
+    so every row points at a complete file.
+
+    Rows from add() are committed COMMIT_EVERY at a time, or on flush();
+    searches from other threads see them once committed. A number archived
+    with a second, different PDF is kept, and listed by audit().
+    """
+
+    def __init__(self, directory=DEFAULT_ARCHIVE_DIR):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        os.makedirs(os.path.join(directory, PDF_DIR), exist_ok=True)
+        self._pending = []
+        self._lock = threading.Lock()
+        # sqlite3 connections belong to the thread that opened them
+        self._local = threading.local()
+        db = self._db()
+        # Readers keep working while a batch writes
+        db.execute("PRAGMA journal_mode=WAL")
+        with db:
+            for statement in SCHEMA:
+                db.execute(statement)
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.index_path, timeout=30)
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def pdf_path(self, digest):
+        return os.path.join(self.directory, PDF_DIR, digest[:2], f"{digest}.pdf")
+
+    def add(self, invoice_data, pdf_bytes, batch_id=None):
+        """Store an invoice's PDF and queue its index row; returns the PDF's hash"""
+        digest = hashlib.sha256(pdf_bytes).hexdigest()
+        path = self.pdf_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, pdf_bytes)
+
+        row = (
+            invoice_data['invoice_number'],
+            invoice_data['client_name'],
+            client_key(invoice_data['client_name']),
+            invoice_data.get('client_email'),
+            iso_date(invoice_data['invoice_date']),
+            invoice_data['currency'],
+            parse_cents(str(invoice_data['total'])),
+            digest,
+            len(pdf_bytes),
+            batch_id,
+            datetime.now().isoformat(timespec='seconds'),
+        )
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= COMMIT_EVERY:
+                self._flush()
+        return digest
+
+    def flush(self):
+        """Commit the index rows add() has queued"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        db = self._db()
+        with db:
+            db.executemany(
+                "INSERT INTO invoices (invoice_number, client_name, client_key, client_email, invoice_date,"
+                " currency, total_cents, pdf_sha256, pdf_size, batch_id, archived_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (invoice_number, pdf_sha256) DO UPDATE SET batch_id = excluded.batch_id",
+                self._pending
+            )
+            numbers = sorted({row[0] for row in self._pending})
+            db.execute(
+                f"INSERT OR IGNORE INTO reissued (invoice_number, detected_at)"
+                f" SELECT invoice_number, ? FROM invoices WHERE invoice_number IN ({', '.join('?' * len(numbers))})"
+                f" GROUP BY invoice_number HAVING COUNT(*) > 1",
+                [datetime.now().isoformat(timespec='seconds')] + numbers
+            )
+        self._pending = []
+
+    def _where(self, invoice_number=None, client=None, date_from=None, date_to=None, currency=None,
+               min_total=None, max_total=None, batch_id=None):
+        clauses, params = [], []
+        if invoice_number:
+            clauses.append("invoice_number = ?")
+            params.append(invoice_number)
+        if client:
+            # Prefix match as a range over the client index; LIKE would scan every row
+            key = client_key(client)
+            clauses.append("client_key >= ? AND client_key < ?")
+            params += [key, key + '\U0010ffff']
+        # A client prefix narrows far more than a date range; the unary + keeps
+        # SQLite from preferring the date index over the client one
+        date_column = "+invoice_date" if client else "invoice_date"
+        if date_from:
+            clauses.append(f"{date_column} >= ?")
+            params.append(iso_date(date_from))
+        if date_to:
+            clauses.append(f"{date_column} <= ?")
+            params.append(iso_date(date_to))
+        if currency:
+            clauses.append("currency = ?")
+            params.append(currency)
+        if min_total is not None:
+            clauses.append("total_cents >= ?")
+            params.append(min_total)
+        if max_total is not None:
+            clauses.append("total_cents <= ?")
+            params.append(max_total)
+        if batch_id:
+            clauses.append("batch_id = ?")
+            params.append(batch_id)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def search(self, limit=DEFAULT_SEARCH_LIMIT, offset=0, newest_first=True, **filters):
+        """Archived invoices matching every filter given, by date and number, as dicts of COLUMNS
+
+        Filters: invoice_number (exact), client (name prefix, any case),
+        date_from and date_to (dates or YYYY-MM-DD, inclusive), currency,
+        min_total and max_total (cents) and batch_id.
+        """
+        where, params = self._where(**filters)
+        order = "DESC" if newest_first else "ASC"
+        rows = self._db().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM invoices{where}"
+            f" ORDER BY invoice_date {order}, invoice_number {order} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        return self._db().execute(f"SELECT COUNT(*) FROM invoices{where}", params).fetchone()[0]
+
+    def totals(self, **filters):
+        """(currency, invoice count, total cents) per currency over the matching invoices"""
+        where, params = self._where(**filters)
+        return self._db().execute(
+            f"SELECT currency, COUNT(*), SUM(total_cents) FROM invoices{where} GROUP BY currency ORDER BY currency",
+            params
+        ).fetchall()
+
+    def get(self, invoice_number):
+        """The latest archived rendering of an invoice number, or None"""
+        rows = self._db().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM invoices WHERE invoice_number = ? ORDER BY rowid DESC LIMIT 1",
+            (invoice_number,)
+        ).fetchall()
+        return dict(zip(COLUMNS, rows[0])) if rows else None
+
+    def audit(self):
+        """Invoice numbers archived with more than one PDF, in number order
+
+        One dict per number: invoice_number, pdfs, clients (their names) and
+        reason, "issued to N clients" when the number went to different
+        clients, else "rendered N times" for one invoice rendered again.
+        """
+        rows = self._db().execute(
+            "SELECT reissued.invoice_number, COUNT(*), COUNT(DISTINCT client_key), GROUP_CONCAT(client_name, '\x1f')"
+            " FROM reissued JOIN invoices ON invoices.invoice_number = reissued.invoice_number"
+            " GROUP BY reissued.invoice_number ORDER BY reissued.invoice_number"
+        ).fetchall()
+        problems = []
+        for invoice_number, pdfs, client_count, names in rows:
+            clients = list(dict.fromkeys(names.split('\x1f')))
+            reason = f"issued to {client_count} clients" if client_count > 1 else f"rendered {pdfs} times"
+            problems.append({'invoice_number': invoice_number, 'pdfs': pdfs, 'clients': clients, 'reason': reason})
+        return problems
+
+    def read_pdf(self, digest):
+        """The archived PDF with this hash (an index row's pdf_sha256)"""
+        with open(self.pdf_path(digest), 'rb') as f:
+            return f.read()
+
+    def close(self):
+        self.flush()
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
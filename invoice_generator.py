@@ -1,74 +1,376 @@
+from reportlab import rl_config
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_RIGHT, TA_CENTER, TA_LEFT
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak, Flowable
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfmetrics import standardFonts
 from datetime import datetime, timedelta
+from bisect import bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
 from io import BytesIO
+from itertools import accumulate
+from PIL import Image as PILImage
+from templates import get_template
+from render_cache import render_key
+from canvas_renderer import CanvasInvoiceRenderer, _draw_logo, line_amount, tax_lines
+from metrics import METRICS
 import base64
+import hashlib
+import os
+import threading
+
+# Logo box on the invoice header, and the largest pixel size worth keeping for it (300 DPI)
+LOGO_WIDTH = 2 * inch
+LOGO_HEIGHT = 1 * inch
+LOGO_MAX_PIXELS = (int(LOGO_WIDTH / inch * 300), int(LOGO_HEIGHT / inch * 300))
+
+# Header, info and items table columns, and the items table's row heights:
+# bottom-aligned 12pt lines with 3pt padding above and below, or 12pt below
+# the header row
+HEADER_COL_WIDTHS = [4*inch, 2.5*inch]
+INFO_COL_WIDTHS = [2.2*inch, 2.2*inch, 2.1*inch]
+ITEM_COL_WIDTHS = [3.5*inch, 0.75*inch, 1.25*inch, 1*inch]
+ITEM_HEADER_HEIGHT = 27
+ITEM_LINE_HEIGHT = 12
+ITEM_ROW_PADDING = 6
+
+# invoice_data fields that are the same for every invoice of a batch
+COMPANY_FIELDS = ('company_name', 'company_address', 'company_email', 'company_phone')
+# Companies and logos whose header and company block a generator keeps
+FRAGMENT_CACHE_ENTRIES = 4
+
+# "platypus" lays out flowables; "canvas" draws the same page at fixed
+# coordinates and falls back to platypus for multi-page invoices
+ENGINES = ("platypus", "canvas")
+
+
+class LogoCache:
+    """Bounded LRU cache of decoded logos, keyed by content hash.
+    
+    Accepts a file path, raw bytes (e.g. from the Streamlit uploader) or a
+    binary file object. Each distinct image is decoded, and downscaled to the
+    size it is drawn at, only once.
+    """
+    
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self._images = OrderedDict()
+        self._path_digests = {}
+        self._lock = threading.Lock()
+    
+    def get(self, logo):
+        """Return a shared ImageReader for the logo"""
+        with self._lock:
+            digest, data = self._digest(logo)
+            reader = self._images.get(digest)
+            if reader is not None:
+                self._images.move_to_end(digest)
+                return reader
+            
+            if data is None:
+                with open(logo, 'rb') as f:
+                    data = f.read()
+            reader = self._decode(data)
+            self._images[digest] = reader
+            while len(self._images) > self.max_entries:
+                self._images.popitem(last=False)
+            return reader
+    
+    def digest(self, logo):
+        """Content hash of the logo, without decoding it"""
+        with self._lock:
+            return self._digest(logo)[0]
+    
+    def _digest(self, logo):
+        """Content hash of the logo, plus its bytes if they had to be read"""
+        if isinstance(logo, (bytes, bytearray, memoryview)):
+            data = bytes(logo)
+            return hashlib.sha256(data).hexdigest(), data
+        if hasattr(logo, 'read'):
+            data = logo.read()
+            return hashlib.sha256(data).hexdigest(), data
+        
+        # Files are only re-read when they change on disk
+        stat = os.stat(logo)
+        path_key = (os.path.abspath(logo), stat.st_mtime_ns, stat.st_size)
+        digest = self._path_digests.get(path_key)
+        if digest is None:
+            with open(logo, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            if len(self._path_digests) >= self.max_entries:
+                self._path_digests.clear()
+            self._path_digests[path_key] = digest
+            return digest, data
+        return digest, None
+    
+    def _decode(self, data):
+        image = PILImage.open(BytesIO(data))
+        image.load()
+        if image.width > LOGO_MAX_PIXELS[0] or image.height > LOGO_MAX_PIXELS[1]:
+            image.thumbnail(LOGO_MAX_PIXELS)
+        reader = ImageReader(image)
+        # Decode pixel data now so every invoice reuses it
+        reader.getRGBData()
+        return reader
+
+
+# Shared by every generator in the process
+LOGO_CACHE = LogoCache()
+
+# ReportLab reads rl_config.useA85 while it builds a document, so renders
+# with one setting wait for those with the other to finish. Renders with
+# the same setting, e.g. every render when compact output is not used,
+# run together as before.
+_DEFAULT_USE_A85 = rl_config.useA85
+_encoding_changed = threading.Condition()
+_encoding_users = 0
+
+
+@contextmanager
+def pdf_encoding(compact):
+    """Render with compact stream encoding (binary Flate, no ASCII85) or ReportLab's default"""
+    global _encoding_users
+    use_a85 = 0 if compact else _DEFAULT_USE_A85
+    with _encoding_changed:
+        while _encoding_users and rl_config.useA85 != use_a85:
+            _encoding_changed.wait()
+        rl_config.useA85 = use_a85
+        _encoding_users += 1
+    try:
+        yield
+    finally:
+        with _encoding_changed:
+            _encoding_users -= 1
+            if not _encoding_users:
+                rl_config.useA85 = _DEFAULT_USE_A85
+                _encoding_changed.notify_all()
+
+
+class CachedLogoImage(Image):
+    """Image flowable that draws a decoded ImageReader from the LogoCache
+    
+    The image is compressed once and its XObject reused by every document,
+    as the canvas engine draws it.
+    """
+    
+    def __init__(self, reader, width, height):
+        # Set before Image.__init__ so the placeholder source is never read
+        self._img = reader
+        super().__init__(BytesIO(), width=width, height=height)
+    
+    def draw(self):
+        _draw_logo(self.canv, self._img, getattr(self, '_offs_x', 0), getattr(self, '_offs_y', 0),
+                   self.drawWidth, self.drawHeight)
+
+
+class FixedParagraph(Paragraph):
+    """Paragraph that breaks its lines once per width and reuses them in every later layout"""
+    
+    _wrapped = None
+    
+    def wrap(self, availWidth, availHeight):
+        # Line breaks depend on the width alone; tables wrap cells again with
+        # a different height when they draw
+        if self._wrapped is None or self._wrapped[0] != availWidth:
+            self._wrapped = (availWidth, super().wrap(availWidth, availHeight))
+        return self._wrapped[1]
+
+
+class FixedTable(Table):
+    """Table that measures its rows and columns once per size and reuses them in every later layout"""
+    
+    _wrapped = None
+    
+    def wrap(self, availWidth, availHeight):
+        if self._wrapped is None or self._wrapped[0] != (availWidth, availHeight):
+            self._wrapped = ((availWidth, availHeight), super().wrap(availWidth, availHeight))
+        self.availWidth = availWidth
+        return self._wrapped[1]
+
+
+class InvoiceBookmark(Flowable):
+    """Zero-size flowable that bookmarks the page an invoice starts on.
+
+    Records that page number in entry['first_page'] when drawn.
+    """
+    
+    def __init__(self, key, title, entry):
+        super().__init__()
+        self.key = key
+        self.title = title
+        self.entry = entry
+    
+    def wrap(self, availWidth, availHeight):
+        return 0, 0
+    
+    def draw(self):
+        self.canv.bookmarkPage(self.key)
+        self.canv.addOutlineEntry(self.title, self.key, level=0)
+        self.entry['first_page'] = self.canv.getPageNumber()
+
+
+class ItemsTable(Flowable):
+    """Line items and totals, split into one Table per page.
+    
+    Splitting looks up how many rows fit with a bisect over precomputed row
+    heights and builds a Table for that page alone, so layout time grows
+    linearly with the number of items. Every page repeats the header row;
+    pages after the first open with the subtotal brought forward, pages
+    before the last close with the subtotal carried forward, and the totals
+    rows appear only on the last page.
+    """
+    
+    def __init__(self, rows, amounts, totals, template, currency, start=0, _layout=None):
+        super().__init__()
+        self.rows = rows
+        self.totals = totals
+        self.template = template
+        self.currency = currency
+        self.start = start
+        self.hAlign = 'CENTER'
+        if _layout is None:
+            heights = [ITEM_LINE_HEIGHT * max(str(cell).count('\n') + 1 for cell in row) + ITEM_ROW_PADDING
+                       for row in rows]
+            # offsets[i]: height of rows[:i]; running[i]: subtotal of rows[:i]
+            _layout = (list(accumulate(heights, initial=0)), list(accumulate(amounts, initial=0.0)))
+        self._layout = _layout
+    
+    def _subtotal_row(self, label, index):
+        return ['', '', label, f"{self.currency} {self._layout[1][index]:.2f}"]
+    
+    def _fixed_height(self):
+        # Header, plus the brought-forward row after the first page
+        return ITEM_HEADER_HEIGHT + (ITEM_LINE_HEIGHT + ITEM_ROW_PADDING if self.start else 0)
+    
+    def wrap(self, availWidth, availHeight):
+        offsets = self._layout[0]
+        totals_height = len(self.totals) * (ITEM_LINE_HEIGHT + ITEM_ROW_PADDING)
+        self.width = sum(ITEM_COL_WIDTHS)
+        self.height = self._fixed_height() + offsets[-1] - offsets[self.start] + totals_height
+        return self.width, self.height
+    
+    def split(self, availWidth, availHeight):
+        offsets = self._layout[0]
+        budget = availHeight - self._fixed_height() - (ITEM_LINE_HEIGHT + ITEM_ROW_PADDING)
+        end = bisect_right(offsets, offsets[self.start] + budget) - 1
+        if end >= len(self.rows):
+            # The rows fit but the totals do not: keep at least one row for the last page
+            end = len(self.rows) - 1
+        if end <= self.start:
+            return []
+        rest = ItemsTable(self.rows, None, self.totals, self.template, self.currency, end, self._layout)
+        return [self._table(end, last=False), rest]
+    
+    def draw(self):
+        table = self._table(len(self.rows), last=True)
+        table.wrap(self.width, self.height)
+        table.drawOn(self.canv, 0, 0)
+    
+    def _table(self, end, last):
+        data = [['Description', 'Qty', 'Rate', 'Amount']]
+        if self.start:
+            data.append(self._subtotal_row('Brought forward:', self.start))
+        data.extend(self.rows[self.start:end])
+        grid_end = len(data) - 1
+        data.extend(self.totals if last else [self._subtotal_row('Carried forward:', end)])
+        
+        table = Table(data, colWidths=ITEM_COL_WIDTHS)
+        table.setStyle(TableStyle([
+            *self.template.items_table_head,
+            ('GRID', (0, 0), (-1, grid_end), 0.5, colors.grey),
+            *(self.template.items_table_totals if last else ()),
+        ]))
+        return table
+
+
+class _LazyStory(list):
+    """Flowable list for doc.build that pulls the next batch of flowables
+    from an iterator whenever the layout loop has used up the current ones"""
+    
+    def __init__(self, chunks):
+        super().__init__()
+        self._chunks = chunks
+    
+    def __len__(self):
+        if not super().__len__():
+            self.extend(next(self._chunks, ()))
+        return super().__len__()
+
 
 class InvoiceGenerator:
-    def __init__(self, style_template="modern_minimal"):
-        self.style = self.get_style_template(style_template)
-        self.styles = getSampleStyleSheet()
-        self.setup_custom_styles()
+    def __init__(self, style_template="modern_minimal", logo_cache=None, render_cache=None, metrics=None,
+                 engine="platypus", compact=False, cache_fragments=True):
+        """render_cache: optional RenderCache that returns earlier PDFs for identical inputs
+        
+        metrics: Metrics that receive the build_flowables and doc_build stage
+        timings; defaults to the process-wide METRICS.
+        
+        engine: one of ENGINES. "canvas" is several times faster and renders
+        a visually identical page whenever the invoice fits on one.
+        
+        compact: write page and image streams as binary Flate data instead
+        of ASCII85 text, about a tenth smaller. Only templates in the
+        standard PDF fonts, which are never embedded, can be compact.
+        
+        cache_fragments: build the header table and company block once per
+        company and logo, and reuse them, already laid out, in every invoice
+        of a batch. The output is the same either way. A generator renders
+        one invoice at a time, so the shared flowables are never in two
+        layouts at once.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of: {', '.join(ENGINES)}")
+        self.logo_cache = logo_cache or LOGO_CACHE
+        self.render_cache = render_cache
+        self.metrics = metrics or METRICS
+        self.engine = engine
+        self.template = get_template(style_template)
+        self.style = self.template.style
+        self.styles = self.template.styles
+        if compact and self.style['font'] not in standardFonts:
+            raise ValueError(f"Compact output needs a standard PDF font; '{style_template}' uses {self.style['font']}")
+        self.compact = compact
+        self._fragments = OrderedDict() if cache_fragments else None
+        self.canvas_renderer = CanvasInvoiceRenderer(self.template) if engine == "canvas" else None
     
     def get_style_template(self, template_name):
-        templates = {
-            "modern_minimal": {
-                "primary_color": colors.HexColor("#000000"),
-                "secondary_color": colors.HexColor("#666666"),
-                "accent_color": colors.HexColor("#000000"),
-                "bg_color": colors.HexColor("#F8F9FA"),
-                "font": "Helvetica",
-                "header_size": 24,
-                "body_size": 10
-            },
-            "corporate_blue": {
-                "primary_color": colors.HexColor("#003366"),
-                "secondary_color": colors.HexColor("#5588BB"),
-                "accent_color": colors.HexColor("#003366"),
-                "bg_color": colors.HexColor("#E6F2FF"),
-                "font": "Helvetica-Bold",
-                "header_size": 26,
-                "body_size": 11
-            },
-            "creative_gradient": {
-                "primary_color": colors.HexColor("#FF6B6B"),
-                "secondary_color": colors.HexColor("#4ECDC4"),
-                "accent_color": colors.HexColor("#FFE66D"),
-                "bg_color": colors.HexColor("#FFFFFF"),
-                "font": "Helvetica",
-                "header_size": 28,
-                "body_size": 10
-            }
-        }
-        return templates.get(template_name, templates["modern_minimal"])
-    
-    def setup_custom_styles(self):
-        # Custom styles based on selected template
-        self.styles.add(ParagraphStyle(
-            name='CustomTitle',
-            parent=self.styles['Heading1'],
-            fontSize=self.style['header_size'],
-            textColor=self.style['primary_color'],
-            fontName=self.style['font'],
-            alignment=TA_LEFT
-        ))
-        
-        self.styles.add(ParagraphStyle(
-            name='InvoiceHeader',
-            parent=self.styles['Normal'],
-            fontSize=self.style['header_size'] + 8,
-            textColor=self.style['primary_color'],
-            fontName=self.style['font'],
-            alignment=TA_RIGHT,
-            bold=True
-        ))
+        return get_template(template_name).style
         
     def generate_invoice(self, invoice_data, logo_path=None):
+        """Render invoice_data to a PDF; logo_path may be a file path or the logo's bytes"""
+        if hasattr(logo_path, 'read'):
+            logo_path = logo_path.read()
+        
+        cache_key = None
+        if self.render_cache is not None:
+            logo_digest = self.logo_cache.digest(logo_path) if logo_path else None
+            cache_key = render_key(invoice_data, self.template, logo_digest, self.engine, self.compact)
+            cached = self.render_cache.get(cache_key)
+            if cached is not None:
+                self.metrics.count('render_cache_hits')
+                return BytesIO(cached)
+        
+        with pdf_encoding(self.compact):
+            pdf_bytes = self._render(invoice_data, logo_path)
+        if cache_key is not None:
+            self.render_cache.put(cache_key, pdf_bytes)
+        return BytesIO(pdf_bytes)
+    
+    def _render(self, invoice_data, logo_path):
+        if self.canvas_renderer is not None:
+            with self.metrics.stage('canvas_render'):
+                logo_reader = self.logo_cache.get(logo_path) if logo_path else None
+                pdf_bytes = self.canvas_renderer.render(invoice_data, logo_reader)
+            if pdf_bytes is not None:
+                return pdf_bytes
+            self.metrics.count('canvas_fallbacks')
+        
         buffer = BytesIO()
+        # invariant output (fixed timestamps and document ID) makes identical
+        # inputs produce identical bytes, so cached renders match fresh ones
         doc = SimpleDocTemplate(
             buffer,
             pagesize=letter,
@@ -76,40 +378,144 @@ class InvoiceGenerator:
             leftMargin=72,
             topMargin=72,
             bottomMargin=18,
+            invariant=1,
         )
         
-        # Container for the 'Flowable' objects
-        elements = []
+        with self.metrics.stage('build_flowables'):
+            elements = self.build_story(invoice_data, logo_path)
+        
+        # Build PDF
+        with self.metrics.stage('doc_build'):
+            doc.build(elements)
+        return buffer.getvalue()
+    
+    def generate_merged(self, invoices, output, logo_path=None):
+        """Render many invoices into one PDF, each starting on a new page
+        
+        invoices: iterable of invoice_data dicts, consumed lazily as the
+        document is laid out. output: file path or binary file-like object;
+        ReportLab writes the finished document to it in one pass at the end.
+        Fonts and the logo image are stored once and shared by every page.
+        
+        Returns the page index: one dict per invoice with its invoice_number,
+        client, first_page and last_page (1-based), in document order. Each
+        invoice also gets a bookmark in the PDF outline.
+        """
+        if hasattr(logo_path, 'read'):
+            logo_path = logo_path.read()
+        
+        index = []
+        last_page = [0]
+        
+        def count_page(canv, doc):
+            last_page[0] = doc.page
+        
+        def first_page(canv, doc):
+            canv.showOutline()
+            count_page(canv, doc)
+        
+        def story():
+            for n, invoice_data in enumerate(invoices):
+                entry = {
+                    'invoice_number': invoice_data['invoice_number'],
+                    'client': invoice_data['client_name'],
+                }
+                index.append(entry)
+                title = f"{invoice_data['invoice_number']} - {invoice_data['client_name']}"
+                with self.metrics.stage('build_flowables'):
+                    flowables = self._page_flowables(invoice_data, logo_path)
+                chunk = [PageBreak()] if n else []
+                chunk.append(InvoiceBookmark(f"invoice{n}", title, entry))
+                yield chunk + flowables
+        
+        doc = SimpleDocTemplate(
+            output,
+            pagesize=letter,
+            rightMargin=72,
+            leftMargin=72,
+            topMargin=72,
+            bottomMargin=18,
+            invariant=1,
+        )
+        with self.metrics.stage('doc_build'), pdf_encoding(self.compact):
+            doc.build(_LazyStory(story()), onFirstPage=first_page, onLaterPages=count_page)
+        
+        for entry, following in zip(index, index[1:]):
+            entry['last_page'] = following['first_page'] - 1
+        if index:
+            index[-1]['last_page'] = last_page[0]
+        return index
+    
+    def _page_flowables(self, invoice_data, logo_path=None):
+        """Flowables for one invoice in a shared document, from the canvas engine when it can"""
+        if self.canvas_renderer is not None:
+            logo_reader = self.logo_cache.get(logo_path) if logo_path else None
+            page = self.canvas_renderer.flowable(invoice_data, logo_reader)
+            if page is not None:
+                return [page]
+            self.metrics.count('canvas_fallbacks')
+        return self.build_story(invoice_data, logo_path)
+    
+    def _fixed_fragments(self, invoice_data, logo_path=None):
+        """The header table and company block, which only depend on the company and logo
+        
+        Returns (header_table, company_paragraph). With cache_fragments they
+        come from the generator's cache, built for the first invoice of a
+        batch and shared by the rest.
+        """
+        logo_reader = self.logo_cache.get(logo_path) if logo_path else None
+        key = (logo_reader, invoice_data['company_name'],
+               *(invoice_data.get(field, '') for field in COMPANY_FIELDS[1:]))
+        if self._fragments is not None:
+            fragments = self._fragments.get(key)
+            if fragments is not None:
+                self._fragments.move_to_end(key)
+                return fragments
+        
+        # Reused fragments keep their layout from one invoice to the next
+        if self._fragments is not None:
+            paragraph_class, table_class = FixedParagraph, FixedTable
+        else:
+            paragraph_class, table_class = Paragraph, Table
         
         # Add Logo and Header
         header_data = []
-        if logo_path:
+        if logo_reader is not None:
             # Add logo
-            img = Image(logo_path, width=2*inch, height=1*inch)
-            header_data.append([img, Paragraph("INVOICE", self.styles['InvoiceHeader'])])
+            img = CachedLogoImage(logo_reader, width=LOGO_WIDTH, height=LOGO_HEIGHT)
+            header_data.append([img, paragraph_class("INVOICE", self.styles['InvoiceHeader'])])
         else:
             header_data.append([
-                Paragraph(invoice_data['company_name'], self.styles['CustomTitle']),
-                Paragraph("INVOICE", self.styles['InvoiceHeader'])
+                paragraph_class(invoice_data['company_name'], self.styles['CustomTitle']),
+                paragraph_class("INVOICE", self.styles['InvoiceHeader'])
             ])
         
-        header_table = Table(header_data, colWidths=[4*inch, 2.5*inch])
-        header_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ]))
-        elements.append(header_table)
-        elements.append(Spacer(1, 20))
+        header_table = table_class(header_data, colWidths=HEADER_COL_WIDTHS)
+        header_table.setStyle(self.template.header_table_style)
         
-        # Company and Client Info
+        # Company Info
         company_info = f"""
         {invoice_data['company_name']}<br/>
         {invoice_data.get('company_address', '')}<br/>
         {invoice_data.get('company_email', '')}<br/>
         {invoice_data.get('company_phone', '')}
         """
+        fragments = (header_table, paragraph_class(company_info, self.styles['Normal']))
+        
+        if self._fragments is not None:
+            self._fragments[key] = fragments
+            while len(self._fragments) > FRAGMENT_CACHE_ENTRIES:
+                self._fragments.popitem(last=False)
+        return fragments
+    
+    def build_story(self, invoice_data, logo_path=None):
+        """Build the platypus flowables for one invoice"""
+        header_table, company_paragraph = self._fixed_fragments(invoice_data, logo_path)
+        
+        # Container for the 'Flowable' objects
+        elements = [header_table, Spacer(1, 20)]
         
+        # Client Info
         client_info = f"""
         <b>Bill To:</b><br/>
         {invoice_data['client_name']}<br/>
@@ -125,26 +531,23 @@ class InvoiceGenerator:
         """
         
         info_data = [
-            [Paragraph(company_info, self.styles['Normal']), 
+            [company_paragraph,
              Paragraph(client_info, self.styles['Normal']),
              Paragraph(invoice_meta, self.styles['Normal'])]
         ]
         
-        info_table = Table(info_data, colWidths=[2.2*inch, 2.2*inch, 2.1*inch])
-        info_table.setStyle(TableStyle([
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('LINEBELOW', (0, 0), (-1, 0), 1, self.style['accent_color']),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ]))
+        info_table = Table(info_data, colWidths=INFO_COL_WIDTHS)
+        info_table.setStyle(self.template.info_table_style)
         elements.append(info_table)
         elements.append(Spacer(1, 30))
         
         # Line Items
-        line_items = [['Description', 'Qty', 'Rate', 'Amount']]
+        line_items = []
+        amounts = []
         
         for item in invoice_data['items']:
-            amount = float(item['quantity']) * float(item['rate'])
+            amount = line_amount(item)
+            amounts.append(amount)
             line_items.append([
                 item['description'],
                 str(item['quantity']),
@@ -153,32 +556,12 @@ class InvoiceGenerator:
             ])
         
         # Add subtotal, tax, total
-        line_items.append(['', '', 'Subtotal:', f"{invoice_data['currency']} {invoice_data['subtotal']}"])
-        if invoice_data.get('tax_rate'):
-            line_items.append(['', '', f"Tax ({invoice_data['tax_rate']}%):", f"{invoice_data['currency']} {invoice_data['tax_amount']}"])
-        line_items.append(['', '', 'Total:', f"{invoice_data['currency']} {invoice_data['total']}"])
-        
-        items_table = Table(line_items, colWidths=[3.5*inch, 0.75*inch, 1.25*inch, 1*inch])
-        items_table.setStyle(TableStyle([
-            # Header row
-            ('BACKGROUND', (0, 0), (-1, 0), self.style['primary_color']),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, 0), self.style['font']),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            
-            # Data rows
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('GRID', (0, 0), (-1, len(line_items)-4), 0.5, colors.grey),
-            
-            # Total row
-            ('LINEABOVE', (2, -1), (-1, -1), 2, self.style['primary_color']),
-            ('FONTNAME', (2, -1), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (2, -1), (-1, -1), 11),
-        ]))
-        elements.append(items_table)
+        totals = [['', '', 'Subtotal:', f"{invoice_data['currency']} {invoice_data['subtotal']}"]]
+        for tax_rate, tax_amount in tax_lines(invoice_data):
+            totals.append(['', '', f"Tax ({tax_rate}%):", f"{invoice_data['currency']} {tax_amount}"])
+        totals.append(['', '', 'Total:', f"{invoice_data['currency']} {invoice_data['total']}"])
+        
+        elements.append(ItemsTable(line_items, amounts, totals, self.template, invoice_data['currency']))
         elements.append(Spacer(1, 30))
         
         # Notes/Terms
@@ -186,7 +569,4 @@ class InvoiceGenerator:
             notes = Paragraph(f"<b>Notes:</b><br/>{invoice_data['notes']}", self.styles['Normal'])
             elements.append(notes)
         
-        # Build PDF
-        doc.build(elements)
-        buffer.seek(0)
-        return buffer
\ No newline at end of file
+        return elements
\ No newline at end of file
@@ -0,0 +1,117 @@
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from output_sinks import remove_output
+
+# Finished jobs kept for download before the oldest are dropped
+DEFAULT_KEEP_FINISHED = 20
+
+
+class BatchJob:
+    """One submitted process_batch run and, once finished, its output"""
+
+    def __init__(self, job_id, processor):
+        self.id = job_id
+        self.processor = processor
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.future = None
+        self.output = None
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def status(self):
+        """The processor's job_state() plus the job id and timestamps"""
+        state = self.processor.job_state()
+        if state['state'] == "idle":
+            state['state'] = "queued"
+        state.update({'id': self.id, 'submitted_at': self.submitted_at, 'finished_at': self.finished_at})
+        return state
+
+
+class JobManager:
+    """Runs BatchInvoiceProcessor batches in a background thread pool.
+
+    Usage:
+        job_id = manager.submit(processor, df, company_data, logo_bytes)
+        manager.status(job_id)   # {'state': 'running', 'done': 12, 'total': 40, ...}
+        manager.cancel(job_id)
+        buffer = manager.result(job_id)
+
+    max_workers batches run at once and later ones queue. Each processor
+    still uses its own render processes when created with workers > 1.
+    Finished jobs keep their output until more than keep_finished jobs
+    have finished after them. An output written to a path (process_batch's
+    output=) is deleted when its job is dropped.
+    """
+
+    def __init__(self, max_workers=1, keep_finished=DEFAULT_KEEP_FINISHED):
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch-job')
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, processor, *args, **kwargs):
+        """Queue processor.process_batch(*args, **kwargs); returns the job id"""
+        with self._lock:
+            job = BatchJob(f"job-{next(self._ids)}", processor)
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, args, kwargs)
+        return job.id
+
+    def _run(self, job, args, kwargs):
+        try:
+            job.output, _ = job.processor.process_batch(*args, **kwargs)
+        finally:
+            job.finished_at = time.time()
+            self._prune()
+
+    def _prune(self):
+        with self._lock:
+            finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.finished_at)
+            for job in finished[:max(0, len(finished) - self.keep_finished)]:
+                del self._jobs[job.id]
+                if isinstance(job.output, (str, os.PathLike)):
+                    remove_output(job.output)
+
+    def get(self, job_id):
+        """The BatchJob for job_id, or None if unknown or already dropped"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id):
+        job = self.get(job_id)
+        return job.status() if job is not None else None
+
+    def result(self, job_id):
+        """Output of a completed job (a buffer, or the path it was written to), or None"""
+        job = self.get(job_id)
+        return job.output if job is not None else None
+
+    def cancel(self, job_id):
+        """Ask a queued or running job to stop; returns False for unknown or finished jobs"""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.processor.cancel()
+        return True
+
+    def jobs(self):
+        """Status of every known job, newest first"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.status() for job in reversed(jobs)]
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if not job.finished:
+                job.processor.cancel()
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _NullTimer:
+    """Shared no-op context returned by stage() when metrics are disabled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Per-stage duration histograms and event counters.
+
+    Usage:
+        with metrics.stage('doc_build'):
+            doc.build(elements)
+        metrics.count('invoices')
+
+    When disabled, stage() returns a shared no-op context and count() returns
+    immediately, so the hooks can stay in hot paths.
+    """
+
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._stages = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, name)
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = {
+                    'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * len(self.buckets)
+                }
+            stage['count'] += 1
+            stage['sum'] += seconds
+            stage['max'] = max(stage['max'], seconds)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    stage['buckets'][i] += 1
+                    break
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self._counters = {}
+
+    def snapshot(self):
+        """JSON-serialisable copy of all stages and counters; bucket counts are cumulative"""
+        with self._lock:
+            stages = {}
+            for name, stage in self._stages.items():
+                cumulative, running = [], 0
+                for n in stage['buckets']:
+                    running += n
+                    cumulative.append(running)
+                stages[name] = {
+                    'count': stage['count'],
+                    'sum': stage['sum'],
+                    'max': stage['max'],
+                    'buckets': dict(zip((str(b) for b in self.buckets), cumulative)),
+                }
+            return {'stages': stages, 'counters': dict(self._counters)}
+
+    def drain(self):
+        """Snapshot and reset, e.g. to ship a worker process's metrics to its parent"""
+        snapshot = self.snapshot()
+        self.reset()
+        return snapshot
+
+    def merge(self, snapshot):
+        """Add another Metrics snapshot (with the same buckets) into this one"""
+        if not self.enabled:
+            return
+        with self._lock:
+            for name, other in snapshot['stages'].items():
+                stage = self._stages.get(name)
+                if stage is None:
+                    stage = self._stages[name] = {
+                        'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * len(self.buckets)
+                    }
+                stage['count'] += other['count']
+                stage['sum'] += other['sum']
+                stage['max'] = max(stage['max'], other['max'])
+                previous = 0
+                for i, cumulative in enumerate(other['buckets'].values()):
+                    stage['buckets'][i] += cumulative - previous
+                    previous = cumulative
+            for name, n in snapshot['counters'].items():
+                self._counters[name] = self._counters.get(name, 0) + n
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix='invoice'):
+        """Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent per processing stage",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        for name, stage in sorted(snapshot['stages'].items()):
+            for bound, cumulative in stage['buckets'].items():
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {stage["count"]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stage["sum"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+        lines.append(f"# HELP {prefix}_events_total Processing events")
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, n in sorted(snapshot['counters'].items()):
+            lines.append(f'{prefix}_events_total{{event="{name}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide metrics; enable with INVOICE_METRICS=1
+METRICS = Metrics(enabled=os.environ.get('INVOICE_METRICS', '0') not in ('', '0', 'false'))
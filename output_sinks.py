@@ -0,0 +1,204 @@
+import gzip
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from abc import ABC, abstractmethod
+from io import BytesIO
+
+# Bytes per read when a finished output is served or copied
+CHUNK_BYTES = 1024 * 1024
+
+
+def write_atomic(path, data, mode=None, mtime=None):
+    """Write data to path through a temporary file in the same directory, then rename it
+
+    Readers see the old file or the complete new one, never a partial write.
+    mode and mtime (a timestamp) are set on the file before it is renamed.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        if mtime is not None:
+            os.utime(tmp_path, (mtime, mtime))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class OutputSink(ABC):
+    """Where a batch's PDFs go as they are rendered, one add() per invoice.
+
+    target is None for an in-memory result, a path, or a binary file object.
+    A sink holds at most the member being written; close() finishes the
+    output and returns the result: the BytesIO (rewound), the path, or the
+    file object. abort() drops a partial output written to a path.
+    Subclasses implement add(); a sink without it cannot be created.
+    """
+
+    extension = None
+    content_type = 'application/octet-stream'
+    # Members may be stored or deflated one by one (see add's compress_type)
+    compressible = False
+
+    def __init__(self, target=None):
+        self.target = target
+        if target is None:
+            self._file = BytesIO()
+        elif isinstance(target, (str, os.PathLike)):
+            self._file = open(target, 'wb')
+        else:
+            self._file = target
+
+    @abstractmethod
+    def add(self, name, data, date_time, compress_type=None):
+        """Write one member dated date_time (a datetime); returns the bytes it takes in the output"""
+
+    def _finish(self):
+        pass
+
+    def close(self):
+        self._finish()
+        if self.target is None:
+            self._file.seek(0)
+            return self._file
+        if isinstance(self.target, (str, os.PathLike)):
+            self._file.close()
+        return self.target
+
+    def abort(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+        if isinstance(self.target, (str, os.PathLike)):
+            self._file.close()
+            if os.path.exists(self.target):
+                os.remove(self.target)
+
+
+class ZipSink(OutputSink):
+    """ZIP archive with one member per PDF, in memory or in a file"""
+
+    extension = 'zip'
+    content_type = 'application/zip'
+    compressible = True
+
+    def __init__(self, target=None):
+        super().__init__(target)
+        self._zip = zipfile.ZipFile(self._file, 'w', zipfile.ZIP_DEFLATED)
+
+    def add(self, name, data, date_time, compress_type=zipfile.ZIP_DEFLATED):
+        # Dated like the batch, not the wall clock, so re-runs give identical archives
+        member = zipfile.ZipInfo(name, date_time.timetuple()[:6])
+        member.external_attr = 0o600 << 16
+        self._zip.writestr(member, data, compress_type=compress_type)
+        return member.compress_size
+
+    def _finish(self):
+        self._zip.close()
+
+
+class TarSink(OutputSink):
+    """Tar archive, optionally gzipped as a whole, in memory or in a file"""
+
+    extension = 'tar'
+    content_type = 'application/x-tar'
+
+    def __init__(self, target=None, compress=False):
+        super().__init__(target)
+        # gzip's header holds a timestamp; a fixed one keeps archives reproducible
+        self._gzip = gzip.GzipFile(fileobj=self._file, mode='wb', mtime=0) if compress else None
+        self._tar = tarfile.open(fileobj=self._gzip or self._file, mode='w', format=tarfile.PAX_FORMAT)
+        if compress:
+            self.extension = 'tar.gz'
+            self.content_type = 'application/gzip'
+
+    def add(self, name, data, date_time, compress_type=None):
+        member = tarfile.TarInfo(name)
+        member.size = len(data)
+        member.mtime = time.mktime(date_time.timetuple())
+        member.mode = 0o600
+        self._tar.addfile(member, BytesIO(data))
+        # Header block plus data padded to whole blocks
+        return tarfile.BLOCKSIZE + -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+    def _finish(self):
+        self._tar.close()
+        if self._gzip is not None:
+            self._gzip.close()
+
+
+class DirectorySink(OutputSink):
+    """One PDF file per invoice in a directory, created if needed; target is its path"""
+
+    def __init__(self, target):
+        if not isinstance(target, (str, os.PathLike)):
+            raise ValueError("Directory output needs a directory path")
+        self.target = target
+        os.makedirs(target, exist_ok=True)
+
+    def add(self, name, data, date_time, compress_type=None):
+        # Written under a temporary name first, so the directory only ever holds complete PDFs
+        write_atomic(os.path.join(self.target, name), data, mode=0o600, mtime=time.mktime(date_time.timetuple()))
+        return len(data)
+
+    def close(self):
+        return self.target
+
+    def abort(self):
+        # Finished PDFs stay: each is complete, and a rerun overwrites them
+        pass
+
+
+# Output mode -> sink class, called as sink_class(target)
+SINKS = {
+    'zip': ZipSink,
+    'tar': TarSink,
+    'directory': DirectorySink,
+}
+
+
+def register_sink(output_mode, sink_class):
+    """Add or replace the sink for an output mode"""
+    SINKS[output_mode] = sink_class
+
+
+def sink_modes():
+    return list(SINKS)
+
+
+def make_sink(output_mode, target=None):
+    if output_mode not in SINKS:
+        raise ValueError(f"Unknown output mode '{output_mode}', expected one of: {', '.join(SINKS)}")
+    return SINKS[output_mode](target)
+
+
+def iter_chunks(path, chunk_bytes=CHUNK_BYTES):
+    """Yield a finished output file's bytes a chunk at a time"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                return
+            yield chunk
+
+
+def open_output(path):
+    """A finished output file opened for reading, for a download to read when it is clicked"""
+    return open(path, 'rb')
+
+
+def remove_output(path):
+    """Delete a finished output file or directory"""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
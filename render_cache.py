@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from output_sinks import write_atomic
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def render_key(invoice_data, template, logo_digest=None, engine="platypus", compact=False):
+    """Canonical hash of everything that affects a rendered invoice.
+
+    template is a CompiledTemplate; its style values are hashed along with
+    the name so re-registering a template invalidates earlier renders. The
+    engine and compact encoding are included because each writes different
+    PDF bytes.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(invoice_data, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8'))
+    h.update(b'\0' + template.name.encode('utf-8'))
+    h.update(b'\0' + repr(sorted(template.style.items())).encode('utf-8'))
+    h.update(b'\0' + (logo_digest or '').encode('ascii'))
+    h.update(b'\0' + engine.encode('ascii'))
+    if compact:
+        # Only added when set, so keys of default renders stay the same
+        h.update(b'\0compact')
+    return h.hexdigest()
+
+
+class RenderCache:
+    """Content-addressed cache of rendered PDFs.
+
+    The memory tier holds up to max_bytes of PDFs and evicts the least
+    recently used ones. With disk_dir set, every PDF is also written there
+    and survives evictions and restarts. Pickling a cache (e.g. to hand it to
+    worker processes) keeps its settings and disk tier but not the memory tier.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def __getstate__(self):
+        return {'max_bytes': self.max_bytes, 'disk_dir': self.disk_dir}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def get(self, key):
+        """Return the cached PDF bytes for key, or None"""
+        with self._lock:
+            pdf_bytes = self._entries.get(key)
+            if pdf_bytes is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pdf_bytes
+
+        pdf_bytes = self._read_disk(key)
+        with self._lock:
+            if pdf_bytes is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, pdf_bytes)
+        return pdf_bytes
+
+    def put(self, key, pdf_bytes):
+        with self._lock:
+            self._store(key, pdf_bytes)
+        self._write_disk(key, pdf_bytes)
+
+    def _store(self, key, pdf_bytes):
+        if len(pdf_bytes) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = pdf_bytes
+        self._size += len(pdf_bytes)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.pdf")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key, pdf_bytes):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so concurrent readers never see a partial file
+        write_atomic(path, pdf_bytes)
@@ -0,0 +1,239 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# Where the app keeps its sequence when INVOICE_SEQUENCE_DB is not set
+DEFAULT_SEQUENCE_DB = 'invoice_sequence.db'
+DEFAULT_PREFIX = 'INV'
+# Numbers reserved at a time for invoices numbered one by one
+DEFAULT_BLOCK_SIZE = 20
+# Seconds to wait for another process's reservation to commit
+LOCK_TIMEOUT = 30
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS sequences (
+        series TEXT PRIMARY KEY,
+        next_number INTEGER NOT NULL
+    )""",
+    # used is NULL until the block is released
+    """CREATE TABLE IF NOT EXISTS blocks (
+        series TEXT NOT NULL,
+        first INTEGER NOT NULL,
+        last INTEGER NOT NULL,
+        used INTEGER,
+        owner TEXT,
+        reserved_at TEXT NOT NULL,
+        released_at TEXT,
+        PRIMARY KEY (series, first)
+    )""",
+)
+
+
+def invoice_series(invoice_date, prefix=DEFAULT_PREFIX):
+    """Series an invoice dated invoice_date is numbered in, e.g. 'INV-20240115'"""
+    return f"{prefix}-{invoice_date.strftime('%Y%m%d')}"
+
+
+def format_number(series, number):
+    """'INV-20240115-007' from series 'INV-20240115' and number 7"""
+    return f"{series}-{number:03d}"
+
+
+class InvoiceSequencer:
+    """Invoice numbers from a SQLite file, unique across threads, processes and app sessions.
+
+    Each series (one per day by default) counts up from 1. Numbers are
+    reserved in blocks, one short write transaction per block, and handed
+    out from the block without touching the database. Every block records
+    how many of its numbers were used once it is released, so audit() can
+    list each number that was reserved but never issued.
+    """
+
+    def __init__(self, path=DEFAULT_SEQUENCE_DB, block_size=DEFAULT_BLOCK_SIZE, owner=None):
+        self.path = path
+        self.block_size = block_size
+        self.owner = owner or f"pid {os.getpid()}"
+        # series -> [first, next, last] of the block next_number hands out from
+        self._blocks = {}
+        self._lock = threading.Lock()
+        with self._transaction() as db:
+            for statement in SCHEMA:
+                db.execute(statement)
+
+    @contextmanager
+    def _transaction(self):
+        db = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT, isolation_level=None)
+        try:
+            # Takes the write lock up front, so two reservations never read the same next_number
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def reserve(self, series, count):
+        """Reserve count consecutive numbers in series; returns (first, last)"""
+        if count < 1:
+            raise ValueError("A block needs at least one number")
+        with self._transaction() as db:
+            row = db.execute("SELECT next_number FROM sequences WHERE series = ?", (series,)).fetchone()
+            first = row[0] if row else 1
+            last = first + count - 1
+            db.execute(
+                "INSERT INTO sequences (series, next_number) VALUES (?, ?) "
+                "ON CONFLICT (series) DO UPDATE SET next_number = excluded.next_number",
+                (series, last + 1)
+            )
+            db.execute(
+                "INSERT INTO blocks (series, first, last, owner, reserved_at) VALUES (?, ?, ?, ?, ?)",
+                (series, first, last, self.owner, datetime.now().isoformat(timespec='seconds'))
+            )
+        return first, last
+
+    def release(self, series, first, used, give_back=True):
+        """Record that the first used numbers of the block starting at first were issued
+
+        With give_back, unused numbers at the end of the series' newest block
+        are returned, so the next reservation continues without a gap.
+        """
+        with self._transaction() as db:
+            row = db.execute("SELECT last FROM blocks WHERE series = ? AND first = ?", (series, first)).fetchone()
+            if row is None:
+                raise ValueError(f"No block starting at {first} in series '{series}'")
+            last = row[0]
+            if not 0 <= used <= last - first + 1:
+                raise ValueError(f"Block {first}-{last} has no {used} numbers to use")
+            next_number = db.execute("SELECT next_number FROM sequences WHERE series = ?", (series,)).fetchone()[0]
+            if give_back and next_number == last + 1:
+                last = first + used - 1
+                db.execute("UPDATE sequences SET next_number = ? WHERE series = ?", (last + 1, series))
+                if not used:
+                    db.execute("DELETE FROM blocks WHERE series = ? AND first = ?", (series, first))
+                    return
+            db.execute(
+                "UPDATE blocks SET last = ?, used = ?, released_at = ? WHERE series = ? AND first = ?",
+                (last, used, datetime.now().isoformat(timespec='seconds'), series, first)
+            )
+
+    def next_number(self, series):
+        """The next unused number in series, from this sequencer's current block"""
+        with self._lock:
+            block = self._blocks.get(series)
+            if block is None or block[1] > block[2]:
+                if block is not None:
+                    self.release(series, block[0], block[2] - block[0] + 1)
+                first, last = self.reserve(series, self.block_size)
+                block = self._blocks[series] = [first, first, last]
+            number = block[1]
+            block[1] += 1
+            return number
+
+    def next_invoice_number(self, invoice_date, prefix=DEFAULT_PREFIX):
+        """The next invoice number for invoice_date, e.g. 'INV-20240115-008'"""
+        series = invoice_series(invoice_date, prefix)
+        return format_number(series, self.next_number(series))
+
+    def peek(self, series):
+        """The number next_number would return, without taking it; another session may take it first"""
+        with self._lock:
+            block = self._blocks.get(series)
+            if block is not None and block[1] <= block[2]:
+                return block[1]
+        db = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+        try:
+            row = db.execute("SELECT next_number FROM sequences WHERE series = ?", (series,)).fetchone()
+        finally:
+            db.close()
+        return row[0] if row else 1
+
+    def close(self):
+        """Release the blocks next_number hands out from, returning their unused numbers where possible"""
+        with self._lock:
+            for series, (first, next_number, _) in self._blocks.items():
+                self.release(series, first, next_number - first)
+            self._blocks.clear()
+
+    def audit(self, series=None):
+        """Numbers that were reserved but never issued, oldest first
+
+        One dict per run of missing numbers: series, first, last and reason,
+        "unused" for the rest of a released block, "not released" for a
+        block whose owner never reported back (it may have stopped part
+        way), or "never reserved" for numbers no block covers. Blocks this
+        sequencer is still handing out from are not gaps.
+        """
+        with self._lock:
+            open_blocks = {(block_series, block[0]) for block_series, block in self._blocks.items()}
+        db = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+        try:
+            query = "SELECT series, first, last, used, owner FROM blocks"
+            params = ()
+            if series is not None:
+                query += " WHERE series = ?"
+                params = (series,)
+            rows = db.execute(query + " ORDER BY series, first", params).fetchall()
+        finally:
+            db.close()
+
+        gaps = []
+        expected = {}
+        for block_series, first, last, used, owner in rows:
+            start = expected.get(block_series, 1)
+            if first > start:
+                gaps.append({'series': block_series, 'first': start, 'last': first - 1, 'reason': "never reserved"})
+            expected[block_series] = last + 1
+            if (block_series, first) in open_blocks:
+                continue
+            if used is None:
+                gaps.append({'series': block_series, 'first': first, 'last': last,
+                             'reason': f"not released ({owner})"})
+            elif first + used <= last:
+                gaps.append({'series': block_series, 'first': first + used, 'last': last, 'reason': "unused"})
+        return gaps
+
+
+class NumberBlocks:
+    """Invoice numbers for one batch, reserved from a sequencer a block at a time as they are taken
+
+    reserved: (first, last) blocks an earlier run of the batch reserved,
+    used again before any new block. on_reserve(first, last) is called for
+    each new block, e.g. to note it in a checkpoint.
+    """
+
+    def __init__(self, sequencer, series, reserved=(), on_reserve=None):
+        self.sequencer = sequencer
+        self.series = series
+        self.blocks = [tuple(block) for block in reserved]
+        self._on_reserve = on_reserve
+        self._taken = 0
+
+    def take(self, remaining=None):
+        """The next number; remaining (if known) sizes a new block to the rest of the batch"""
+        index = self._taken
+        for first, last in self.blocks:
+            if index <= last - first:
+                self._taken += 1
+                return format_number(self.series, first + index)
+            index -= last - first + 1
+        first, last = self.sequencer.reserve(self.series, remaining or self.sequencer.block_size)
+        self.blocks.append((first, last))
+        if self._on_reserve is not None:
+            self._on_reserve(first, last)
+        self._taken += 1
+        return format_number(self.series, first)
+
+    def release(self, used, give_back=True):
+        """Release every block, counting the first used numbers taken as issued"""
+        counts = []
+        for first, last in self.blocks:
+            counts.append(min(used, last - first + 1))
+            used -= counts[-1]
+        # Newest first, so that unused blocks at the end go back before the one before them
+        for (first, _), count in reversed(list(zip(self.blocks, counts))):
+            self.sequencer.release(self.series, first, count, give_back)
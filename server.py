@@ -0,0 +1,298 @@
+"""HTTP service that renders invoices for other systems.
+
+Usage:
+    python server.py --port 8080 --workers 4 --company company.json --logo logo.png
+    python server.py --sequence-db invoice_sequence.db
+
+Endpoints:
+    POST /invoice?template=corporate_blue&engine=canvas&compact=1
+        body: invoice_data JSON, as passed to InvoiceGenerator.generate_invoice
+        returns application/pdf; compact=1 writes binary streams, a tenth smaller
+    POST /batch?template=corporate_blue&output=zip&format=csv
+        body: batch file (format csv, xlsx, parquet or arrow; default csv);
+        output=pdf returns one merged PDF instead of a ZIP, output=tar a tar
+        archive; compact=1 as for /invoice, and ZIP members that would not
+        shrink are stored. With --sequence-db, batch invoice numbers come
+        from that SQLite sequence, shared with the app and the CLI
+    GET /health
+        returns JSON with the pool size and requests in flight
+
+Renders run in a pool of --workers processes that load reportlab, the
+templates and the logo once at startup. Up to --queue-size more requests
+wait for a free worker; beyond that the server answers 503 with Retry-After.
+Connections are kept alive between requests (HTTP/1.1). Batch output is
+written to a temporary file by the worker and streamed from there, so a
+large batch is never held in memory whole.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+from batch_processor import WARMUP_INVOICE, BatchInvoiceProcessor
+from cli import COMPANY_FIELDS
+from input_readers import input_formats
+from invoice_generator import ENGINES, InvoiceGenerator
+from metrics import METRICS
+from output_sinks import iter_chunks, remove_output
+from sequencer import InvoiceSequencer
+from templates import DEFAULT_TEMPLATE, template_names
+
+DEFAULT_QUEUE_SIZE = 16
+DEFAULT_MAX_BODY_BYTES = 64 * 1024 * 1024
+# Seconds an idle keep-alive connection stays open
+KEEP_ALIVE_TIMEOUT = 30
+RETRY_AFTER_SECONDS = 1
+
+# Batch outputs a response can carry; a directory cannot be sent
+CONTENT_TYPES = {'pdf': 'application/pdf', 'zip': 'application/zip', 'tar': 'application/x-tar'}
+
+# Per-process state, set up once by _init_server_worker
+_worker_logo = None
+
+
+def _init_server_worker(logo_bytes):
+    """Render one invoice with every template and engine so imports, fonts and the logo are loaded"""
+    global _worker_logo
+    _worker_logo = logo_bytes
+    for template in template_names():
+        for engine in ENGINES:
+            InvoiceGenerator(template, engine=engine).generate_invoice(WARMUP_INVOICE, logo_bytes)
+
+
+def _render_invoice(invoice_data, template, engine, compact=False):
+    generator = InvoiceGenerator(template, engine=engine, compact=compact)
+    return generator.generate_invoice(invoice_data, _worker_logo).getvalue()
+
+
+def _render_batch(input_bytes, input_format, company_data, template, engine, output_mode, compact=False,
+                  sequence_db=None):
+    """Returns (path, message); path is a temporary file for the caller to remove, None if the batch failed"""
+    sequencer = InvoiceSequencer(sequence_db) if sequence_db else None
+    processor = BatchInvoiceProcessor(template, engine=engine, compact=compact, sequencer=sequencer)
+    fd, path = tempfile.mkstemp(prefix='invoices_batch_', suffix=f'.{output_mode}')
+    os.close(fd)
+    try:
+        result, message = processor.process_batch(
+            BytesIO(input_bytes), company_data, _worker_logo, output_mode=output_mode, output=path,
+            input_format=input_format
+        )
+    except BaseException:
+        remove_output(path)
+        raise
+    if result is None:
+        remove_output(path)
+        return None, message
+    return path, message
+
+
+class RequestError(Exception):
+    """A request the server refuses; carries the HTTP status to answer with"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class InvoiceServer(ThreadingHTTPServer):
+    """Threaded HTTP server in front of a pre-warmed render process pool"""
+
+    daemon_threads = True
+
+    def __init__(self, address, workers=1, queue_size=DEFAULT_QUEUE_SIZE, company_data=None, logo_bytes=None,
+                 max_body_bytes=DEFAULT_MAX_BODY_BYTES, sequence_db=None):
+        super().__init__(address, InvoiceRequestHandler)
+        self.workers = workers
+        self.capacity = workers + queue_size
+        company_data = company_data or {}
+        self.company_data = {field: company_data.get(field, '') for field in COMPANY_FIELDS}
+        self.max_body_bytes = max_body_bytes
+        self.sequence_db = sequence_db
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_server_worker, initargs=(logo_bytes,)
+        )
+        # Admission control: renders in progress plus requests waiting for a worker
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.warm_up()
+
+    def warm_up(self):
+        """Start every worker process now rather than on the first requests"""
+        futures = [self.executor.submit(int) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def run(self, fn, *args):
+        """Run fn(*args) in the pool, or raise RequestError(503) if the queue is full"""
+        if not self._slots.acquire(blocking=False):
+            METRICS.count('http_rejected')
+            raise RequestError(503, "Server busy, retry later")
+        with self._lock:
+            self._in_flight += 1
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def health(self):
+        with self._lock:
+            in_flight = self._in_flight
+        return {
+            'workers': self.workers,
+            'capacity': self.capacity,
+            'in_flight': in_flight,
+            'queued': max(0, in_flight - self.workers),
+        }
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+class InvoiceRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEP_ALIVE_TIMEOUT
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/health':
+            self._send(200, 'application/json', json.dumps(self.server.health()).encode('utf-8'))
+        else:
+            self._send_error(404, f"No such endpoint: {path}")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            body = self._read_body()
+            template = query.get('template', DEFAULT_TEMPLATE)
+            engine = query.get('engine', 'platypus')
+            if engine not in ENGINES:
+                raise RequestError(400, f"Unknown engine '{engine}', expected one of: {', '.join(ENGINES)}")
+            compact = query.get('compact', '0') not in ('', '0', 'false')
+
+            if url.path == '/invoice':
+                pdf_bytes = self.server.run(_render_invoice, self._parse_invoice(body), template, engine, compact)
+                self._send(200, CONTENT_TYPES['pdf'], pdf_bytes)
+            elif url.path == '/batch':
+                output_mode = query.get('output', 'zip')
+                if output_mode not in CONTENT_TYPES:
+                    raise RequestError(400, f"Unknown output '{output_mode}', expected one of: {', '.join(CONTENT_TYPES)}")
+                input_format = query.get('format', 'csv')
+                if input_format not in input_formats():
+                    raise RequestError(400, f"Unknown format '{input_format}', expected one of: {', '.join(input_formats())}")
+                path, message = self.server.run(
+                    _render_batch, body, input_format, self.server.company_data, template, engine, output_mode, compact,
+                    self.server.sequence_db
+                )
+                if path is None:
+                    raise RequestError(400, message)
+                try:
+                    self._send_file(200, CONTENT_TYPES[output_mode], path, {'X-Batch-Message': message})
+                finally:
+                    remove_output(path)
+            else:
+                raise RequestError(404, f"No such endpoint: {url.path}")
+        except RequestError as e:
+            self._send_error(e.status, str(e))
+        except KeyError as e:
+            self._send_error(400, f"Invoice data is missing {e}")
+        except Exception as e:
+            self._send_error(500, f"Error rendering invoice: {e}")
+
+    def _read_body(self):
+        length = self.headers.get('Content-Length')
+        if length is None or not length.isdigit():
+            self.close_connection = True
+            raise RequestError(411, "Content-Length required")
+        length = int(length)
+        if length > self.server.max_body_bytes:
+            # The unread body would be taken for the next request
+            self.close_connection = True
+            raise RequestError(413, f"Body larger than {self.server.max_body_bytes} bytes")
+        return self.rfile.read(length)
+
+    @staticmethod
+    def _parse_invoice(body):
+        try:
+            invoice_data = json.loads(body)
+        except ValueError as e:
+            raise RequestError(400, f"Invalid JSON: {e}")
+        if not isinstance(invoice_data, dict):
+            raise RequestError(400, "Invoice data must be a JSON object")
+        return invoice_data
+
+    def _send(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self, status, content_type, path, headers=None):
+        """Like _send, with the body streamed from a file a chunk at a time"""
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        for chunk in iter_chunks(path):
+            self.wfile.write(chunk)
+
+    def _send_error(self, status, message):
+        headers = {'Retry-After': str(RETRY_AFTER_SECONDS)} if status == 503 else None
+        self._send(status, 'application/json', json.dumps({'error': message}).encode('utf-8'), headers)
+
+    def log_message(self, format, *args):
+        # Access logging would dominate small requests; errors are in the responses
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=1, help="render processes")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="requests that may wait for a worker before new ones get 503")
+    parser.add_argument('--company', help="JSON file with the company details used for batches")
+    parser.add_argument('--logo', help="logo image used on every invoice")
+    parser.add_argument('--sequence-db', help="SQLite file batch invoice numbers are taken from")
+    args = parser.parse_args(argv)
+
+    company_data = None
+    if args.company:
+        with open(args.company) as f:
+            company_data = json.load(f)
+    logo_bytes = None
+    if args.logo:
+        with open(args.logo, 'rb') as f:
+            logo_bytes = f.read()
+
+    server = InvoiceServer(
+        (args.host, args.port), args.workers, args.queue_size, company_data, logo_bytes, sequence_db=args.sequence_db
+    )
+    print(f"Serving on http://{args.host}:{server.server_port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import json
+import numpy as np
+import pandas as pd
+
+# Rates are kept as integers so money never goes through float rounding:
+# tax rates in millionths (8.5% is 85000), FX rates in millionths of the
+# reporting currency per unit of the invoice currency.
+RATE_SCALE = 1_000_000
+FX_SCALE = 1_000_000
+
+# Category used for items without a tax_category
+STANDARD_CATEGORY = 'standard'
+
+# Rate lookups return this where no rule applies
+NO_RATE = -1
+
+
+def to_cents(amounts):
+    """Money amounts as int64 cents, rounded half up"""
+    # The inner round drops float noise, e.g. 1.005 * 100 == 100.49999999999999
+    cents = np.round(np.asarray(amounts, dtype='float64') * 100, 6)
+    return np.floor(cents + 0.5).astype('int64')
+
+
+def format_cents(cents):
+    """'1234.50' from 123450"""
+    sign = '-' if cents < 0 else ''
+    whole, part = divmod(abs(int(cents)), 100)
+    return f"{sign}{whole}.{part:02d}"
+
+
+def parse_cents(text):
+    """123450 from '1234.50'"""
+    whole, _, part = text.strip().partition('.')
+    cents = abs(int(whole or 0)) * 100 + int((part + '00')[:2])
+    return -cents if text.strip().startswith('-') else cents
+
+
+def rate_units(percent):
+    """Tax rates in percent as RATE_SCALE units"""
+    return np.round(np.asarray(percent, dtype='float64') * (RATE_SCALE // 100)).astype('int64')
+
+
+def rate_percent(units):
+    return int(units) / (RATE_SCALE // 100)
+
+
+def scale_cents(cents, units, scale):
+    """cents × units / scale, rounded half up, without overflowing int64"""
+    whole, part = np.divmod(cents, scale)
+    return whole * units + (part * units + scale // 2) // scale
+
+
+def tax_totals(codes, line_cents, line_rates, groups):
+    """Subtotal, tax and tax breakdown per group from per-line amounts and rates
+
+    codes: each line's group number, 0 to groups - 1. Tax is rounded once per
+    group and rate, on the sum of that rate's lines. Returns (subtotal, tax,
+    taxes): int64 cents per group, and per group a list of (rate units, tax
+    cents) for each nonzero rate, lowest rate first.
+    """
+    codes = np.asarray(codes, dtype='int64')
+    line_cents = np.asarray(line_cents, dtype='int64')
+    line_rates = np.asarray(line_rates, dtype='int64')
+
+    # One bucket per (group, rate) pair present in the lines
+    # (hashed rather than sorted: a batch has far fewer pairs than lines)
+    rate_index, rates = pd.factorize(line_rates, sort=True)
+    pair_index, pairs = pd.factorize(codes * len(rates) + rate_index, sort=True)
+    pair_cents = np.zeros(len(pairs), dtype='int64')
+    np.add.at(pair_cents, pair_index, line_cents)
+    pair_groups = pairs // len(rates)
+    pair_rates = rates[pairs % len(rates)]
+    pair_tax = scale_cents(pair_cents, pair_rates, RATE_SCALE)
+
+    subtotal = np.zeros(groups, dtype='int64')
+    np.add.at(subtotal, pair_groups, pair_cents)
+    tax = np.zeros(groups, dtype='int64')
+    np.add.at(tax, pair_groups, pair_tax)
+
+    taxes = [[] for _ in range(groups)]
+    for group, rate, amount in zip(pair_groups.tolist(), pair_rates.tolist(), pair_tax.tolist()):
+        if rate:
+            taxes[group].append((rate, amount))
+    return subtotal, tax, taxes
+
+
+def invoice_totals(items, tax_rates):
+    """Totals fields of one invoice's data from its items and each item's tax rate in percent
+
+    Returns subtotal, tax_rate, tax_amount and total as batch invoices have
+    them, plus taxes when the items have more than one nonzero rate.
+    """
+    amounts = [float(item['quantity']) * float(item['rate']) for item in items]
+    subtotal, tax, taxes = tax_totals(np.zeros(len(items)), to_cents(amounts), rate_units(tax_rates), 1)
+    return totals_fields(subtotal[0], tax[0], taxes[0])
+
+
+def totals_fields(subtotal, tax, taxes):
+    """invoice_data totals fields from cents and a (rate units, tax cents) breakdown"""
+    fields = {
+        'subtotal': format_cents(subtotal),
+        'tax_rate': rate_percent(taxes[0][0]) if len(taxes) == 1 else (None if taxes else 0.0),
+        'tax_amount': format_cents(tax),
+        'total': format_cents(subtotal + tax),
+    }
+    if len(taxes) > 1:
+        fields['taxes'] = [{'rate': rate_percent(rate), 'amount': format_cents(amount)} for rate, amount in taxes]
+    return fields
+
+
+def _positions(index, values, missing=-1):
+    """Position of each value in index; -1 if absent, missing if the value is missing
+
+    Looks up each distinct value once; a batch repeats a few jurisdictions,
+    categories and currencies over many lines.
+    """
+    if not isinstance(values, pd.Series):
+        values = pd.Series(values, dtype=object)
+    codes, uniques = pd.factorize(values)
+    positions = index.get_indexer(uniques)[codes]
+    positions[codes < 0] = missing
+    return positions
+
+
+class TaxRules:
+    """Tax rates per jurisdiction and item category, and FX rates to a reporting currency
+
+    tax_rates: {jurisdiction: {category: percent}}. Items without a category
+    use their jurisdiction's STANDARD_CATEGORY rate, as do categories that
+    jurisdiction has no rate for when it has a standard one.
+    fx_rates: {currency: units of reporting_currency per unit of currency}.
+
+    The tables are compiled once into a rate matrix and FX vector with
+    index lookups, so rating a batch is a few array operations however
+    many lines it has.
+    """
+
+    def __init__(self, tax_rates=None, fx_rates=None, reporting_currency=None):
+        tax_rates = tax_rates or {}
+        fx_rates = fx_rates or {}
+        if fx_rates and not reporting_currency:
+            raise ValueError("FX rates need a reporting currency")
+        self.reporting_currency = reporting_currency
+
+        self._jurisdictions = pd.Index(sorted(tax_rates), dtype=object)
+        categories = {category for rates in tax_rates.values() for category in rates} | {STANDARD_CATEGORY}
+        self._categories = pd.Index(sorted(categories), dtype=object)
+        matrix = np.full((len(self._jurisdictions), len(self._categories)), NO_RATE, dtype='int64')
+        for jurisdiction, rates in tax_rates.items():
+            row = self._jurisdictions.get_loc(jurisdiction)
+            for category, percent in rates.items():
+                matrix[row, self._categories.get_loc(category)] = rate_units(percent)
+        standard = matrix[:, self._categories.get_loc(STANDARD_CATEGORY)]
+        self._rates = np.where(matrix == NO_RATE, standard[:, None], matrix)
+
+        fx_rates = dict(fx_rates)
+        if reporting_currency:
+            fx_rates[reporting_currency] = 1
+        self._currencies = pd.Index(list(fx_rates), dtype=object)
+        self._fx = np.round(np.array(list(fx_rates.values()), dtype='float64') * FX_SCALE).astype('int64')
+
+    @classmethod
+    def from_json(cls, source):
+        """Rules from a JSON file path, file object or string:
+        {"reporting_currency": "USD", "tax": {"DE": {"standard": 19, "reduced": 7}}, "fx": {"EUR": 1.08}}
+        """
+        if hasattr(source, 'read'):
+            spec = json.load(source)
+        elif isinstance(source, str) and source.lstrip().startswith('{'):
+            spec = json.loads(source)
+        else:
+            with open(source) as f:
+                spec = json.load(f)
+        return cls(spec.get('tax'), spec.get('fx'), spec.get('reporting_currency'))
+
+    def jurisdictions(self):
+        return list(self._jurisdictions)
+
+    def categories(self):
+        return list(self._categories)
+
+    def line_rates(self, jurisdictions, categories=None):
+        """Tax rate units per line; NO_RATE where the jurisdiction is missing or unknown,
+        or the jurisdiction has no rate for the category"""
+        rows = _positions(self._jurisdictions, jurisdictions)
+        if categories is None:
+            columns = np.full(len(rows), self._categories.get_loc(STANDARD_CATEGORY))
+        else:
+            columns = _positions(self._categories, categories, missing=self._categories.get_loc(STANDARD_CATEGORY))
+        known = (rows >= 0) & (columns >= 0)
+        rates = np.full(len(rows), NO_RATE, dtype='int64')
+        rates[known] = self._rates[rows[known], columns[known]]
+        return rates
+
+    def item_rates(self, jurisdiction, categories, default=0.0):
+        """Tax rates in percent for one invoice's items in a jurisdiction; default where no rule applies"""
+        units = self.line_rates([jurisdiction] * len(categories), categories)
+        return [rate_percent(rate) if rate != NO_RATE else default for rate in units.tolist()]
+
+    def to_reporting(self, cents, currencies):
+        """Amounts in cents of each currency converted to cents of the reporting currency
+
+        Unknown currencies come back as NO_RATE.
+        """
+        index = _positions(self._currencies, currencies)
+        known = index >= 0
+        converted = np.full(len(index), NO_RATE, dtype='int64')
+        converted[known] = scale_cents(np.asarray(cents, dtype='int64')[known], self._fx[index[known]], FX_SCALE)
+        return converted
+
+    def problems(self, df):
+        """Rows these rules cannot rate, as (mask, column, reason, values) problems for input_readers.validate_rows"""
+        problems = []
+        if 'jurisdiction' in df.columns and len(self._jurisdictions):
+            jurisdiction = df['jurisdiction']
+            categories = df['tax_category'] if 'tax_category' in df.columns else None
+            rated = self.line_rates(jurisdiction, categories) != NO_RATE
+            unknown = jurisdiction.notna() & ~jurisdiction.isin(self._jurisdictions)
+            problems.append((unknown.to_numpy(), 'jurisdiction', "unknown jurisdiction", jurisdiction))
+            if categories is not None:
+                unrated = (jurisdiction.notna() & ~unknown).to_numpy() & ~rated
+                problems.append((unrated, 'tax_category', "no tax rate for category", categories))
+        if self.reporting_currency and 'currency' in df.columns:
+            currency = df['currency']
+            no_fx = (currency.notna() & ~currency.isin(self._currencies)).to_numpy()
+            problems.append((no_fx, 'currency', f"no FX rate to {self.reporting_currency} for currency", currency))
+        return problems
@@ -0,0 +1,156 @@
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_RIGHT, TA_LEFT
+from reportlab.platypus import TableStyle
+from collections import namedtuple
+from types import MappingProxyType
+import threading
+
+DEFAULT_TEMPLATE = "modern_minimal"
+
+TEMPLATE_KEYS = (
+    "primary_color", "secondary_color", "accent_color", "bg_color",
+    "font", "header_size", "body_size"
+)
+
+# Raw template definitions; compiled into styles on first use
+TEMPLATES = {
+    "modern_minimal": {
+        "primary_color": colors.HexColor("#000000"),
+        "secondary_color": colors.HexColor("#666666"),
+        "accent_color": colors.HexColor("#000000"),
+        "bg_color": colors.HexColor("#F8F9FA"),
+        "font": "Helvetica",
+        "header_size": 24,
+        "body_size": 10
+    },
+    "corporate_blue": {
+        "primary_color": colors.HexColor("#003366"),
+        "secondary_color": colors.HexColor("#5588BB"),
+        "accent_color": colors.HexColor("#003366"),
+        "bg_color": colors.HexColor("#E6F2FF"),
+        "font": "Helvetica-Bold",
+        "header_size": 26,
+        "body_size": 11
+    },
+    "creative_gradient": {
+        "primary_color": colors.HexColor("#FF6B6B"),
+        "secondary_color": colors.HexColor("#4ECDC4"),
+        "accent_color": colors.HexColor("#FFE66D"),
+        "bg_color": colors.HexColor("#FFFFFF"),
+        "font": "Helvetica",
+        "header_size": 28,
+        "body_size": 10
+    }
+}
+
+# Everything an InvoiceGenerator needs from a template, built once per process.
+# items_table_head and items_table_totals go before and after the GRID command,
+# whose row range depends on the number of line items.
+CompiledTemplate = namedtuple("CompiledTemplate", [
+    "name", "style", "styles", "header_table_style", "info_table_style",
+    "items_table_head", "items_table_totals"
+])
+
+_compiled = {}
+_lock = threading.Lock()
+
+
+def register_template(name, spec):
+    """Add or replace a template at runtime; it is compiled on first use"""
+    missing = [key for key in TEMPLATE_KEYS if key not in spec]
+    if missing:
+        raise ValueError(f"Template '{name}' is missing: {', '.join(missing)}")
+    with _lock:
+        TEMPLATES[name] = dict(spec)
+        _compiled.pop(name, None)
+
+
+def template_names():
+    return list(TEMPLATES)
+
+
+def get_template(name):
+    """Return the compiled template, falling back to the default for unknown names.
+
+    Compiled templates are shared by every generator in the process and must
+    not be modified.
+    """
+    if name not in TEMPLATES:
+        name = DEFAULT_TEMPLATE
+    compiled = _compiled.get(name)
+    if compiled is None:
+        with _lock:
+            compiled = _compiled.get(name)
+            if compiled is None:
+                compiled = _compiled[name] = _compile(name, TEMPLATES[name])
+    return compiled
+
+
+def _compile(name, spec):
+    style = MappingProxyType(dict(spec))
+
+    # Custom styles based on selected template
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(
+        name='CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=style['header_size'],
+        textColor=style['primary_color'],
+        fontName=style['font'],
+        alignment=TA_LEFT
+    ))
+
+    styles.add(ParagraphStyle(
+        name='InvoiceHeader',
+        parent=styles['Normal'],
+        fontSize=style['header_size'] + 8,
+        textColor=style['primary_color'],
+        fontName=style['font'],
+        alignment=TA_RIGHT,
+        bold=True
+    ))
+
+    header_table_style = TableStyle([
+        ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+        ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ])
+
+    info_table_style = TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LINEBELOW', (0, 0), (-1, 0), 1, style['accent_color']),
+        ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+    ])
+
+    items_table_head = (
+        # Header row
+        ('BACKGROUND', (0, 0), (-1, 0), style['primary_color']),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (0, 0), (-1, 0), style['font']),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+
+        # Data rows
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+    )
+
+    items_table_totals = (
+        # Total row
+        ('LINEABOVE', (2, -1), (-1, -1), 2, style['primary_color']),
+        ('FONTNAME', (2, -1), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (2, -1), (-1, -1), 11),
+    )
+
+    return CompiledTemplate(
+        name=name,
+        style=style,
+        styles=MappingProxyType(dict(styles.byName)),
+        header_table_style=header_table_style,
+        info_table_style=info_table_style,
+        items_table_head=items_table_head,
+        items_table_totals=items_table_totals,
+    )